@@ -1,24 +1,70 @@
-import socket
+import functools
+import logging
+import operator
+import sys
 import threading
-import time
+
+import event_trace
+import journal
+import membership
+import wire
+from delay_scheduler import DelayScheduler
+from differential import DeltaDecoder, DeltaEncoder
+from membership import Membership
+from metrics import Metrics
+from pending_buffer import PendingBuffer
+from transport import ConnectionPool, FrameListener
+
+logger = logging.getLogger(__name__)
 
 class Process:
-    def __init__(self, process_id, total_processes, port, ports):
+    def __init__(self, process_id, total_processes, port, ports, delay_model=None, differential=False, on_deliver=None,
+                 members=None):
         self.process_id = process_id
-        self.total_processes = total_processes
+        # Interned process IDs of the group (see membership.py): pclock[i]
+        # belongs to process members.members[i]. A joining process starts
+        # from a copy of a member's view; otherwise the group is 0 .. n - 1.
+        self.members = members if members is not None else Membership(range(total_processes))
+        self.total_processes = len(self.members)
+        self.slot = self.members.slot(process_id)
         self.port = port
         self.ports = ports
-        self.pclock = [0] * total_processes  # Only store vector clock now
-        self.buffer = []
+        self.pclock = [0] * self.total_processes  # Only store vector clock now
+        self.buffer = PendingBuffer()
         self.channel_delay = self.init_channel_delay()
+        # Optional model(source, target) -> seconds; overrides channel_delay
+        self.delay_model = delay_model
+        # Differential mode sends only changed clock entries, which needs FIFO links
+        self.differential = differential
+        self.delta_encoder = DeltaEncoder(self.total_processes) if differential else None
+        self.delta_decoder = DeltaDecoder(self.total_processes)
+        # Differential links whose last frame may have been lost; their next
+        # frame carries the full clock
+        self.resync = set()
+        self.scheduler = DelayScheduler(fifo=differential)
+        self.pool = ConnectionPool()
+        # Optional callable(sender_id, clock) invoked for every delivered message
+        self.on_deliver = on_deliver
+        self.metrics = Metrics()
+        # Optional event_trace.TraceWriter recording this process's events
+        self.tracer = None
+        # Optional journal.Journal logging clock changes for crash recovery
+        self.journal = None
+        # Optional flow_control.CreditLedger counting held messages per sender
+        self.flow = None
+        # Guards pclock and the buffer: received messages are applied on the
+        # receiving thread while broadcasts are stamped on the caller's
+        self.lock = threading.RLock()
+        # Messages stamped in an epoch this process has not reached yet
+        self.early = []
     
     def init_channel_delay(self):
         delay = 2
         channel_delay = [0] * self.total_processes
-        for ch in range(self.process_id + 1, self.total_processes):
+        for ch in range(self.slot + 1, self.total_processes):
             channel_delay[ch] = delay
             delay += 2
-        print(f"Channel Delays: {channel_delay}")
+        logger.info("Channel Delays: %s", channel_delay)
         return channel_delay
     
     def start_server(self):
@@ -26,57 +72,335 @@ class Process:
         server_thread.start()
     
     def receive_messages(self):
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.bind(("127.0.0.1", self.port))
-        server_socket.listen(100)
-        print(f"Process {self.process_id} listening on port {self.port}")
-        
-        while True:
-            client_socket, addr = server_socket.accept()
-            data = client_socket.recv(1024)
-            if data:
-                received_data = eval(data.decode())
-                received_clock = received_data['clock']
-                sender_id = received_data['sender']
-                print(f"Received Message from Process-{sender_id} with Clock {received_clock}")
-                self.handle_delivery(received_clock, sender_id)
-            client_socket.close()
+        logger.info("Process %s listening on port %s", self.process_id, self.port)
+        FrameListener(self.port, self.handle_frame).serve_forever()
     
-    def handle_delivery(self, received_clock, sender_id):
-        if self.pclock[sender_id] == received_clock[sender_id] - 1:
-            can_deliver = all(
-                self.pclock[i] >= received_clock[i] for i in range(self.total_processes) if i != sender_id
-            )
-            
-            if can_deliver:
-                print(f"Delivered Message from Process-{sender_id} with Clock: {received_clock}")
-                for i in range(self.total_processes):
-                    self.pclock[i] = max(self.pclock[i], received_clock[i])
+    def handle_frame(self, data):
+        kind, value = wire.decode_frame(data)
+        self.metrics.incr("messages_received")
+        self.metrics.incr("bytes_received", len(data))
+        with self.lock:
+            if kind == wire.MSG_BSS_DELTA:
+                sender_id, _, indices, values = value
+                # Delta decoding depends on the previous message of the sender
+                received_clock = self.delta_decoder.decode(sender_id, indices, values).tolist()
+                epoch = self.members.epoch  # differential groups never change
+            elif kind == wire.MSG_BSS:
+                sender_id, received_clock, epoch = value
             else:
-                self.buffer.append((received_clock, sender_id))
-                print("Buffered message as previous messages are missing")
+                raise ValueError(f"Expected a BSS message, got type {kind}")
+            self.receive_stamped(sender_id, received_clock, epoch)
+    
+    def receive_stamped(self, sender_id, received_clock, epoch):
+        if epoch != self.members.epoch:
+            if epoch > self.members.epoch:
+                # Stamped after a view change this process has not applied yet
+                self.early.append((sender_id, received_clock, epoch))
+                return
+            received_clock = self.members.translate(received_clock, epoch)
+        logger.info("Received Message from Process-%s with Clock %s", sender_id, received_clock)
+        if self.tracer is not None:
+            self.tracer.record(event_trace.RECEIVE, self.process_id, sender_id, received_clock)
+        self.handle_delivery(received_clock, sender_id)
+    
+    def blocking_entry(self, received_clock, sender, start=0):
+        """
+        Returns None if the message is deliverable, otherwise (key, position):
+        key is the (slot, clock value) that pclock must reach before the
+        message can be delivered, and position is where the next check resumes.
+        Clock entries only grow, so entries already satisfied are never rechecked.
+        `sender` is the sender's slot in pclock.
+        """
+        if start == 0 and self.pclock[sender] != received_clock[sender] - 1:
+            return (sender, received_clock[sender] - 1), 0
+        # Compare every entry at C speed; the sender's own entry is always ahead.
+        behind = list(map(operator.lt, self.pclock, received_clock))
+        behind[sender] = False
+        try:
+            i = behind.index(True, max(start, 0))
+        except ValueError:
+            return None
+        return (i, received_clock[i]), i
+    
+    def handle_delivery(self, received_clock, sender_id):
+        sender = self.members.slots.get(sender_id)
+        if sender is None:
+            logger.info("Discarded Message from departed Process-%s", sender_id)
+            self.metrics.incr("messages_discarded")
+            return
+        if self.flow is not None:
+            self.flow.received(sender_id)
+        if self.pclock[sender] >= received_clock[sender]:
+            logger.info("Discarded duplicate Message from Process-%s with Clock: %s", sender_id, received_clock)
+            self.metrics.incr("messages_discarded")
+            if self.flow is not None:
+                self.flow.released(sender_id)
+            return
+        if self.journal is not None:
+            self.journal.record(journal.RECEIVE, wire.encode_bss(sender_id, received_clock, self.members.epoch))
+        blocked = self.blocking_entry(received_clock, sender)
+        if blocked is None:
+            self.deliver(received_clock, sender)
+            return
+        key, position = blocked
+        self.buffer.park(key, (received_clock, sender, position, self.metrics.now()))
+        self.metrics.incr("messages_buffered")
+        self.metrics.observe("buffer_depth", len(self.buffer))
+        if self.tracer is not None:
+            self.tracer.record(event_trace.BUFFER, self.process_id, sender_id, received_clock)
+        if key[0] == sender:
+            logger.info("Buffered message due to missing earlier messages")
         else:
-            self.buffer.append((received_clock, sender_id))
-            print("Buffered message due to missing earlier messages")
+            logger.info("Buffered message as previous messages are missing")
+    
+    def deliver(self, received_clock, sender, parked_at=None):
+        # Each delivery advances exactly one clock entry, so only the messages
+        # parked on that (slot, value) pair can have become deliverable.
+        ready = [(received_clock, sender, parked_at)]
+        while ready:
+            received_clock, sender, parked_at = ready.pop()
+            sender_id = self.members.members[sender]
+            if self.flow is not None:
+                self.flow.released(sender_id)
+            if self.pclock[sender] >= received_clock[sender]:
+                self.metrics.incr("messages_discarded")
+                continue  # a duplicate released alongside its original
+            logger.info("Delivered Message from Process-%s with Clock: %s", sender_id, received_clock)
+            # A deliverable message is covered by pclock in every entry but the
+            # sender's, so the element-wise maximum only advances that one.
+            self.pclock[sender] = received_clock[sender]
+            self.metrics.incr("messages_delivered")
+            if self.tracer is not None:
+                self.tracer.record(event_trace.DELIVER, self.process_id, sender_id, received_clock)
+            if parked_at is not None:
+                self.metrics.observe("time_in_buffer", self.metrics.now() - parked_at)
+            if self.on_deliver is not None:
+                self.on_deliver(sender_id, received_clock)
+            for clock, waiting, position, parked_at in self.buffer.release((sender, self.pclock[sender])):
+                blocked = self.blocking_entry(clock, waiting, position if waiting != sender else 0)
+                if blocked is None:
+                    ready.append((clock, waiting, parked_at))
+                else:
+                    key, position = blocked
+                    self.buffer.park(key, (clock, waiting, position, parked_at))
+    
+    def join_member(self, pid, port=None):
+        """Adds process `pid` to the group; returns this process's own clock entry.
+
+        Broadcasts stamped before the join do not go to the new member, so it
+        starts from the entries all its peers returned (see start_from).
+        """
+        with self.lock:
+            if self.differential:
+                raise ValueError("differential clock piggybacking needs a fixed group")
+            if self.journal is not None:
+                self.journal.record(journal.MEMBERSHIP, membership.encode_change(membership.JOIN, [pid], port or 0))
+            slot = self.members.join(pid)
+            self.total_processes = len(self.members)
+            self.pclock.append(0)
+            for clock, _, _, _ in self.buffer:
+                clock.append(0)  # stamped before the join
+            self.channel_delay.append(2 * (slot - self.slot))
+            if port is not None:
+                if not isinstance(self.ports, dict):
+                    self.ports = dict(enumerate(self.ports))
+                self.ports[pid] = port
+            self.release_early()
+            return self.pclock[self.slot]
+    
+    def start_from(self, entries):
+        """Starts a joining process from {peer: entry returned by the peer's join_member}."""
+        with self.lock:
+            for pid, entry in entries.items():
+                self.pclock[self.members.slot(pid)] = entry
+            if self.journal is not None:
+                self.journal.checkpoint()
+    
+    def departure(self):
+        """{peer: stamp of the last broadcast it was sent}, for the peers' leave_member."""
+        own = self.pclock[self.slot]
+        return {pid: own for pid in self.members.live() if pid != self.process_id}
+    
+    def leave_member(self, pid, stamp):
+        """Marks `pid` as departed after its last broadcast, stamped `stamp`."""
+        with self.lock:
+            if self.journal is not None:
+                self.journal.record(journal.MEMBERSHIP, membership.encode_change(membership.LEAVE, [pid], stamp))
+            self.members.leave(pid, stamp)
+    
+    def is_stable(self, pid):
+        """Whether `pid` has departed and every broadcast it made has been delivered here."""
+        stamp = self.members.departed.get(pid)
+        return stamp is not None and self.pclock[self.members.slot(pid)] >= stamp
+    
+    def compact_members(self, pids):
+        """Reclaims the clock entries of departed `pids`, which must be stable at every member."""
+        with self.lock:
+            if self.differential:
+                raise ValueError("differential clock piggybacking needs a fixed group")
+            unstable = [pid for pid in pids if not self.is_stable(pid)]
+            if unstable:
+                raise ValueError(f"processes {unstable} have not departed or still have undelivered broadcasts")
+            if self.journal is not None:
+                self.journal.record(journal.MEMBERSHIP, membership.encode_change(membership.COMPACT, pids))
+            sources = self.members.compact(pids)
+            self.total_processes = len(self.members)
+            self.slot = self.members.slot(self.process_id)
+            self.pclock = [self.pclock[slot] for slot in sources]
+            self.channel_delay = [self.channel_delay[slot] for slot in sources]
+            # Buffered messages are renumbered too. The reclaimed entries are
+            # all satisfied, so a message that waited only on them is delivered,
+            # and one that became a duplicate is discarded.
+            new_slots = {old: new for new, old in enumerate(sources)}
+            waiting = list(self.buffer)
+            self.buffer = PendingBuffer()
+            ready = []
+            for clock, sender, _, parked_at in waiting:
+                clock = [clock[slot] for slot in sources]
+                sender = new_slots[sender]
+                if self.pclock[sender] >= clock[sender]:
+                    self.metrics.incr("messages_discarded")
+                    if self.flow is not None:
+                        self.flow.released(self.members.members[sender])
+                    continue
+                blocked = self.blocking_entry(clock, sender)
+                if blocked is None:
+                    ready.append((clock, sender, parked_at))
+                    continue
+                key, position = blocked
+                self.buffer.park(key, (clock, sender, position, parked_at))
+            for clock, sender, parked_at in ready:
+                self.deliver(clock, sender, parked_at)
+            self.release_early()
+    
+    def release_early(self):
+        """Handles the messages that were waiting for the epoch just reached."""
+        early, self.early = self.early, []
+        for sender_id, received_clock, epoch in early:
+            self.receive_stamped(sender_id, received_clock, epoch)
+    
+    def adopt_view(self, members):
+        """Takes over a whole membership view, as a journal checkpoint holds it."""
+        self.members = members
+        self.total_processes = len(members)
+        self.slot = members.slot(self.process_id)
+        self.pclock = [0] * self.total_processes
+        self.channel_delay = self.init_channel_delay()
+    
+    def joined_ports(self):
+        """{pid: port} for the journal, once members have joined with a port; None before."""
+        return self.ports if isinstance(self.ports, dict) else None
+    
+    def adopt_ports(self, ports):
+        """Takes over the peers' ports, as a journal checkpoint holds them."""
+        self.ports = ports
+    
+    def journal_state(self):
+        """Records that rebuild the membership, the clock and the buffered messages (see journal.py)."""
+        epoch = self.members.epoch
+        records = [
+            (journal.MEMBERSHIP, self.members.encode_view(self.joined_ports())),
+            (journal.STATE, wire.encode_bss(self.process_id, self.pclock, epoch)),
+        ]
+        for clock, sender, _, _ in self.buffer:
+            records.append((journal.RECEIVE, wire.encode_bss(self.members.members[sender], clock, epoch)))
+        return records
+    
+    def replay(self, kind, payload):
+        """Applies one journal record during recovery."""
+        if kind == journal.STATE:
+            _, self.pclock, _ = wire.decode_bss(payload)
+        elif kind == journal.RECEIVE:
+            sender_id, received_clock, _ = wire.decode_bss(payload)
+            self.handle_delivery(received_clock, sender_id)
+        elif kind == journal.LOCAL:
+            self.stamp_broadcast()
+        elif kind == journal.MEMBERSHIP:
+            membership.replay(self, payload)
+    
+    def link_delay(self, target_process):
+        if self.delay_model is not None:
+            return self.delay_model(self.process_id, target_process)
+        return self.channel_delay[self.members.slot(target_process)]
+    
+    def stamp_broadcast(self):
+        if self.journal is not None:
+            self.journal.record(journal.LOCAL)
+        self.pclock[self.slot] += 1
+        return list(self.pclock)
+    
+    def prepare_broadcast(self):
+        """Stamps a broadcast and returns (clock, [(target, encoded message), ...])."""
+        with self.lock:
+            clock = self.stamp_broadcast()
+            if self.tracer is not None:
+                self.tracer.record(event_trace.SEND, self.process_id, event_trace.BROADCAST, clock)
+            full_msg = None if self.differential else wire.encode_bss(self.process_id, clock, self.members.epoch)
+            members = self.members.members
+            outgoing = []
+            for p in range(self.slot + 1, self.slot + len(members)):
+                target_process = members[p % len(members)]
+                if target_process in self.members.departed:
+                    continue
+                msg = self.encode_delta(target_process, clock) if self.differential else full_msg
+                outgoing.append((target_process, msg))
+                self.metrics.incr("bytes_sent", len(msg))
+        self.metrics.incr("messages_sent", len(outgoing))
+        return clock, outgoing
     
     def send_broadcast(self):
-        self.pclock[self.process_id] += 1
-        msg = str({"clock": self.pclock, "sender": self.process_id})
+        # Each transmission is queued at its channel delay and sent by the
+        # scheduler thread, so the caller returns immediately.
+        clock, outgoing = self.prepare_broadcast()
+        for target_process, msg in outgoing:
+            self.scheduler.schedule(
+                self.link_delay(target_process), self.transmit, target_process, msg, clock, link=target_process
+            )
+    
+    def encode_delta(self, target_process, clock):
+        indices, values = self.delta_encoder.encode(target_process, clock)
+        return wire.encode_bss_delta(self.process_id, self.total_processes, indices.tolist(), values.tolist())
+    
+    def encode_full(self, clock):
+        """A delta message carrying every clock entry, which needs no earlier message."""
+        return wire.encode_bss_delta(self.process_id, len(clock), list(range(len(clock))), clock)
+    
+    def outgoing_frame(self, target_process, msg, clock):
+        """Returns (frame, fresh) for transmitting `msg`; see ConnectionPool.send for `fresh`.
         
-        for p in range(self.process_id + 1, self.process_id + self.total_processes):
-            target_process = p % self.total_processes
-            time.sleep(self.channel_delay[target_process])
-            try:
-                send_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                send_socket.connect(("127.0.0.1", self.ports[target_process]))
-                send_socket.send(msg.encode())
-                send_socket.close()
-                print(f"Sent message to Process-{target_process} with Clock: {self.pclock} at Process {self.process_id}")
-            except Exception as e:
-                print(f"Failed to send message to Process-{target_process}: {e}")
+        A delta is only valid on top of the previous frame on its link, so a
+        link that failed, or a new connection, gets the full clock instead.
+        """
+        if not self.differential:
+            return msg, None
+        fresh = functools.partial(self.encode_full, clock)
+        if target_process in self.resync:
+            return fresh(), fresh
+        return msg, fresh
+    
+    def link_sent(self, target_process):
+        self.resync.discard(target_process)
+    
+    def link_failed(self, target_process):
+        """Makes the next frame on a differential link carry the full clock."""
+        if self.differential:
+            with self.lock:
+                self.resync.add(target_process)
+                self.delta_encoder.reset(target_process)
+    
+    def transmit(self, target_process, msg, clock):
+        msg, fresh = self.outgoing_frame(target_process, msg, clock)
+        try:
+            self.pool.send(self.ports[target_process], msg, fresh)
+            self.link_sent(target_process)
+            logger.info("Sent message to Process-%s with Clock: %s at Process %s", target_process, clock, self.process_id)
+        except Exception as e:
+            self.link_failed(target_process)
+            logger.warning("Failed to send message to Process-%s: %s", target_process, e)
     
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     total_processes = int(input("Enter total number of processes: "))
     process_id = int(input(f"Enter process ID (0 to {total_processes-1}): "))
     ports = [int(input(f"Enter port for Process-{p}: ")) for p in range(total_processes)]
@@ -1,97 +1,152 @@
-import copy
+import logging
+import sys
 
-def format_matrix(matrix):
-    """Return a string representation of a matrix clock in a readable format."""
-    rows = []
-    for i, row in enumerate(matrix):
-        row_str = ", ".join(f"P{j}={val}" for j, val in enumerate(row))
-        rows.append(f"Row P{i}: [{row_str}]")
-    return "\n           ".join(rows)
+import event_trace
+from clocks import trace_clock
+from differential import DeltaDecoder, DeltaEncoder
+from matrix_member import MatrixMember, format_matrix
+
+logger = logging.getLogger(__name__)
+
+def format_delta(delta, total):
+    """Return a readable list of the (row, column) = value pairs in a clock delta."""
+    indices, values = delta
+    cells = [f"[P{i // total}][P{i % total}]={v}" for i, v in zip(indices.tolist(), values.tolist())]
+    return ", ".join(cells) if cells else "no changes"
 
 class MessageMC:
-    def __init__(self, sender, content, matrix_clock):
+    def __init__(self, sender, content, matrix_clock, delta=None, epoch=0):
         self.sender = sender      # Process ID of the sender
         self.content = content    # Message content
-        # Attach a deep copy of the sender's matrix clock
-        self.matrix_clock = copy.deepcopy(matrix_clock)
+        self.epoch = epoch        # Membership epoch the clock was stamped in
+        # In differential mode only the changed entries travel with the message;
+        # the receiver rebuilds the full matrix clock from them.
+        self.delta = delta
+        # Attach a read-only snapshot of the sender's matrix clock
+        self.matrix_clock = matrix_clock.snapshot() if delta is None else None
     
     def __str__(self):
         return f"Message from P{self.sender}: '{self.content}', Matrix Clock:\n           {format_matrix(self.matrix_clock)}"
 
-class ProcessMC:
-    def __init__(self, pid, total_processes):
-        self.pid = pid
-        self.total = total_processes
-        # Initialize matrix clock: an n x n matrix with all entries 0.
-        self.matrix_clock = [[0 for _ in range(total_processes)] for _ in range(total_processes)]
-        # Queue for messages waiting for delivery (due to causal constraints)
-        self.message_queue = []
+class ProcessMC(MatrixMember):
+    """A process ordering point-to-point messages with a matrix clock (see matrix_member.py)."""
+    message_class = MessageMC
+
+    def __init__(self, pid, total_processes, differential=False, sparse=False, members=None):
+        if differential and sparse:
+            raise ValueError("differential piggybacking needs the dense matrix clock")
+        self.init_member(pid, total_processes, sparse, members)
         # Log of delivered messages
         self.delivered_messages = []
-    
-    def local_event(self):
-        # Increment the local counter: row self.pid, column self.pid.
-        self.matrix_clock[self.pid][self.pid] += 1
-        print(f"\n[Process P{self.pid}] -- Local Event --")
-        print(f"   Updated Matrix Clock:\n           {format_matrix(self.matrix_clock)}")
+        # Differential piggybacking: remember what was sent to / received from each peer
+        self.differential = differential
+        self.delta_encoder = DeltaEncoder(self.total * self.total) if differential else None
+        self.delta_decoder = DeltaDecoder(self.total * self.total)
     
     def send_message(self, content, recipient):
-        # Perform a local event before sending to capture the send event.
-        self.local_event()
-        msg = MessageMC(self.pid, content, self.matrix_clock)
-        print(f"\n[Process P{self.pid}] -- Sending Message --")
-        print(f"   Message: '{content}'")
-        print(f"   To: Process P{recipient.pid}")
-        print(f"   Attached Matrix Clock:\n           {format_matrix(msg.matrix_clock)}")
+        msg = self.create_message(content, recipient.pid)
         recipient.receive_message(msg)
     
+    def create_message(self, content, recipient_pid):
+        # Perform a local event before sending to capture the send event.
+        self.local_event(recipient_pid)
+        if self.differential:
+            delta = self.delta_encoder.encode(recipient_pid, self.matrix_clock.matrix)
+            msg = MessageMC(self.pid, content, None, delta=delta)
+            self.metrics.incr("bytes_sent", delta[0].nbytes + delta[1].nbytes)
+        else:
+            msg = MessageMC(self.pid, content, self.matrix_clock, epoch=self.members.epoch)
+            self.metrics.incr("bytes_sent", msg.matrix_clock.nbytes)
+        self.metrics.incr("messages_sent")
+        if self.tracer is not None:
+            self.tracer.record(event_trace.SEND, self.pid, recipient_pid, trace_clock(self.matrix_clock))
+        if logger.isEnabledFor(logging.INFO):
+            if self.differential:
+                attached = f"Attached Clock Changes: {format_delta(msg.delta, self.total)}"
+            else:
+                attached = f"Attached Matrix Clock:\n           {format_matrix(msg.matrix_clock)}"
+            logger.info("\n[Process P%s] -- Sending Message --\n   Message: '%s'\n   To: Process P%s\n   %s",
+                        self.pid, content, recipient_pid, attached)
+        return msg
+    
     def receive_message(self, message):
-        print(f"\n[Process P{self.pid}] -- Message Received --")
-        print(f"   {message}")
-        self.message_queue.append(message)
-        self.try_deliver_messages()
+        self.receive(message)
     
-    def try_deliver_messages(self):
-        delivered_any = True
-        while delivered_any:
-            delivered_any = False
-            for msg in self.message_queue[:]:
-                if self.can_deliver(msg):
-                    self.message_queue.remove(msg)
-                    self.deliver_message(msg)
-                    delivered_any = True
+    def unpack(self, message):
+        if message.delta is None:
+            super().unpack(message)
+            return
+        self.metrics.incr("bytes_received", message.delta[0].nbytes + message.delta[1].nbytes)
+        flat = self.delta_decoder.decode(message.sender, *message.delta)
+        message.matrix_clock = flat.reshape(self.total, self.total)
     
-    def can_deliver(self, message):
-        """
-        Delivery condition based on the sender's row in the matrix clock:
-          Let i be the sender.
-          For message to be deliverable at process j (self), the following must hold:
-             - For the sender's own counter: 
-                  message.matrix_clock[i][i] == self.matrix_clock[i][i] + 1
-             - For every other process k (k != i):
-                  message.matrix_clock[i][k] <= self.matrix_clock[i][k]
-        """
-        sender = message.sender
-        # Check sender's own counter.
-        if message.matrix_clock[sender][sender] != self.matrix_clock[sender][sender] + 1:
-            return False
-        # Check other entries in sender's row.
-        for k in range(self.total):
-            if k != sender and message.matrix_clock[sender][k] > self.matrix_clock[sender][k]:
-                return False
+    def record_delivery(self, message, stamp):
+        self.delivered_messages.append(message)
+
+def execute_command(processes, cmd):
+    """Run one simulation command; returns False when the simulation should stop."""
+    if not cmd:
         return True
+    parts = cmd.split()
+    command = parts[0].lower()
     
-    def deliver_message(self, message):
-        # Upon delivery, update the local matrix clock by taking element-wise maximum.
-        for i in range(self.total):
-            for j in range(self.total):
-                self.matrix_clock[i][j] = max(self.matrix_clock[i][j], message.matrix_clock[i][j])
-        self.delivered_messages.append(message)
-        print(f"\n[Process P{self.pid}] -- Delivered Message --")
-        print(f"   {message}")
-        print(f"   Updated Matrix Clock:\n           {format_matrix(self.matrix_clock)}")
+    if command == "quit":
+        print("\nExiting simulation. Goodbye!")
+        return False
+    
+    elif command == "local":
+        if len(parts) != 2:
+            print("Usage: local <pid>")
+            return True
+        pid = int(parts[1])
+        if pid < 0 or pid >= len(processes):
+            print("Invalid process id.")
+            return True
+        print("-" * 60)
+        processes[pid].local_event()
+        print("-" * 60)
+    
+    elif command == "send":
+        if len(parts) < 4:
+            print("Usage: send <sender> <recipient> <message>")
+            return True
+        sender = int(parts[1])
+        recipient = int(parts[2])
+        if sender < 0 or sender >= len(processes) or recipient < 0 or recipient >= len(processes):
+            print("Invalid sender or recipient id.")
+            return True
+        msg = " ".join(parts[3:])
+        print("-" * 60)
+        processes[sender].send_message(msg, processes[recipient])
+        print("-" * 60)
+    
+    elif command == "print":
+        print("-" * 60)
+        for proc in processes:
+            print(f"Process P{proc.pid}:")
+            print(f"   Matrix Clock:\n           {format_matrix(proc.matrix_clock)}")
+            print("   Delivered Messages:")
+            if proc.delivered_messages:
+                for m in proc.delivered_messages:
+                    print(f"      {m}")
+            else:
+                print("      None")
+            if proc.message_queue:
+                print("   Pending Message Queue:")
+                for m in proc.message_queue:
+                    print(f"      {m}")
+            else:
+                print("   Pending Message Queue: None")
+            print("-" * 40)
+        print("-" * 60)
+    
+    else:
+        print("Unknown command. Available commands: local, send, print, quit.")
+    
+    return True
 
 def simulation():
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     print("=" * 60)
     print("Welcome to the Matrix Clock-based Causal Ordering Simulation!")
     print("=" * 60)
@@ -109,64 +164,8 @@ def simulation():
     while True:
         try:
             cmd = input("\nEnter command: ").strip()
-            if not cmd:
-                continue
-            parts = cmd.split()
-            command = parts[0].lower()
-            
-            if command == "quit":
-                print("\nExiting simulation. Goodbye!")
+            if not execute_command(processes, cmd):
                 break
-            
-            elif command == "local":
-                if len(parts) != 2:
-                    print("Usage: local <pid>")
-                    continue
-                pid = int(parts[1])
-                if pid < 0 or pid >= total:
-                    print("Invalid process id.")
-                    continue
-                print("-" * 60)
-                processes[pid].local_event()
-                print("-" * 60)
-            
-            elif command == "send":
-                if len(parts) < 4:
-                    print("Usage: send <sender> <recipient> <message>")
-                    continue
-                sender = int(parts[1])
-                recipient = int(parts[2])
-                if sender < 0 or sender >= total or recipient < 0 or recipient >= total:
-                    print("Invalid sender or recipient id.")
-                    continue
-                msg = " ".join(parts[3:])
-                print("-" * 60)
-                processes[sender].send_message(msg, processes[recipient])
-                print("-" * 60)
-            
-            elif command == "print":
-                print("-" * 60)
-                for proc in processes:
-                    print(f"Process P{proc.pid}:")
-                    print(f"   Matrix Clock:\n           {format_matrix(proc.matrix_clock)}")
-                    print("   Delivered Messages:")
-                    if proc.delivered_messages:
-                        for m in proc.delivered_messages:
-                            print(f"      {m}")
-                    else:
-                        print("      None")
-                    if proc.message_queue:
-                        print("   Pending Message Queue:")
-                        for m in proc.message_queue:
-                            print(f"      {m}")
-                    else:
-                        print("   Pending Message Queue: None")
-                    print("-" * 40)
-                print("-" * 60)
-            
-            else:
-                print("Unknown command. Available commands: local, send, print, quit.")
-        
         except Exception as e:
             print("Error:", e)
 
@@ -1,16 +1,90 @@
-import socket
+import logging
+import operator
+import sys
 import threading
-import pickle
+from collections import deque
+from itertools import chain, compress, groupby, repeat
+from operator import itemgetter
+
+import event_trace
+import journal
+import membership
+import wire
+from membership import Membership
+from metrics import Metrics
+from pending_buffer import ThresholdBuffer
+from transport import ConnectionPool, FrameListener
+
+logger = logging.getLogger(__name__)
+
+
+def flatten_s_buffer(s_buffer):
+    """The S-buffer as (destinations, origins, timestamps) lists, grouped by destination.
+
+    This is the form messages carry it in, so wire.py packs it in one array.
+    """
+    per_destination = s_buffer.values()
+    destinations = list(chain.from_iterable(map(repeat, s_buffer, map(len, per_destination))))
+    return destinations, list(chain.from_iterable(per_destination)), list(chain.from_iterable(map(dict.values, per_destination)))
+
+
+def expand_s_buffer(flat):
+    """Rebuilds the destination -> {origin: timestamp} map from flatten_s_buffer's lists."""
+    s_buffer = {}
+    for destination, origin, timestamp in zip(*flat):
+        s_buffer.setdefault(destination, {})[origin] = timestamp
+    return s_buffer
+
+
+def entries_for(flat, destination):
+    """(origin, timestamp) pairs of `destination` in a flattened S-buffer."""
+    destinations, origins, timestamps = flat
+    try:
+        start = destinations.index(destination)
+    except ValueError:
+        return ()
+    end = start + destinations.count(destination)
+    return zip(origins[start:end], timestamps[start:end])
+
 
 class SchiperEggliSandoz:
-    def __init__(self, process_id, total_processes, port, ports):
+    def __init__(self, process_id, total_processes, port, ports, on_deliver=None, members=None):
         self.process_id = process_id
-        self.total_processes = total_processes
+        # Interned process IDs of the group (see membership.py): vector_clock[i]
+        # belongs to process members.members[i]. The S-buffer is keyed by
+        # process ID. A joining process starts from a copy of a member's view.
+        self.members = members if members is not None else Membership(range(total_processes))
+        self.total_processes = len(self.members)
+        self.slot = self.members.slot(process_id)
         self.port = port
         self.ports = ports
-        self.vector_clock = [0] * total_processes
-        self.message_buffer = []
-        self.s_buffer = []
+        self.vector_clock = [0] * self.total_processes
+        # Blocked messages, indexed by the (origin, timestamp) they wait for
+        self.message_buffer = ThresholdBuffer()
+        # S-buffer: destination -> {origin: timestamp}. An entry says that the
+        # destination must not deliver anything carrying it before its clock
+        # for `origin` reaches `timestamp`. Only the latest timestamp is kept,
+        # and entries implied by another entry are dropped (see merge_s_buffer).
+        self.s_buffer = {}
+        # pid -> the clock carried by the last message delivered from pid
+        self.known = {}
+        self.pool = ConnectionPool()
+        # Optional callable(message_data) invoked for every delivered message
+        self.on_deliver = on_deliver
+        self.metrics = Metrics()
+        # Optional event_trace.TraceWriter recording this process's events
+        self.tracer = None
+        # Optional journal.Journal logging clock changes for crash recovery
+        self.journal = None
+        # Optional flow_control.CreditLedger counting held messages per sender
+        self.flow = None
+        # Guards the clock and both buffers: received messages are applied on
+        # the receiving thread while sends are stamped on the caller's
+        self.lock = threading.RLock()
+        # Stamp of the last message sent to each destination, for departure()
+        self.last_sent = {}
+        # Messages stamped in an epoch this process has not reached yet
+        self.early = []
 
     def start_server(self):
         """Starts a thread that listens for incoming messages."""
@@ -19,95 +93,379 @@ class SchiperEggliSandoz:
 
     def receive_message(self):
         """Handles incoming messages and updates the vector clock correctly."""
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.bind(("127.0.0.1", self.port))
-        server_socket.listen(10)
-        print(f"Process {self.process_id} listening on port {self.port}")
-
-        while True:
-            client_socket, addr = server_socket.accept()
-            data = pickle.loads(client_socket.recv(1024))
-            if data:
-                received_clock = data["clock"]
-                sender_id = data["sender"]
-                s_buffer = data["s_buffer"]
-
-                print(f"Received Message from Process-{sender_id} with Clock {received_clock}")
-                
-                # Process message delivery condition
-                if self.delivery_condition(s_buffer):
-                    self.deliver(data)
-                    self.check_buffer()
-                else:
-                    print("Buffered message due to missing causal messages.")
-                    self.message_buffer.append(data)
-            
-            client_socket.close()
-
-    def send_message(self, destination):
-        """Sends a message to the specified process."""
-        if destination >= self.total_processes or destination < 0:
-            print("Invalid process ID!")
-            return
+        logger.info("Process %s listening on port %s", self.process_id, self.port)
+        FrameListener(self.port, self.handle_frame, backlog=10).serve_forever()
 
-        self.vector_clock[self.process_id] += 1  # Increment clock on sending
-        message = input("Enter your message: ")
+    def handle_frame(self, frame):
+        """Decodes one frame read from a peer connection and processes it."""
+        kind, data = wire.decode_frame(frame)
+        if kind != wire.MSG_SES:
+            raise ValueError(f"Expected an SES message, got type {kind}")
+        self.metrics.incr("messages_received")
+        self.metrics.incr("bytes_received", len(frame))
+        if data:
+            self.handle_message(data)
 
-        # Clone s_buffer for sending
-        s_buffer_copy = list(self.s_buffer)
+    def handle_message(self, data):
+        """Delivers or buffers a decoded message."""
+        with self.lock:
+            if data["epoch"] != self.members.epoch:
+                data = self.in_current_epoch(data)
+                if data is None:
+                    return
+            received_clock = data["clock"]
+            sender_id = data["sender"]
+            s_buffer = data["s_buffer"]
+            if sender_id not in self.members:
+                logger.info("Discarded Message from departed Process-%s", sender_id)
+                self.metrics.incr("messages_discarded")
+                return
+            if self.journal is not None:
+                self.journal.record(journal.RECEIVE, wire.encode_ses(data))
+            if self.flow is not None:
+                self.flow.received(sender_id)
 
-        message_data = {
-            "sender": self.process_id,
-            "clock": self.vector_clock[:],
-            "s_buffer": s_buffer_copy,
-            "message": message
-        }
+            logger.info("Received Message from Process-%s with Clock %s", sender_id, received_clock)
+            if self.tracer is not None:
+                self.tracer.record(event_trace.RECEIVE, self.process_id, sender_id, received_clock)
+
+            # Process message delivery condition
+            blocked = self.blocking_entry(s_buffer)
+            if blocked is None:
+                self.check_buffer(self.deliver(data))
+            else:
+                logger.info("Buffered message due to missing causal messages.")
+                self.message_buffer.park(*blocked, (data, self.metrics.now()))
+                self.metrics.incr("messages_buffered")
+                self.metrics.observe("buffer_depth", len(self.message_buffer))
+                if self.tracer is not None:
+                    self.tracer.record(event_trace.BUFFER, self.process_id, sender_id, received_clock)
+
+    def in_current_epoch(self, data):
+        """A message stamped in an older epoch, in the current layout; None when it has to wait."""
+        if data["epoch"] > self.members.epoch:
+            # Stamped after a view change this process has not applied yet
+            self.early.append(data)
+            return None
+        slots = self.members.slots
+        kept = [entry for entry in zip(*data["s_buffer"]) if entry[0] in slots and entry[1] in slots]
+        s_buffer = tuple(map(list, zip(*kept))) if kept else ([], [], [])
+        return dict(
+            data, epoch=self.members.epoch, clock=self.members.translate(data["clock"], data["epoch"]), s_buffer=s_buffer
+        )
+
+    def send_message(self, destination, message=None):
+        """Sends a message to the specified process, prompting for it if not given."""
+        if destination not in self.members or destination in self.members.departed:
+            logger.warning("Invalid process ID!")
+            return
+
+        if message is None:
+            message = input("Enter your message: ")
+        message_data, frame = self.prepare_message(destination, message)
 
         try:
-            send_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            send_socket.connect(("127.0.0.1", self.ports[destination]))
-            send_socket.send(pickle.dumps(message_data))
-            send_socket.close()
+            self.pool.send(self.ports[destination], frame)
 
-            print(f"Sent message to Process-{destination} with Clock: {self.vector_clock}")
+            logger.info("Sent message to Process-%s with Clock: %s", destination, self.vector_clock)
         except Exception as e:
-            print(f"Failed to send message to Process-{destination}: {e}")
+            logger.warning("Failed to send message to Process-%s: %s", destination, e)
+
+    def prepare_message(self, destination, message):
+        """Stamps a message for `destination` and returns (message_data, encoded frame)."""
+        message_data = self.build_message(destination, message)
+        frame = wire.encode_ses(message_data)
+        self.metrics.incr("messages_sent")
+        self.metrics.incr("bytes_sent", len(frame))
+        return message_data, frame
+
+    def build_message(self, destination, message):
+        """Stamps a message for `destination` and records it in the S-buffer."""
+        with self.lock:
+            if self.journal is not None:
+                destination_bytes = bytearray()
+                wire.encode_varint(destination, destination_bytes)
+                self.journal.record(journal.LOCAL, bytes(destination_bytes))
+            self.vector_clock[self.slot] += 1  # Increment clock on sending
+
+            message_data = {
+                "sender": self.process_id,
+                "epoch": self.members.epoch,
+                "clock": self.vector_clock[:],
+                "s_buffer": flatten_s_buffer(self.s_buffer),
+                "message": message
+            }
+
+            # Later messages must not overtake this one at the destination. Its
+            # clock covers every entry held for the destination, so it replaces them.
+            self.s_buffer[destination] = {self.process_id: self.vector_clock[self.slot]}
+            self.last_sent[destination] = self.vector_clock[self.slot]
+            if self.tracer is not None:
+                self.tracer.record(event_trace.SEND, self.process_id, destination, message_data["clock"])
+            return message_data
+
+    def join_member(self, pid, port=None):
+        """Adds process `pid` to the group.
+
+        Only messages sent after the join can involve the new member, so it
+        starts from a zero clock.
+        """
+        with self.lock:
+            if self.journal is not None:
+                self.journal.record(journal.MEMBERSHIP, membership.encode_change(membership.JOIN, [pid], port or 0))
+            self.members.join(pid)
+            self.total_processes = len(self.members)
+            self.vector_clock.append(0)
+            self.known = {pid: clock + [0] for pid, clock in self.known.items()}
+            self.requeue()
+            if port is not None:
+                if not isinstance(self.ports, dict):
+                    self.ports = dict(enumerate(self.ports))
+                self.ports[pid] = port
+            self.release_early()
+
+    def departure(self):
+        """{peer: stamp of the last message sent to it}, for the peers' leave_member."""
+        return {pid: self.last_sent.get(pid, 0) for pid in self.members.live() if pid != self.process_id}
+
+    def leave_member(self, pid, stamp):
+        """Marks `pid` as departed after its last message here, stamped `stamp`."""
+        with self.lock:
+            if self.journal is not None:
+                self.journal.record(journal.MEMBERSHIP, membership.encode_change(membership.LEAVE, [pid], stamp))
+            self.members.leave(pid, stamp)
+
+    def is_stable(self, pid):
+        """Whether `pid` has departed and every message it sent here has been delivered."""
+        stamp = self.members.departed.get(pid)
+        return stamp is not None and self.vector_clock[self.members.slot(pid)] >= stamp
+
+    def compact_members(self, pids):
+        """Reclaims the clock entries of departed `pids`, which must be stable at every member."""
+        with self.lock:
+            unstable = [pid for pid in pids if not self.is_stable(pid)]
+            if unstable:
+                raise ValueError(f"processes {unstable} have not departed or still have undelivered messages")
+            if self.journal is not None:
+                self.journal.record(journal.MEMBERSHIP, membership.encode_change(membership.COMPACT, pids))
+            sources = self.members.compact(pids)
+            self.total_processes = len(self.members)
+            self.slot = self.members.slot(self.process_id)
+            self.vector_clock = [self.vector_clock[slot] for slot in sources]
+            for pid in pids:
+                self.s_buffer.pop(pid, None)
+                self.last_sent.pop(pid, None)
+                self.known.pop(pid, None)
+            self.known = {pid: [clock[slot] for slot in sources] for pid, clock in self.known.items()}
+            for destination in list(self.s_buffer):
+                entries = self.s_buffer[destination]
+                for pid in pids:
+                    entries.pop(pid, None)
+                if not entries:
+                    del self.s_buffer[destination]
+            self.requeue()
+            self.release_early()
+
+    def requeue(self):
+        """Translates the buffered messages to the layout of a new epoch.
+
+        A message whose remaining conditions all named departed members has
+        nothing left to wait for and is delivered; the others are parked again.
+        """
+        waiting = list(self.message_buffer)
+        self.message_buffer = ThresholdBuffer()
+        self.drain([(self.in_current_epoch(message_data), parked_at) for message_data, parked_at in waiting])
+
+    def release_early(self):
+        """Handles the messages that were waiting for the epoch just reached."""
+        early, self.early = self.early, []
+        for message_data in early:
+            self.handle_message(message_data)
+
+    def adopt_view(self, members):
+        """Takes over a whole membership view, as a journal checkpoint holds it."""
+        self.members = members
+        self.total_processes = len(members)
+        self.slot = members.slot(self.process_id)
+        self.vector_clock = [0] * self.total_processes
+        self.known = {}
+    def joined_ports(self):
+        """{pid: port} for the journal, once members have joined with a port; None before."""
+        return self.ports if isinstance(self.ports, dict) else None
+
+    def adopt_ports(self, ports):
+        """Takes over the peers' ports, as a journal checkpoint holds them."""
+        self.ports = ports
+
+    def journal_state(self):
+        """Records that rebuild the membership, the clock, the S-buffer, the last sends and the buffered messages (see journal.py)."""
+        state = {
+            "sender": self.process_id, "epoch": self.members.epoch,
+            "clock": self.vector_clock, "s_buffer": flatten_s_buffer(self.s_buffer), "message": "",
+        }
+        # The STATE payload is last_sent as two arrays, then the state as an SES frame
+        sent = bytearray()
+        wire.encode_array(list(self.last_sent), sent)
+        wire.encode_array(list(self.last_sent.values()), sent)
+        records = [(journal.MEMBERSHIP, self.members.encode_view(self.joined_ports())), (journal.STATE, bytes(sent) + wire.encode_ses(state))]
+        for message_data, _ in self.message_buffer:
+            records.append((journal.RECEIVE, wire.encode_ses(message_data)))
+        return records
+
+    def replay(self, kind, payload):
+        """Applies one journal record during recovery."""
+        if kind == journal.STATE:
+            view = memoryview(payload)
+            pids, offset = wire.decode_array(view, 0)
+            stamps, offset = wire.decode_array(view, offset)
+            self.last_sent = dict(zip(pids, stamps))
+            state = wire.decode_ses(view[offset:])
+            self.vector_clock = state["clock"]
+            self.s_buffer = expand_s_buffer(state["s_buffer"])
+        elif kind == journal.RECEIVE:
+            self.handle_message(wire.decode_ses(payload))
+        elif kind == journal.LOCAL:
+            destination, _ = wire.decode_varint(payload, 0)
+            self.build_message(destination, "")
+        elif kind == journal.MEMBERSHIP:
+            membership.replay(self, payload)
 
     def delivery_condition(self, incoming_s_buffer):
         """Checks if the message can be delivered based on S-buffer conditions."""
-        for s in incoming_s_buffer:
-            if s["process"] == self.process_id and s["timestamp"] > self.vector_clock[self.process_id]:
-                return False
-        return True
+        return self.blocking_entry(incoming_s_buffer) is None
+
+    def blocking_entry(self, incoming_s_buffer):
+        """Returns the first condition not yet met, as (slot of the origin, timestamp), or None."""
+        slots = self.members.slots
+        for origin, timestamp in entries_for(incoming_s_buffer, self.process_id):
+            slot = slots[origin]
+            if self.vector_clock[slot] < timestamp:
+                return slot, timestamp
+        return None
 
     def deliver(self, message_data):
-        """Delivers a message and updates the vector clock correctly."""
+        """Delivers a message and updates the vector clock; returns the slots that advanced."""
         sender_id = message_data["sender"]
         received_clock = message_data["clock"]
 
-        print(f"Delivered Message from Process-{sender_id} with Clock: {received_clock}")
+        logger.info("Delivered Message from Process-%s with Clock: %s", sender_id, received_clock)
+        if self.tracer is not None:
+            self.tracer.record(event_trace.DELIVER, self.process_id, sender_id, received_clock)
+
+        if self.flow is not None:
+            self.flow.released(sender_id)
 
         # Merge vector clocks
-        self.vector_clock = [max(self.vector_clock[i], received_clock[i]) for i in range(self.total_processes)]
+        previous = self.vector_clock
+        self.vector_clock = list(map(max, previous, received_clock))
+        advanced = list(compress(range(self.total_processes), map(operator.gt, self.vector_clock, previous)))
 
         # **Increment clock AFTER receiving and merging clocks**
-        self.vector_clock[self.process_id] += 1  
+        self.vector_clock[self.slot] += 1  
+        advanced.append(self.slot)
 
         # Merge S-buffer knowledge
-        self.s_buffer.append({"process": sender_id, "timestamp": received_clock[sender_id]})
+        self.merge_s_buffer(message_data["s_buffer"])
+        self.collect_s_buffer(sender_id, received_clock)
+
+        logger.info("Updated Vector Clock: %s", self.vector_clock)
+        self.metrics.incr("messages_delivered")
+        if self.on_deliver is not None:
+            self.on_deliver(message_data)
+        return advanced
+
+    def merge_s_buffer(self, incoming_s_buffer):
+        """Merges a flattened S-buffer, keeping only entries that still constrain a destination.
+
+        An entry (D, O, t) is skipped when it is older than the one held, when
+        the last clock delivered from D already covers it, or when a held entry
+        implies it. An entry (D, X, tx) implies (D, O, t) if clock_of(X) covers
+        t and tx is at least clock_of(X)'s own entry: X's clock at event tx
+        covers that clock, so D cannot reach tx without covering t as well.
+        A new entry that implies held ones replaces them.
+        """
+        slots = self.members.slots
+        for destination, entries in groupby(zip(*incoming_s_buffer), itemgetter(0)):
+            if destination == self.process_id:
+                continue  # satisfied by this delivery
+            seen = self.known.get(destination)
+            local = self.s_buffer.get(destination)
+            if local is None:
+                local = self.s_buffer[destination] = {}
+            implied = None
+            for _, origin, timestamp in entries:
+                if timestamp <= local.get(origin, 0):
+                    continue
+                slot = slots[origin]
+                if seen is not None and seen[slot] >= timestamp:
+                    continue
+                if implied is None:
+                    implied = self.implied_clocks(local)
+                if any(clock[slot] >= timestamp for clock in implied):
+                    continue
+                local[origin] = timestamp
+                clock = self.clock_of(origin)
+                if clock is not None and timestamp >= clock[slot]:
+                    for other in [o for o, t in local.items() if t <= clock[slots[o]] and o != origin]:
+                        del local[other]
+                    implied = None
+            if not local:
+                del self.s_buffer[destination]
+
+    def clock_of(self, pid):
+        """The latest clock known for `pid`: this process's own, or the last one delivered from it."""
+        return self.vector_clock if pid == self.process_id else self.known.get(pid)
+
+    def implied_clocks(self, entries):
+        """Clocks whose entries the held `entries` of one destination imply (see merge_s_buffer)."""
+        slots = self.members.slots
+        implied = []
+        for origin, timestamp in entries.items():
+            clock = self.clock_of(origin)
+            if clock is not None and timestamp >= clock[slots[origin]]:
+                implied.append(clock)
+        return implied
+
+    def collect_s_buffer(self, sender_id, received_clock):
+        """
+        Drops entries the sender is known to satisfy: its clock at send time
+        already covered them, and clocks never go backwards. The clock is kept
+        to filter entries for the sender that arrive later.
+        """
+        self.known[sender_id] = received_clock
+        entries = self.s_buffer.get(sender_id)
+        if not entries:
+            return
+        slots = self.members.slots
+        for origin in [o for o, timestamp in entries.items() if received_clock[slots[o]] >= timestamp]:
+            del entries[origin]
+        if not entries:
+            del self.s_buffer[sender_id]
 
-        print(f"Updated Vector Clock: {self.vector_clock}")
+    def check_buffer(self, advanced=None):
+        """
+        Delivers buffered messages whose conditions are now met. Only messages
+        waiting on the clock entries in `advanced` (None: any entry) that have
+        reached their timestamps are looked at, and the loop is iterative, so
+        long chains drain in linear time.
+        """
+        self.drain(self.message_buffer.release(self.vector_clock, advanced))
 
-    def check_buffer(self):
-        """Checks the buffer for messages that can now be delivered."""
-        for message_data in self.message_buffer:
-            if self.delivery_condition(message_data["s_buffer"]):
-                self.deliver(message_data)
-                self.message_buffer.remove(message_data)
-                self.check_buffer()
-                break
+    def drain(self, ready):
+        """Delivers the (message_data, parked_at) pairs in `ready` that can be, and what they unblock; parks the rest."""
+        ready = deque(ready)
+        while ready:
+            message_data, parked_at = ready.popleft()
+            blocked = self.blocking_entry(message_data["s_buffer"])
+            if blocked is not None:
+                self.message_buffer.park(*blocked, (message_data, parked_at))
+                continue
+            self.metrics.observe("time_in_buffer", self.metrics.now() - parked_at)
+            advanced = self.deliver(message_data)
+            ready.extend(self.message_buffer.release(self.vector_clock, advanced))
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     total_processes = int(input("Enter total number of processes: "))
     process_id = int(input(f"Enter process ID (0 to {total_processes-1}): "))
     ports = [int(input(f"Enter port for Process-{p}: ")) for p in range(total_processes)]
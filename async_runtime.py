@@ -0,0 +1,196 @@
+"""asyncio runtime for the socket-based BSS and SES processes.
+
+The thread-per-listener setup in BSS.py and SES.py is replaced by a single
+event loop: `asyncio.start_server` serves incoming connections, outgoing
+messages reuse one stream per peer, and broadcasts go out to all peers
+concurrently. Nothing here calls input(), and one OS process can host many
+nodes, each just a set of coroutines on the same loop.
+
+    processes = [Process(pid, 3, ports[pid], ports, delay_model=FixedDelay(0)) for pid in range(3)]
+    nodes = await start_nodes(processes)
+    nodes[0].add_delivery_callback(on_delivered)   # async def on_delivered(*delivery)
+    await nodes[0].broadcast()
+
+With `window` set, sends wait for flow-control credits from their
+destinations, so no receiver holds more than `window` undelivered messages
+from one sender (see flow_control.py).
+"""
+import asyncio
+import inspect
+import logging
+from collections import deque
+
+import wire
+from flow_control import CreditLedger, CreditWindow
+from transport import FRAME_HEADER
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncNode:
+    """Hosts one BSS `Process` or SES `SchiperEggliSandoz` on an asyncio event loop."""
+
+    def __init__(self, process, host="127.0.0.1", backlog=1024, window=None, stall_timeout=None, stall_policy="wait"):
+        self.process = process
+        self.host = host
+        self.backlog = backlog
+        self.server = None
+        self.writers = {}
+        self.locks = {}
+        self.link_tails = {}
+        self.callbacks = []
+        self.deliveries = deque()
+        self.connections = {}
+        self.credits = None
+        if window is not None:
+            process.flow = CreditLedger(window)
+            self.credits = CreditWindow(window, stall_timeout, stall_policy, process.metrics)
+        # Deliveries are collected synchronously by the process and handed to
+        # the awaitable callbacks once the frame that caused them is handled.
+        previous = process.on_deliver
+        def record(*delivery):
+            if previous is not None:
+                previous(*delivery)
+            self.deliveries.append(delivery)
+        process.on_deliver = record
+
+    def add_delivery_callback(self, callback):
+        """Registers a coroutine function (or plain function) called per delivery."""
+        self.callbacks.append(callback)
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self.serve_connection, self.host, self.process.port, backlog=self.backlog
+        )
+        logger.info("Process %s listening on port %s", self.process.process_id, self.process.port)
+
+    async def serve_connection(self, reader, writer):
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                (length,) = FRAME_HEADER.unpack(header)
+                frame = await reader.readexactly(length)
+                if wire.message_type(frame) == wire.MSG_CREDIT:
+                    # A node started without a window ignores credits from peers that have one
+                    if self.credits is not None:
+                        await self.credits.grant(*wire.decode_credit(frame))
+                    continue
+                self.process.handle_frame(frame)
+                if self.process.flow is not None:
+                    self.return_credits()
+                await self.dispatch_deliveries()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+    async def dispatch_deliveries(self):
+        while self.deliveries:
+            delivery = self.deliveries.popleft()
+            for callback in self.callbacks:
+                result = callback(*delivery)
+                if inspect.isawaitable(result):
+                    await result
+
+    def return_credits(self):
+        """Sends the credits now due to each sender, without waiting for the sends."""
+        for sender, count in self.process.flow.take_grants().items():
+            frame = wire.encode_credit(self.process.process_id, count)
+            task = asyncio.ensure_future(self.send(self.process.ports[sender], frame))
+            task.add_done_callback(self.credit_sent)
+
+    def credit_sent(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Failed to return credits: %s", task.exception())
+
+    def occupancy(self):
+        """Undelivered messages held per sender, when flow control is on."""
+        return self.process.flow.occupancy() if self.process.flow is not None else {}
+
+    async def send(self, port, payload, fresh=None):
+        """Sends one frame to `port` over the pooled stream, reconnecting once on failure.
+
+        As in ConnectionPool.send, a frame that goes out on a newly opened
+        stream is fresh() when `fresh` is given.
+        """
+        lock = self.locks.setdefault(port, asyncio.Lock())
+        async with lock:
+            for attempt in range(2):
+                writer = self.writers.get(port)
+                try:
+                    if writer is None:
+                        _, writer = await asyncio.open_connection(self.host, port)
+                        self.writers[port] = writer
+                        if fresh is not None:
+                            payload = fresh()
+                    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+                    await writer.drain()
+                    return
+                except OSError:
+                    self.writers.pop(port, None)
+                    if writer is not None:
+                        writer.close()
+                    if attempt:
+                        raise
+
+    async def transmit(self, target, payload, clock, delay, previous):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if previous is not None:
+            # Differential messages depend on their predecessor on the same
+            # link. If it failed, this one is sent as a full clock instead.
+            await asyncio.wait([previous])
+        payload, fresh = self.process.outgoing_frame(target, payload, clock)
+        try:
+            await self.send(self.process.ports[target], payload, fresh)
+        except OSError:
+            self.process.link_failed(target)
+            raise
+        self.process.link_sent(target)
+
+    async def broadcast(self):
+        """BSS: stamps one broadcast and sends it to every peer concurrently."""
+        if self.credits is not None:
+            for target in self.process.members.live():
+                if target != self.process.process_id:
+                    await self.credits.acquire(target)
+        clock, outgoing = self.process.prepare_broadcast()
+        tasks = []
+        for target, payload in outgoing:
+            previous = self.link_tails.get(target) if self.process.differential else None
+            task = asyncio.ensure_future(
+                self.transmit(target, payload, clock, self.process.link_delay(target), previous)
+            )
+            self.link_tails[target] = task
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+        return clock
+
+    async def send_message(self, destination, message):
+        """SES: stamps `message` for `destination` and sends it."""
+        if self.credits is not None:
+            await self.credits.acquire(destination)
+        message_data, frame = self.process.prepare_message(destination, message)
+        await self.send(self.process.ports[destination], frame)
+        return message_data
+
+    async def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+        handlers = list(self.connections.values())
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+async def start_nodes(processes, host="127.0.0.1"):
+    """Starts one AsyncNode per process on the running loop and returns them."""
+    nodes = [AsyncNode(process, host) for process in processes]
+    await asyncio.gather(*(node.start() for node in nodes))
+    return nodes
@@ -0,0 +1,141 @@
+"""Compares BSS, SES, matrix clocks and chat rooms on identical generated workloads.
+
+Every configuration in the grid (process count x fan-out x reorder rate x
+message rate) gets one seeded workload of send events, and each algorithm
+replays it in the discrete-event simulator, so every algorithm in a row group
+sends to the same destinations. A matrix-clock send event is one message
+delivered to every destination. BSS and chat rooms can only send to the
+whole group, so they run only in the configurations whose fan-out is all.
+
+A run that ends with messages still buffered is marked invalid: its
+throughput, latency, buffer and memory figures describe a stalled buffer
+rather than delivery, so they are left out (the original matrix-clock
+condition stalls whenever a receiver misses some of a sender's messages).
+
+Reported per run:
+  throughput         deliveries per wall-clock second of simulation
+  latency_p50/p99    send-to-delivery time in virtual time units, buffering included
+  peak_buffer        largest number of messages buffered at one process
+  bytes_per_message  encoded size of each message as sent (wire.py encoding)
+  peak_memory        peak bytes allocated during the run (tracemalloc)
+  pending            messages still buffered at the end
+  valid              whether every message was delivered
+
+Run with: python3 bench_algorithms.py --output results.json
+          python3 bench_algorithms.py --processes 10 50 --fanout 1 all --reorder 0 0.2
+"""
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+from delay_scheduler import ReorderingDelay, UniformDelay
+from simulator import generate_workload, percentile, simulate
+
+ALGORITHMS = ("bss", "ses", "matrix", "room")
+# Algorithms whose every send reaches the whole group
+BROADCAST_ONLY = ("bss", "room")
+
+
+def delay_model(reorder, seed):
+    model = UniformDelay(0.5, 1.5, seed=seed)
+    if reorder:
+        model = ReorderingDelay(model, reorder, 5.0, seed=seed + 1)
+    return model
+
+
+def run_config(algorithm, processes, fanout, reorder, rate, messages, seed, memory=True):
+    workload = generate_workload(processes, messages, fanout, rate, seed)
+    result = simulate(
+        algorithm, processes, messages, seed=seed, delay_model=delay_model(reorder, seed), workload=workload
+    )
+    peak_memory = None
+    if memory:
+        # A second, identical run under tracemalloc, so tracing does not skew the timings.
+        tracemalloc.start()
+        simulate(algorithm, processes, messages, seed=seed, delay_model=delay_model(reorder, seed), workload=workload)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    latencies = result["latencies"]
+    valid = result["pending"] == 0
+    return {
+        "algorithm": algorithm,
+        "processes": processes,
+        "fanout": min(fanout, processes - 1),
+        "reorder": reorder,
+        "rate": rate,
+        "send_events": messages,
+        "messages": result["sent"],
+        "delivered": result["delivered"],
+        "pending": result["pending"],
+        "valid": valid,
+        "throughput": result["delivered"] / result["wall_time"] if valid and result["wall_time"] else None,
+        "latency_p50": percentile(latencies, 50) if valid else None,
+        "latency_p99": percentile(latencies, 99) if valid else None,
+        "peak_buffer": result["peak_buffer"] if valid else None,
+        "bytes_per_message": result["bytes_sent"] / result["sent"] if result["sent"] else None,
+        "peak_memory": peak_memory if valid else None,
+        "wall_time": result["wall_time"],
+    }
+
+
+def format_row(row):
+    def number(value, spec):
+        return "-" if value is None else format(value, spec)
+    return (
+        f"{row['algorithm']:<7}{row['processes']:>6}{row['fanout']:>7}{row['reorder']:>8}{row['rate']:>6}"
+        f"{number(row['throughput'], '.0f'):>12}{number(row['latency_p50'], '.2f'):>8}{number(row['latency_p99'], '.2f'):>8}"
+        f"{number(row['peak_buffer'], 'd'):>8}{number(row['bytes_per_message'], '.0f'):>8}"
+        f"{number(row['peak_memory'] and row['peak_memory'] / 1024, '.0f'):>10}{row['pending']:>9}"
+        f"{'' if row['valid'] else '  INVALID: messages left pending'}"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark BSS, SES and matrix clocks on the same workloads.")
+    parser.add_argument("--algorithms", nargs="+", choices=ALGORITHMS, default=list(ALGORITHMS))
+    parser.add_argument("--processes", nargs="+", type=int, default=[5, 20])
+    parser.add_argument("--fanout", nargs="+", default=["1", "all"], help="destinations per send event, or 'all'")
+    parser.add_argument("--reorder", nargs="+", type=float, default=[0.0, 0.2], help="fractions of messages held back")
+    parser.add_argument("--rate", nargs="+", type=float, default=[10.0], help="send events per unit of virtual time")
+    parser.add_argument("--messages", type=int, default=200, help="send events per run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc run")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    rows = []
+    print(f"{'algo':<7}{'procs':>6}{'fanout':>7}{'reorder':>8}{'rate':>6}{'deliv/s':>12}{'p50':>8}{'p99':>8}"
+          f"{'peakbuf':>8}{'B/msg':>8}{'mem KiB':>10}{'pending':>9}")
+    for processes in args.processes:
+        for fanout in args.fanout:
+            fanout = processes - 1 if fanout == "all" else int(fanout)
+            for reorder in args.reorder:
+                for rate in args.rate:
+                    for algorithm in args.algorithms:
+                        if algorithm in BROADCAST_ONLY and fanout < processes - 1:
+                            continue
+                        row = run_config(algorithm, processes, fanout, reorder, rate, args.messages, args.seed, args.memory)
+                        rows.append(row)
+                        print(format_row(row))
+    invalid = sum(not row["valid"] for row in rows)
+    if invalid:
+        print(f"{invalid} of {len(rows)} runs left messages pending and are invalid")
+
+    if args.output:
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "messages": args.messages,
+            "seed": args.seed,
+            "results": rows,
+        }
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    return rows
+
+
+if __name__ == "__main__":
+    main()
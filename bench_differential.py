@@ -0,0 +1,78 @@
+"""Reports piggybacked clock bytes per message with and without differential mode.
+
+Traffic is skewed the way chat-like workloads usually are: a small set of
+active processes sends most messages while the rest of the group is idle.
+
+Run with: python3 bench_differential.py
+"""
+import random
+
+import numpy as np
+
+import wire
+from BSS import Process
+from Matrix_clock import ProcessMC
+
+
+def bss_traffic(total, active, broadcasts, seed):
+    rng = random.Random(seed)
+    processes = [Process(pid, total, None, None, differential=True) for pid in range(total)]
+    senders = rng.sample(range(total), active)
+    full_bytes = delta_bytes = messages = 0
+    for _ in range(broadcasts):
+        sender = processes[rng.choice(senders)]
+        clock = sender.stamp_broadcast()
+        full = wire.encode_bss(sender.process_id, clock)
+        for target in processes:
+            if target is sender:
+                continue
+            delta = sender.encode_delta(target.process_id, clock)
+            _, _, indices, values = wire.decode_bss_delta(delta)
+            rebuilt = target.delta_decoder.decode(sender.process_id, indices, values).tolist()
+            assert rebuilt == clock
+            target.handle_delivery(rebuilt, sender.process_id)
+            full_bytes += len(full)
+            delta_bytes += len(delta)
+            messages += 1
+    return full_bytes / messages, delta_bytes / messages
+
+
+class RecordingProcessMC(ProcessMC):
+    def receive_message(self, message):
+        self.last_received = message
+        super().receive_message(message)
+
+
+def matrix_traffic(total, active, sends, seed):
+    rng = random.Random(seed)
+    full_processes = [RecordingProcessMC(pid, total) for pid in range(total)]
+    delta_processes = [RecordingProcessMC(pid, total, differential=True) for pid in range(total)]
+    members = rng.sample(range(total), active)
+    full_bytes = delta_bytes = 0
+    for _ in range(sends):
+        sender, recipient = rng.sample(members, 2)
+        full_processes[sender].send_message("m", full_processes[recipient])
+        delta_processes[sender].send_message("m", delta_processes[recipient])
+        full_msg = full_processes[recipient].last_received
+        delta_msg = delta_processes[recipient].last_received
+        assert np.array_equal(full_msg.matrix_clock, delta_msg.matrix_clock)
+        flat = full_msg.matrix_clock.reshape(-1).tolist()
+        full_bytes += len(wire.encode_bss(sender, flat))
+        indices, values = delta_msg.delta
+        delta_bytes += len(wire.encode_bss_delta(sender, total * total, indices.tolist(), values.tolist()))
+    return full_bytes / sends, delta_bytes / sends
+
+
+def main():
+    print("BSS vector clocks (bytes per message)")
+    for total, active in ((50, 5), (200, 5), (200, 50)):
+        full, delta = bss_traffic(total, active, broadcasts=100, seed=1)
+        print(f"  N={total:<4} active={active:<3} full {full:8.1f}  differential {delta:8.1f}  ({full / delta:.1f}x smaller)")
+    print("Matrix clocks (bytes per message)")
+    for total, active in ((20, 4), (50, 5), (100, 10)):
+        full, delta = matrix_traffic(total, active, sends=1000, seed=1)
+        print(f"  N={total:<4} active={active:<3} full {full:8.1f}  differential {delta:8.1f}  ({full / delta:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
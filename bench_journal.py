@@ -0,0 +1,71 @@
+"""Measures the hot-path cost of journaling and the recovery time it buys.
+
+Runs the same simulated BSS and SES workloads without a journal, with one
+that fsyncs every send (the default) and with one that batches every fsync.
+Then it recovers one process from its journal for several checkpoint
+intervals.
+
+Run with: python3 bench_journal.py
+"""
+import os
+import tempfile
+import time
+
+from BSS import Process
+from delay_scheduler import UniformDelay
+from journal import Journal
+from SES import SchiperEggliSandoz
+from simulator import Simulator, build_group, generate_workload, schedule_workload
+
+PROCESSES = 10
+SENDS = 5000
+
+
+def run(algorithm, directory=None, checkpoint_every=10000, sync_local=True):
+    simulator = Simulator(seed=1, delay_model=UniformDelay(0.5, 1.5, seed=1))
+    group = build_group(simulator, algorithm, PROCESSES)
+    journals = []
+    if directory is not None:
+        for process in group.processes:
+            journal = Journal(
+                os.path.join(directory, f"P{len(journals)}"), checkpoint_every=checkpoint_every, sync_local=sync_local
+            )
+            journal.recover(process)
+            journals.append(journal)
+    schedule_workload(simulator, group, generate_workload(PROCESSES, SENDS, fanout=2, seed=1))
+    start = time.perf_counter()
+    simulator.run()
+    elapsed = time.perf_counter() - start
+    for journal in journals:
+        journal.close()
+    return group, elapsed
+
+
+def recover_time(algorithm, directory):
+    process = Process(0, PROCESSES, None, None) if algorithm == "bss" else SchiperEggliSandoz(0, PROCESSES, None, None)
+    start = time.perf_counter()
+    replayed = Journal(os.path.join(directory, "P0")).recover(process)
+    return time.perf_counter() - start, replayed
+
+
+def main():
+    for algorithm in ("bss", "ses"):
+        group, plain = run(algorithm)
+        events = group.sent + group.delivered
+        print(f"{algorithm}: {events} sends + deliveries, {plain:.2f} s without journal")
+        for sync_local in (True, False):
+            with tempfile.TemporaryDirectory() as directory:
+                _, journaled = run(algorithm, directory, sync_local=sync_local)
+            print(
+                f"  journal, {'sends synced' if sync_local else 'all batched'}: {journaled:.2f} s "
+                f"({(journaled - plain) / events * 1e6:5.1f} us per event)"
+            )
+        for checkpoint_every in (1000, 10000, 100000):
+            with tempfile.TemporaryDirectory() as directory:
+                run(algorithm, directory, checkpoint_every)
+                seconds, replayed = recover_time(algorithm, directory)
+            print(f"  checkpoint every {checkpoint_every:>6} events: recovery {seconds * 1e3:7.1f} ms ({replayed} events replayed)")
+
+
+if __name__ == "__main__":
+    main()
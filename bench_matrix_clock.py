@@ -0,0 +1,57 @@
+"""Compares the NumPy matrix clock with the original list-of-lists version.
+
+Run with: python3 bench_matrix_clock.py
+"""
+import copy
+import timeit
+
+from clocks import MatrixClock
+
+
+def list_can_deliver(local, snapshot, sender, total):
+    if snapshot[sender][sender] != local[sender][sender] + 1:
+        return False
+    for k in range(total):
+        if k != sender and snapshot[sender][k] > local[sender][k]:
+            return False
+    return True
+
+
+def list_merge(local, snapshot, total):
+    for i in range(total):
+        for j in range(total):
+            local[i][j] = max(local[i][j], snapshot[i][j])
+
+
+def bench(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    print(f"{'N':>6} {'op':<12} {'lists (us)':>12} {'numpy (us)':>12} {'speedup':>8}")
+    for total in (10, 100, 300, 1000):
+        number = max(1, 20000 // (total * total) * 10) if total < 1000 else 1
+        local = [[0] * total for _ in range(total)]
+        # A deliverable message from P0, so both versions check the whole row.
+        remote = [[0] * total for _ in range(total)]
+        remote[0][0] = 1
+        clock = MatrixClock(total)
+        other = MatrixClock(total)
+        other.tick(0)
+        snapshot = other.snapshot()
+
+        rows = [
+            ("snapshot", bench(lambda: copy.deepcopy(local), number), bench(clock.snapshot, number)),
+            (
+                "can_deliver",
+                bench(lambda: list_can_deliver(local, remote, 0, total), number * 10),
+                bench(lambda: clock.can_deliver(snapshot, 0), number * 10),
+            ),
+            ("merge", bench(lambda: list_merge(local, remote, total), number), bench(lambda: clock.merge(snapshot), number)),
+        ]
+        for name, old, new in rows:
+            print(f"{total:>6} {name:<12} {old:>12.1f} {new:>12.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
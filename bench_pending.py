@@ -0,0 +1,72 @@
+"""Measures how long BSS takes to drain thousands of out-of-order broadcasts.
+
+Run with: python3 bench_pending.py
+"""
+import random
+import time
+
+from BSS import Process
+
+
+def causal_history(total_processes, messages, seed):
+    """Generates broadcasts where every sender has seen all earlier ones."""
+    rng = random.Random(seed)
+    clock = [0] * total_processes
+    history = []
+    for _ in range(messages):
+        sender = rng.randrange(1, total_processes)
+        clock[sender] += 1
+        history.append((list(clock), sender))
+    return history
+
+
+def rescan_drain(total_processes, arrivals):
+    """The list-and-rescan approach: retry the whole buffer after every arrival."""
+    pclock = [0] * total_processes
+    buffer = []
+    for message in arrivals:
+        buffer.append(message)
+        progress = True
+        while progress:
+            progress = False
+            for entry in buffer[:]:
+                clock, sender = entry
+                if pclock[sender] == clock[sender] - 1 and all(
+                    pclock[i] >= clock[i] for i in range(total_processes) if i != sender
+                ):
+                    buffer.remove(entry)
+                    for i in range(total_processes):
+                        pclock[i] = max(pclock[i], clock[i])
+                    progress = True
+    return pclock
+
+
+def indexed_drain(total_processes, arrivals):
+    process = Process(0, total_processes, None, None)
+    for clock, sender in arrivals:
+        process.handle_delivery(clock, sender)
+    return process.pclock, len(process.buffer)
+
+
+def main():
+    for total_processes, messages in ((4, 2000), (16, 5000), (64, 5000)):
+        history = causal_history(total_processes, messages, seed=1)
+        arrivals = history[:]
+        random.Random(2).shuffle(arrivals)
+
+        start = time.perf_counter()
+        pclock, left = indexed_drain(total_processes, arrivals)
+        indexed = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = rescan_drain(total_processes, arrivals)
+        rescan = time.perf_counter() - start
+
+        assert pclock == expected and left == 0
+        print(
+            f"N={total_processes:<3} messages={messages:<5} "
+            f"indexed {indexed * 1000:8.1f} ms   rescan {rescan * 1000:9.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
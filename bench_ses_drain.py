@@ -0,0 +1,51 @@
+"""Times how long SES takes to drain a long chain of buffered messages.
+
+P0 sends m1 to P2 and then m2 to P1. P1 delivers m2 and sends a burst of k
+messages to P2. The burst reaches P2 before m1, so all of it is buffered.
+The arrival of m1 then releases the whole chain.
+
+Run with: python3 bench_ses_drain.py
+"""
+import time
+
+from SES import SchiperEggliSandoz
+
+
+class CapturePool:
+    def __init__(self):
+        self.frames = []
+
+    def send(self, port, payload):
+        self.frames.append(payload)
+
+
+def drain(burst):
+    processes = [SchiperEggliSandoz(pid, 3, None, [None] * 3) for pid in range(3)]
+    for process in processes:
+        process.pool = CapturePool()
+    p0, p1, p2 = processes
+    p0.send_message(2, "m1")
+    p0.send_message(1, "m2")
+    m1, m2 = p0.pool.frames
+    p1.handle_frame(m2)
+    for i in range(burst):
+        p1.send_message(2, f"burst {i}")
+    for frame in p1.pool.frames:
+        p2.handle_frame(frame)
+    assert len(p2.message_buffer) == burst
+
+    start = time.perf_counter()
+    p2.handle_frame(m1)
+    elapsed = time.perf_counter() - start
+    assert len(p2.message_buffer) == 0
+    return elapsed
+
+
+def main():
+    for burst in (1000, 10000, 100000):
+        elapsed = drain(burst)
+        print(f"burst={burst:<7} drained in {elapsed * 1000:8.1f} ms ({elapsed / burst * 1e6:.2f} us/message)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Times trace recording per event and lazy filtering of the written trace.
+
+Matrix-clock processes record the diagonal of their clock (clocks.trace_clock);
+the full n x n record is timed alongside it for comparison.
+
+Run with: python3 bench_trace.py
+"""
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from clocks import trace_clock
+from event_trace import DELIVER, RECEIVE, TraceReader, TraceWriter
+
+
+def main():
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        for total, events in ((10, 1000000), (100, 200000)):
+            path = os.path.join(directory, f"bench-{total}.trace")
+            clocks = [[rng.randrange(1000) for _ in range(total)] for _ in range(64)]
+            matrix = np.arange(total * total, dtype=np.int64).reshape(total, total)
+
+            with TraceWriter(path) as writer:
+                start = time.perf_counter()
+                for i in range(events):
+                    writer.record(RECEIVE if i & 1 else DELIVER, i % total, (i + 1) % total, clocks[i & 63])
+                vector = time.perf_counter() - start
+                start = time.perf_counter()
+                for i in range(events // 100):
+                    writer.record(DELIVER, i % total, (i + 1) % total, matrix)
+                matrix_time = time.perf_counter() - start
+                start = time.perf_counter()
+                for i in range(events // 100):
+                    writer.record(DELIVER, i % total, (i + 1) % total, trace_clock(matrix))
+                diagonal_time = time.perf_counter() - start
+
+            size = os.path.getsize(path)
+            with TraceReader(path) as reader:
+                start = time.perf_counter()
+                matched = sum(1 for _ in reader.events(event=DELIVER, process=3))
+                scan = time.perf_counter() - start
+            print(
+                f"N={total:<4} vector record {vector / events * 1e6:5.2f} us  "
+                f"matrix record {matrix_time / (events // 100) * 1e6:6.2f} us  "
+                f"diagonal record {diagonal_time / (events // 100) * 1e6:5.2f} us  "
+                f"file {size / 2**20:6.1f} MiB  filter {scan:5.2f} s ({matched} matches)"
+            )
+
+
+if __name__ == "__main__":
+    main()
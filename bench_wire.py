@@ -0,0 +1,92 @@
+"""Compares the binary wire format against the original str/eval and pickle encodings.
+
+BSS messages target encode and decode cost falling by an order of magnitude
+(BSS_TARGET). SES messages are compared with pickle on the same message dict,
+S-buffer flattened as SES.py sends it, and target at least parity
+(SES_TARGET). Each case reports the speedups and whether both reach the target.
+
+Run with: python3 bench_wire.py
+"""
+import pickle
+import timeit
+
+import wire
+from SES import flatten_s_buffer
+
+BSS_TARGET = 10.0
+SES_TARGET = 1.0
+
+
+def bench(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def bss_case(n, number):
+    clock = list(range(1, n + 1))
+    text = str({"clock": clock, "sender": 0}).encode()
+    binary = wire.encode_bss(0, clock)
+    assert eval(text.decode())["clock"] == wire.decode_bss(binary)[1]
+    assert wire.decode_bss(wire.encode_bss(0, clock, 300)) == (0, clock, 300)
+    return {
+        "old_bytes": len(text),
+        "new_bytes": len(binary),
+        "old_encode_us": bench(lambda: str({"clock": clock, "sender": 0}).encode(), number),
+        "new_encode_us": bench(lambda: wire.encode_bss(0, clock), number),
+        "old_decode_us": bench(lambda: eval(text.decode()), number),
+        "new_decode_us": bench(lambda: wire.decode_bss(binary), number),
+    }
+
+
+def ses_case(n, entries, number):
+    message_data = {
+        "sender": 0,
+        "epoch": 0,
+        "clock": list(range(1, n + 1)),
+        "message": "hello",
+    }
+    s_buffer = {}
+    for i in range(entries):
+        s_buffer.setdefault(i % n, {})[(i * 7 + i // n) % n] = i
+    message_data["s_buffer"] = flatten_s_buffer(s_buffer)
+    pickled = pickle.dumps(message_data)
+    binary = wire.encode_ses(message_data)
+    assert wire.decode_ses(binary) == pickle.loads(pickled)
+    return {
+        "old_bytes": len(pickled),
+        "new_bytes": len(binary),
+        "old_encode_us": bench(lambda: pickle.dumps(message_data), number),
+        "new_encode_us": bench(lambda: wire.encode_ses(message_data), number),
+        "old_decode_us": bench(lambda: pickle.loads(pickled), number),
+        "new_decode_us": bench(lambda: wire.decode_ses(binary), number),
+    }
+
+
+def report(label, result, target):
+    encode_speedup = result["old_encode_us"] / result["new_encode_us"]
+    decode_speedup = result["old_decode_us"] / result["new_decode_us"]
+    met = encode_speedup >= target and decode_speedup >= target
+    print(
+        f"{label:<28} bytes {result['old_bytes']:>8} -> {result['new_bytes']:<8}"
+        f" encode {result['old_encode_us']:>9.1f} -> {result['new_encode_us']:<8.1f} us ({encode_speedup:5.1f}x)"
+        f" decode {result['old_decode_us']:>9.1f} -> {result['new_decode_us']:<8.1f} us ({decode_speedup:5.1f}x)"
+        f"  {target:.0f}x target {'met' if met else 'NOT met'}"
+    )
+    return met
+
+
+def main():
+    results = []
+    print("BSS: str/eval vs wire")
+    for n in (3, 100, 1000, 10000):
+        results.append(report(f"  N={n}", bss_case(n, 2000 if n < 1000 else 50), BSS_TARGET))
+    print(f"{BSS_TARGET:.0f}x target met in {sum(results)} of {len(results)} BSS cases")
+    results = []
+    print("SES: pickle vs wire")
+    # 450 entries over 50 destinations is the steady-state S-buffer of a 50-process all-to-all run
+    for n, entries in ((3, 3), (50, 450), (100, 100), (1000, 1000), (1000, 0)):
+        results.append(report(f"  N={n} s_buffer={entries}", ses_case(n, entries, 2000 if n < 1000 else 200), SES_TARGET))
+    print(f"Parity met in {sum(results)} of {len(results)} SES cases")
+
+
+if __name__ == "__main__":
+    main()
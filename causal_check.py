@@ -0,0 +1,152 @@
+"""Offline check that no process delivered a message before a causal predecessor.
+
+Input is, per process, the messages it delivered in delivery order: each
+message's sender and the vector timestamp it carried. For a matrix clock
+the vector is the diagonal, which counts each process's own events. With
+s the sender of m, m happened before m' exactly when V(m)[s] <= V(m')[s].
+So the delivery at position j is premature if some later delivery i has
+
+    V_i[s_i] <= V_j[s_i]
+
+In other words, it fails if V_j reaches, in some column s, the smallest
+"own" stamp V_i[s_i] among the later deliveries whose sender is s. Those
+suffix minima come from one reverse np.minimum.accumulate over a
+(deliveries x processes) array, taken in blocks to bound memory. The whole
+check is then one comparison against V, with no pairwise loops. Python
+only runs again to name the offending pair for each violation found.
+
+    python3 causal_check.py run.trace            # one trace for a simulated group
+    python3 causal_check.py traces/node-*.trace  # one trace per node
+"""
+import argparse
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+import event_trace
+
+Violation = namedtuple("Violation", "process position early predecessor")
+# early / predecessor are (sender, stamp) pairs identifying the two messages:
+# `early` was delivered at `position` although `predecessor` happened before it
+# and was only delivered afterwards.
+
+NEVER = np.iinfo(np.int64).max
+
+
+def check_process(senders, clocks, process=None, block=65536, limit=None):
+    """Returns the Violations in one process's deliveries.
+
+    `senders` is a length-K int array and `clocks` a K x N int array of the
+    vector timestamps, both in delivery order.
+    """
+    senders = np.asarray(senders, dtype=np.int64)
+    clocks = np.asarray(clocks, dtype=np.int64)
+    count, total = clocks.shape
+    rows = np.arange(count)
+    own = clocks[rows, senders]
+
+    # Walk the deliveries backwards in blocks, carrying the minimum own
+    # stamp per sender seen after the block.
+    premature = []
+    later = np.full(total, NEVER, dtype=np.int64)
+    for end in range(count, 0, -block):
+        start = max(0, end - block)
+        stamps = np.full((end - start, total), NEVER, dtype=np.int64)
+        stamps[rows[start:end] - start, senders[start:end]] = own[start:end]
+        suffix = np.minimum.accumulate(stamps[::-1], axis=0)[::-1]
+        # Row j needs the minimum over deliveries strictly after j.
+        after = np.empty_like(suffix)
+        after[:-1] = suffix[1:]
+        after[-1] = later
+        np.minimum(after, later, out=after)
+        later = np.minimum(later, suffix[0])
+        hits = np.flatnonzero((clocks[start:end] >= after).any(axis=1))
+        premature.extend((start + hits).tolist())
+
+    premature.sort()
+    if limit is not None:
+        premature = premature[:limit]
+    violations = []
+    for position in premature:
+        # Name the earliest later delivery that the early one depended on.
+        tail = slice(position + 1, count)
+        depends = clocks[position, senders[tail]] >= own[tail]
+        offender = position + 1 + int(np.argmax(depends))
+        violations.append(Violation(
+            process, position,
+            (int(senders[position]), int(own[position])),
+            (int(senders[offender]), int(own[offender])),
+        ))
+    return violations
+
+
+def vector_clocks(clocks):
+    """Vector timestamps for a batch of clocks: matrices are reduced to their diagonal."""
+    clocks = np.asarray(clocks, dtype=np.int64)
+    if clocks.ndim == 3:
+        return np.diagonal(clocks, axis1=1, axis2=2)
+    return clocks
+
+
+def check(deliveries, limit=None):
+    """Checks {process: (senders, clocks)} and returns all Violations, by process."""
+    violations = []
+    for process in sorted(deliveries):
+        senders, clocks = deliveries[process]
+        if len(senders):
+            violations.extend(check_process(senders, vector_clocks(clocks), process, limit=limit))
+    return violations
+
+
+def deliveries_from_traces(paths):
+    """Collects {process: (senders, clocks)} from the DELIVER events of trace files."""
+    collected = defaultdict(lambda: ([], []))
+    for path in paths:
+        with event_trace.TraceReader(path) as reader:
+            table = reader.as_array()
+            if table is not None:
+                # Fixed-size records: select with one mask per process, no per-record Python.
+                delivered = table[table["event"] == event_trace.DELIVER]
+                clocks = delivered["clock"]
+                if len(delivered) and delivered["shape"][0] == event_trace.SHAPE_MATRIX:
+                    n = int(round(clocks.shape[1] ** 0.5))
+                    clocks = clocks.reshape(-1, n, n)
+                for process in np.unique(delivered["process"]).tolist():
+                    mask = delivered["process"] == process
+                    collected[process][0].append(delivered["peer"][mask].astype(np.int64))
+                    collected[process][1].append(vector_clocks(clocks[mask]))
+                continue
+            per_process = defaultdict(lambda: ([], []))
+            for event in reader.events(event=event_trace.DELIVER):
+                per_process[event.process][0].append(event.peer)
+                clock = event.clock
+                per_process[event.process][1].append(np.diagonal(clock) if clock.ndim == 2 else clock)
+            for process, (senders, clocks) in per_process.items():
+                collected[process][0].append(np.asarray(senders, dtype=np.int64))
+                collected[process][1].append(np.array(clocks, dtype=np.int64))
+    return {
+        process: (np.concatenate(senders), np.concatenate(clocks))
+        for process, (senders, clocks) in collected.items()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check delivery traces for causal-order violations.")
+    parser.add_argument("paths", nargs="+", help="trace files written by event_trace.TraceWriter")
+    parser.add_argument("--limit", type=int, default=20, help="violations to report per process")
+    args = parser.parse_args(argv)
+
+    deliveries = deliveries_from_traces(args.paths)
+    violations = check(deliveries, limit=args.limit)
+    checked = sum(len(senders) for senders, _ in deliveries.values())
+    print(f"checked {checked} deliveries at {len(deliveries)} processes: {len(violations)} violations")
+    for violation in violations:
+        print(
+            f"  P{violation.process} delivery #{violation.position}: message {violation.early} "
+            f"was delivered before its predecessor {violation.predecessor}"
+        )
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
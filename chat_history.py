@@ -0,0 +1,284 @@
+"""Append-only, paged on-disk history of delivered chat messages.
+
+Messages are numbered by delivery order (`seq`, starting at 0) and appended
+to segment files of bounded size. Next to every segment an index file
+stores one fixed-width offset per message:
+
+    segment-<first seq>.log   record = seq (u64) | sender (u32) | stamp (u64)
+                                       | room length (u16) | content length (u32)
+                                       | room (UTF-8) | content (UTF-8)
+    segment-<first seq>.idx   offset of each record in the .log (u64)
+    stamps-<sender>-<room>.idx  stamp (u64) | seq (u64) of every message from
+                                `sender` in `room` (hex UTF-8, empty = direct)
+
+Finding a message takes a bisect over the segment start numbers and one read
+from the index, so `last(k)` and `after(seq, limit)` cost O(page size)
+however long the history is. A sender's stamps only grow within a room, so
+`since(clock, limit)`, the messages delivered after everything a clock covers,
+bisects the stamp files first. Only the last `tail_size` entries, the list of
+segment start numbers and at most `max_open_stamps` stamp files, the most
+recently used, stay open.
+
+Appends are flushed and fsynced every `batch_size` messages and on `close()`;
+a crash loses at most the last unsynced batch. Opening the history cuts a
+torn tail left by such a crash: the last segment keeps its complete records,
+its index is rebuilt from them, and the stamp files are cut or completed to
+match. A message whose stamp is not above the last one stored for its sender
+and room is a delivery repeated by journal recovery and is not stored again.
+"""
+import bisect
+import os
+import struct
+from collections import OrderedDict, deque, namedtuple
+
+RECORD = struct.Struct("<QIQHI")
+OFFSET = struct.Struct("<Q")
+STAMP = struct.Struct("<QQ")
+
+HistoryEntry = namedtuple("HistoryEntry", "seq sender stamp room content")
+
+
+class ChatHistory:
+    """Delivered-message store for one participant, kept in `directory`."""
+
+    def __init__(self, directory, segment_bytes=4 << 20, tail_size=100, batch_size=64, max_open_stamps=64):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.max_open_stamps = max_open_stamps
+        self.unsynced = 0
+        # Append handles of the stamp files, least recently used first, and the
+        # last stamp in each, keyed by (sender, room)
+        self.stamp_files = OrderedDict()
+        self.last_stamps = {}
+        # Stamp files closed since the last fsync, to be synced by flush()
+        self.closed_stamps = set()
+        self.tail = deque(maxlen=tail_size)
+        os.makedirs(directory, exist_ok=True)
+        self.starts = sorted(
+            int(name[len("segment-"):-len(".log")])
+            for name in os.listdir(directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+        self.log = self.index = None
+        self.count = 0
+        if self.starts:
+            last = self.starts[-1]
+            self.count = self.recover(last)
+            self.open_segment(last)
+            self.tail.extend(self.read_range(max(0, self.count - tail_size), self.count))
+
+    def path(self, start, suffix):
+        return os.path.join(self.directory, f"segment-{start:012d}{suffix}")
+
+    def stamp_path(self, sender, room):
+        return os.path.join(self.directory, f"stamps-{sender}-{room.encode().hex()}.idx")
+
+    def recover(self, start):
+        """Cuts a torn tail off the last segment, `start`, and returns the message count.
+
+        Appends since the last fsync all belong to the last segment, so only
+        its tail can be torn. The log is cut after its last complete record
+        and the index is rebuilt from the records kept. Stamp entries of
+        messages that were cut off are dropped, and entries that were lost
+        are restored from the log.
+        """
+        offsets = []
+        records = []
+        with open(self.path(start, ".log"), "r+b") as log:
+            size = os.fstat(log.fileno()).st_size
+            offset = 0
+            while offset + RECORD.size <= size:
+                seq, sender, stamp, room_length, content_length = RECORD.unpack(log.read(RECORD.size))
+                end = offset + RECORD.size + room_length + content_length
+                if seq != start + len(offsets) or end > size:
+                    break
+                room = log.read(room_length).decode()
+                log.seek(end)
+                offsets.append(offset)
+                records.append((seq, self.stamp_path(sender, room), stamp))
+                offset = end
+            log.truncate(offset)
+        count = start + len(offsets)
+        index_path = self.path(start, ".idx")
+        if os.path.getsize(index_path) != len(offsets) * OFFSET.size:
+            with open(index_path, "wb") as index:
+                index.write(b"".join(OFFSET.pack(offset) for offset in offsets))
+        last_seqs = {}
+        for name in os.listdir(self.directory):
+            if not (name.startswith("stamps-") and name.endswith(".idx")):
+                continue
+            path = os.path.join(self.directory, name)
+            with open(path, "r+b") as handle:
+                entries = os.fstat(handle.fileno()).st_size // STAMP.size
+                while entries:
+                    handle.seek((entries - 1) * STAMP.size)
+                    seq = STAMP.unpack(handle.read(STAMP.size))[1]
+                    if seq < count:
+                        break
+                    entries -= 1
+                else:
+                    seq = -1
+                handle.truncate(entries * STAMP.size)
+            last_seqs[path] = seq
+        for seq, path, stamp in records:
+            if last_seqs.get(path, -1) < seq:
+                with open(path, "ab") as handle:
+                    handle.write(STAMP.pack(stamp, seq))
+        return count
+
+    def open_segment(self, start):
+        if self.log is not None:
+            self.flush()
+            self.log.close()
+            self.index.close()
+        self.log = open(self.path(start, ".log"), "ab")
+        self.index = open(self.path(start, ".idx"), "ab")
+
+    def append(self, sender, stamp, content, room=""):
+        """Stores one delivered message and returns its sequence number."""
+        stamps = self.stamp_file(sender, room)
+        if stamps.tell() and stamp <= self.last_stamp(sender, room):
+            return self.position(sender, stamp, room)
+        if not self.starts or self.log.tell() >= self.segment_bytes:
+            self.starts.append(self.count)
+            self.open_segment(self.count)
+        room_bytes = room.encode()
+        content_bytes = content.encode()
+        seq = self.count
+        self.index.write(OFFSET.pack(self.log.tell()))
+        self.log.write(RECORD.pack(seq, sender, stamp, len(room_bytes), len(content_bytes)))
+        self.log.write(room_bytes)
+        self.log.write(content_bytes)
+        stamps.write(STAMP.pack(stamp, seq))
+        self.last_stamps[sender, room] = stamp
+        self.count += 1
+        self.tail.append(HistoryEntry(seq, sender, stamp, room, content))
+        self.unsynced += 1
+        if self.unsynced >= self.batch_size:
+            self.flush()
+        return seq
+
+    def stamp_file(self, sender, room):
+        """The append handle of a stamp file, closing the least recently used past `max_open_stamps`."""
+        key = sender, room
+        stamps = self.stamp_files.get(key)
+        if stamps is not None:
+            self.stamp_files.move_to_end(key)
+            return stamps
+        if len(self.stamp_files) >= self.max_open_stamps:
+            _, evicted = self.stamp_files.popitem(last=False)
+            evicted.close()
+            self.closed_stamps.add(evicted.name)
+        stamps = self.stamp_files[key] = open(self.stamp_path(sender, room), "ab")
+        return stamps
+
+    def last_stamp(self, sender, room):
+        stamp = self.last_stamps.get((sender, room))
+        if stamp is None:
+            with open(self.stamp_path(sender, room), "rb") as handle:
+                handle.seek((os.fstat(handle.fileno()).st_size // STAMP.size - 1) * STAMP.size)
+                stamp = self.last_stamps[sender, room] = STAMP.unpack(handle.read(STAMP.size))[0]
+        return stamp
+
+    def flush(self):
+        """Writes out and fsyncs every append so far."""
+        if self.log is None:
+            return
+        for handle in (self.log, self.index, *self.stamp_files.values()):
+            handle.flush()
+            os.fsync(handle.fileno())
+        for path in self.closed_stamps:
+            descriptor = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+        self.closed_stamps.clear()
+        self.unsynced = 0
+
+    def last(self, k):
+        """The last `k` messages, oldest first."""
+        return self.read_range(max(0, self.count - k), self.count)
+
+    def after(self, seq, limit):
+        """Up to `limit` messages delivered after message `seq`, oldest first."""
+        return self.read_range(seq + 1, min(self.count, seq + 1 + limit))
+
+    def position(self, sender, stamp, room=""):
+        """Sequence number of the last message from `sender` in `room` with a stamp <= `stamp`, or -1."""
+        stamps = self.stamp_files.get((sender, room))
+        if stamps is not None:
+            stamps.flush()
+        try:
+            handle = open(self.stamp_path(sender, room), "rb")
+        except FileNotFoundError:
+            return -1
+        with handle:
+            low, high = 0, os.fstat(handle.fileno()).st_size // STAMP.size
+            while low < high:
+                middle = (low + high) // 2
+                handle.seek(middle * STAMP.size)
+                if STAMP.unpack(handle.read(STAMP.size))[0] <= stamp:
+                    low = middle + 1
+                else:
+                    high = middle
+            if not low:
+                return -1
+            handle.seek((low - 1) * STAMP.size)
+            return STAMP.unpack(handle.read(STAMP.size))[1]
+
+    def since(self, clock, limit, room=""):
+        """Up to `limit` messages delivered after every message `clock` covers, oldest first.
+
+        `clock` maps a sender to the highest stamp of theirs already seen in
+        `room`, like a row of the matrix clock or a room vector clock.
+        """
+        return self.after(max((self.position(sender, stamp, room) for sender, stamp in clock.items()), default=-1), limit)
+
+    def read_range(self, first, end):
+        if first >= end:
+            return []
+        if first >= self.count - len(self.tail):
+            skip = first - (self.count - len(self.tail))
+            return [self.tail[i] for i in range(skip, skip + end - first)]
+        if self.log is not None:
+            self.log.flush()
+            self.index.flush()
+        entries = []
+        seq = first
+        while seq < end:
+            start = self.starts[bisect.bisect_right(self.starts, seq) - 1]
+            following = bisect.bisect_right(self.starts, seq)
+            stop = min(end, self.starts[following] if following < len(self.starts) else end)
+            entries.extend(self.read_segment(start, seq, stop))
+            seq = stop
+        return entries
+
+    def read_segment(self, start, first, stop):
+        with open(self.path(start, ".idx"), "rb") as index:
+            index.seek((first - start) * OFFSET.size)
+            (offset,) = OFFSET.unpack(index.read(OFFSET.size))
+        entries = []
+        with open(self.path(start, ".log"), "rb") as log:
+            log.seek(offset)
+            for _ in range(stop - first):
+                seq, sender, stamp, room_length, content_length = RECORD.unpack(log.read(RECORD.size))
+                room = log.read(room_length).decode()
+                content = log.read(content_length).decode()
+                entries.append(HistoryEntry(seq, sender, stamp, room, content))
+        return entries
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.log is not None:
+            self.flush()
+            self.log.close()
+            self.index.close()
+            self.log = self.index = None
+        for stamps in self.stamp_files.values():
+            stamps.close()
+        self.stamp_files.clear()
+        self.last_stamps.clear()
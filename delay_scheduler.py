@@ -0,0 +1,164 @@
+import heapq
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DelayScheduler:
+    """Runs callbacks at their due time from a single background dispatcher.
+
+    Callers never block: `schedule` pushes the callback onto a heap ordered by
+    due time and returns immediately. With `fifo=True`, callbacks scheduled on
+    the same link never overtake each other even if their delays differ.
+
+    The dispatcher only releases callbacks. Those scheduled on a link run in
+    order on that link's own sender thread, so a callback that blocks (e.g. a
+    send to a dead peer waiting out its connect timeout) delays its own link
+    and no other.
+    """
+
+    def __init__(self, fifo=False):
+        self.fifo = fifo
+        self.heap = []
+        self.counter = itertools.count()
+        self.link_due = {}
+        self.condition = threading.Condition()
+        # link -> queue of released (callback, args), served by its own thread
+        self.senders = {}
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        with self.condition:
+            if self.thread is None:
+                self.running = True
+                self.thread = threading.Thread(target=self.dispatch, daemon=True)
+                self.thread.start()
+
+    def schedule(self, delay, callback, *args, link=None):
+        """Runs `callback(*args)` after `delay` seconds."""
+        self.start()
+        due = time.monotonic() + delay
+        with self.condition:
+            if self.fifo and link is not None:
+                due = max(due, self.link_due.get(link, due))
+                self.link_due[link] = due
+            heapq.heappush(self.heap, (due, next(self.counter), callback, args, link))
+            self.condition.notify()
+
+    def dispatch(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    if self.heap:
+                        wait = self.heap[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self.condition.wait(wait)
+                    else:
+                        self.condition.wait()
+                if not self.running:
+                    return
+                _, _, callback, args, link = heapq.heappop(self.heap)
+                if link is not None:
+                    self.sender_for(link).put((callback, args))
+                    continue
+            self.run(callback, args)
+
+    def sender_for(self, link):
+        """The queue of `link`'s sender thread, started on first use; call with the condition held."""
+        sender = self.senders.get(link)
+        if sender is None:
+            sender = self.senders[link] = queue.SimpleQueue()
+            threading.Thread(target=self.serve_link, args=(sender,), daemon=True).start()
+        return sender
+
+    def serve_link(self, sender):
+        while True:
+            item = sender.get()
+            if item is None:
+                return
+            self.run(*item)
+
+    def run(self, callback, args):
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.warning("Scheduled callback failed: %s", e)
+
+    def pending(self):
+        """Returns the number of callbacks waiting to run."""
+        with self.condition:
+            return len(self.heap) + sum(sender.qsize() for sender in self.senders.values())
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            for sender in self.senders.values():
+                sender.put(None)
+            self.condition.notify()
+
+
+# Channel delay models. Each is called as model(source, target) and returns
+# the delay in seconds for one transmission on that link.
+
+class FixedDelay:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, source, target):
+        return self.seconds
+
+
+class UniformDelay:
+    def __init__(self, low, high, seed=None):
+        self.low = low
+        self.high = high
+        self.rng = random.Random(seed)
+
+    def __call__(self, source, target):
+        return self.rng.uniform(self.low, self.high)
+
+
+class ExponentialDelay:
+    def __init__(self, mean, seed=None):
+        self.mean = mean
+        self.rng = random.Random(seed)
+
+    def __call__(self, source, target):
+        return self.rng.expovariate(1.0 / self.mean) if self.mean > 0 else 0.0
+
+
+class PerLinkDelay:
+    """Looks delays up per (source, target) link, falling back to `default`."""
+
+    def __init__(self, links, default=FixedDelay(0)):
+        self.links = links
+        self.default = default
+
+    def __call__(self, source, target):
+        delay = self.links.get((source, target))
+        if delay is None:
+            return self.default(source, target)
+        return delay(source, target) if callable(delay) else delay
+
+
+class ReorderingDelay:
+    """Wraps another model and holds back a fraction of messages, reordering them."""
+
+    def __init__(self, base, probability, extra, seed=None):
+        self.base = base
+        self.probability = probability
+        self.extra = extra
+        self.rng = random.Random(seed)
+
+    def __call__(self, source, target):
+        delay = self.base(source, target)
+        if self.rng.random() < self.probability:
+            delay += self.rng.uniform(0, self.extra)
+        return delay
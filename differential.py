@@ -0,0 +1,54 @@
+"""Differential clock piggybacking in the style of Singhal and Kshemkalyani.
+
+Instead of attaching the whole clock to every message, a sender attaches only
+the (index, value) pairs that changed since its last message to the same
+destination. The sender keeps one "last update" stamp per clock entry and one
+"last sent" stamp per destination, so its bookkeeping is O(clock size)
+regardless of how many peers it talks to. Channels must be FIFO, because each
+delta is relative to the previous message on the same channel. When a message
+may have been lost, reset(destination) makes the next delta carry every entry
+that was ever set, which rebuilds the receiver's copy from scratch.
+
+Clocks are handled as flat int64 arrays; matrix clocks are flattened.
+"""
+import numpy as np
+
+
+class DeltaEncoder:
+    def __init__(self, size):
+        self.current = np.zeros(size, dtype=np.int64)
+        self.last_update = np.zeros(size, dtype=np.int64)
+        self.last_sent = {}
+        self.stamp = 0
+
+    def encode(self, destination, clock):
+        """Returns (indices, values) of the entries `destination` has not seen yet."""
+        flat = np.asarray(clock, dtype=np.int64).reshape(-1)
+        changed = flat != self.current
+        if changed.any():
+            self.stamp += 1
+            self.last_update[changed] = self.stamp
+            self.current[changed] = flat[changed]
+        indices = np.flatnonzero(self.last_update > self.last_sent.get(destination, 0))
+        self.last_sent[destination] = self.stamp
+        return indices, flat[indices]
+
+    def reset(self, destination):
+        """Forgets what `destination` has seen, e.g. after a failed send or a reconnect."""
+        self.last_sent.pop(destination, None)
+
+
+class DeltaDecoder:
+    def __init__(self, size):
+        self.size = size
+        self.known = {}
+
+    def decode(self, source, indices, values):
+        """Rebuilds the full clock attached by `source` from its latest delta."""
+        base = self.known.get(source)
+        if base is None:
+            base = self.known[source] = np.zeros(self.size, dtype=np.int64)
+        base[indices] = values
+        clock = base.copy()
+        clock.flags.writeable = False
+        return clock
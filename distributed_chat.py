@@ -1,173 +1,363 @@
-import copy
+import argparse
+import logging
+import os
+import sys
 
-def format_matrix(matrix):
-    """Return a string representation of a matrix clock in a readable format."""
-    rows = []
-    for i, row in enumerate(matrix):
-        row_str = ", ".join(f"P{j}={val}" for j, val in enumerate(row))
-        rows.append(f"Row P{i}: [{row_str}]")
-    return "\n           ".join(rows)
+import numpy as np
+
+import event_trace
+from chat_history import ChatHistory
+from clocks import blocking_entry, is_duplicate, trace_clock
+from matrix_member import MatrixMember, MatrixText, format_matrix
+from pending_buffer import PendingBuffer
+
+logger = logging.getLogger(__name__)
 
 class ChatMessage:
-    def __init__(self, sender, content, matrix_clock):
+    def __init__(self, sender, content, matrix_clock, epoch=0):
         self.sender = sender      # Sender's process ID
         self.content = content    # Chat message content
-        # Attach a deep copy of the sender's matrix clock at send time
-        self.matrix_clock = copy.deepcopy(matrix_clock)
+        self.epoch = epoch        # Membership epoch the clock was stamped in
+        # Attach a read-only snapshot of the sender's matrix clock at send time
+        self.matrix_clock = matrix_clock.snapshot()
     
     def __str__(self):
         return f"ChatMessage from P{self.sender}: '{self.content}', Matrix Clock:\n           {format_matrix(self.matrix_clock)}"
 
-class ChatParticipant:
-    def __init__(self, pid, total_participants):
-        self.pid = pid
-        self.total = total_participants
-        # Initialize the matrix clock: an n x n matrix with all entries 0.
-        self.matrix_clock = [[0 for _ in range(total_participants)] for _ in range(total_participants)]
-        # Queue for messages waiting for delivery (due to causal constraints)
-        self.message_queue = []
-        # Log of delivered messages (chat history for the participant)
-        self.delivered_messages = []
+class ChatRoom:
+    """A named group of participants; multicasts to the room are delivered in causal order."""
+    def __init__(self, name, members):
+        self.name = name
+        self.members = sorted(set(members))
+        # Position of each member in the room's vector clocks
+        self.index = {pid: i for i, pid in enumerate(self.members)}
+
+class RoomMessage:
+    def __init__(self, sender, room, content, room_clock):
+        self.sender = sender      # Sender's process ID
+        self.room = room          # Name of the room it was multicast to
+        self.content = content    # Chat message content
+        # Read-only snapshot of the sender's room vector, shared by every recipient
+        self.room_clock = room_clock
     
-    def local_event(self):
-        # Simulate a local event (e.g., user typing or internal state update)
-        self.matrix_clock[self.pid][self.pid] += 1
-        print(f"\n[ChatParticipant P{self.pid}] -- Local Event Occurred --")
-        print(f"   Updated Matrix Clock:\n           {format_matrix(self.matrix_clock)}")
+    def __str__(self):
+        return f"RoomMessage from P{self.sender} to #{self.room}: '{self.content}', Room Clock: {self.room_clock.tolist()}"
+
+class ChatParticipant(MatrixMember):
+    """A chat participant: matrix-clock direct messages (see matrix_member.py) plus rooms."""
+    role = "ChatParticipant"
+    noun = "Chat Message"
+    group = "participants"
+    message_class = ChatMessage
+
+    def __init__(self, pid, total_participants, history_dir=None, history_tail=100, sparse=False, members=None):
+        # The journal covers the matrix clock, not the rooms
+        self.init_member(pid, total_participants, sparse, members)
+        # Log of delivered messages (chat history for the participant). With a
+        # history directory the full history goes to disk instead, and the
+        # store keeps the most recent messages in memory itself.
+        self.history = None
+        self.delivered_messages = []
+        if history_dir is not None:
+            self.history = ChatHistory(os.path.join(history_dir, f"P{pid}"), tail_size=history_tail)
+            self.delivered_messages = None
+        # Rooms this participant belongs to, each with its own vector clock of
+        # delivered multicasts and its own queue of blocked ones
+        self.rooms = {}
+        self.room_clocks = {}
+        self.room_queues = {}
     
     def send_chat_message(self, content, recipient):
-        # Before sending, record a local event to capture the send event.
-        self.local_event()
-        msg = ChatMessage(self.pid, content, self.matrix_clock)
-        print(f"\n[ChatParticipant P{self.pid}] -- Sending Chat Message --")
-        print(f"   Message: '{content}'")
-        print(f"   To: ChatParticipant P{recipient.pid}")
-        print(f"   Attached Matrix Clock:\n           {format_matrix(msg.matrix_clock)}")
+        msg = self.create_chat_message(content, recipient.pid)
         recipient.receive_chat_message(msg)
     
+    def create_chat_message(self, content, recipient_pid):
+        # Before sending, record a local event to capture the send event.
+        self.local_event(recipient_pid)
+        msg = ChatMessage(self.pid, content, self.matrix_clock, epoch=self.members.epoch)
+        self.metrics.incr("messages_sent")
+        if self.tracer is not None:
+            self.tracer.record(event_trace.SEND, self.pid, recipient_pid, trace_clock(msg.matrix_clock))
+        self.metrics.incr("bytes_sent", msg.matrix_clock.nbytes)
+        logger.info("\n[ChatParticipant P%s] -- Sending Chat Message --\n   Message: '%s'\n   To: ChatParticipant P%s\n"
+                    "   Attached Matrix Clock:\n           %s", self.pid, content, recipient_pid, MatrixText(msg.matrix_clock))
+        return msg
+    
     def receive_chat_message(self, message):
-        print(f"\n[ChatParticipant P{self.pid}] -- Chat Message Received --")
-        print(f"   {message}")
-        self.message_queue.append(message)
-        self.try_deliver_messages()
-    
-    def try_deliver_messages(self):
-        delivered_any = True
-        while delivered_any:
-            delivered_any = False
-            # Iterate over a copy of the queue to attempt delivery.
-            for msg in self.message_queue[:]:
-                if self.can_deliver(msg):
-                    self.message_queue.remove(msg)
-                    self.deliver_message(msg)
-                    delivered_any = True
-    
-    def can_deliver(self, message):
-        """
-        Delivery condition based on the sender's row in the matrix clock:
-        For a message sent by process i (sender):
-           - The sender's own counter in the message's matrix (matrix[i][i]) 
-             must equal self.matrix_clock[i][i] + 1.
-           - For every other process k (k != i), the message's matrix[i][k] 
-             must be <= self.matrix_clock[i][k].
-        This ensures that all causally preceding events from sender i have been delivered.
-        """
-        sender = message.sender
-        if message.matrix_clock[sender][sender] != self.matrix_clock[sender][sender] + 1:
-            return False
-        for k in range(self.total):
-            if k != sender and message.matrix_clock[sender][k] > self.matrix_clock[sender][k]:
-                return False
+        self.receive(message)
+    
+    def join_room(self, room):
+        self.rooms[room.name] = room
+        self.room_clocks[room.name] = np.zeros(len(room.members), dtype=np.int64)
+        self.room_queues[room.name] = PendingBuffer()
+    
+    def create_room_message(self, content, room_name):
+        """Stamps one multicast for the room; the same message goes to every member."""
+        room = self.rooms[room_name]
+        clock = self.room_clocks[room_name]
+        clock[room.index[self.pid]] += 1
+        snapshot = clock.copy()
+        snapshot.flags.writeable = False
+        msg = RoomMessage(self.pid, room_name, content, snapshot)
+        if self.tracer is not None:
+            self.tracer.record(event_trace.SEND, self.pid, event_trace.BROADCAST, snapshot)
+        self.metrics.incr("messages_sent", len(room.members) - 1)
+        self.metrics.incr("bytes_sent", snapshot.nbytes * (len(room.members) - 1))
+        logger.info("\n[ChatParticipant P%s] -- Multicasting to #%s --\n   Message: '%s'\n   Room Clock: %s",
+                    self.pid, room_name, content, snapshot)
+        return msg
+    
+    def send_room_message(self, content, room_name, participants):
+        """Multicasts `content` to the other members of the room; `participants` is indexed by pid."""
+        msg = self.create_room_message(content, room_name)
+        for pid in self.rooms[room_name].members:
+            if pid != self.pid:
+                participants[pid].receive_room_message(msg)
+        return msg
+    
+    def receive_room_message(self, message):
+        self.metrics.incr("messages_received")
+        self.metrics.incr("bytes_received", message.room_clock.nbytes)
+        logger.info("\n[ChatParticipant P%s] -- Room Message Received --\n   %s", self.pid, message)
+        if self.tracer is not None:
+            self.tracer.record(event_trace.RECEIVE, self.pid, message.sender, message.room_clock)
+        room = self.rooms[message.room]
+        if is_duplicate(self.room_clocks[message.room], message.room_clock, room.index[message.sender]):
+            logger.info("Discarded duplicate Room Message from ChatParticipant P%s", message.sender)
+            self.metrics.incr("messages_discarded")
+            return
+        blocked = blocking_entry(self.room_clocks[message.room], message.room_clock, room.index[message.sender])
+        if blocked is None:
+            self.deliver_room_messages(message)
+        else:
+            queue = self.room_queues[message.room]
+            queue.park(blocked, message)
+            self.parked_at[id(message)] = self.metrics.now()
+            self.metrics.incr("messages_buffered")
+            self.metrics.observe("buffer_depth", len(queue))
+            if self.tracer is not None:
+                self.tracer.record(event_trace.BUFFER, self.pid, message.sender, message.room_clock)
+    
+    def deliver_room_messages(self, message):
+        # A delivery advances exactly one entry of the room clock, so only the
+        # messages parked on that (index, value) pair can have become deliverable.
+        room = self.rooms[message.room]
+        clock = self.room_clocks[message.room]
+        queue = self.room_queues[message.room]
+        ready = [message]
+        while ready:
+            message = ready.pop()
+            sender = room.index[message.sender]
+            parked_at = self.parked_at.pop(id(message), None)
+            if is_duplicate(clock, message.room_clock, sender):
+                # A second copy of a message that was delivered meanwhile
+                self.metrics.incr("messages_discarded")
+                continue
+            clock[sender] = message.room_clock[sender]
+            if parked_at is not None:
+                self.metrics.observe("time_in_buffer", self.metrics.now() - parked_at)
+            self.deliver_room_message(message)
+            for waiting in queue.release((sender, int(clock[sender]))):
+                if is_duplicate(clock, waiting.room_clock, room.index[waiting.sender]):
+                    ready.append(waiting)  # discarded when popped
+                    continue
+                blocked = blocking_entry(clock, waiting.room_clock, room.index[waiting.sender])
+                if blocked is None:
+                    ready.append(waiting)
+                else:
+                    queue.park(blocked, waiting)
+    
+    def deliver_room_message(self, message):
+        room = self.rooms[message.room]
+        self.record_delivery(message, int(message.room_clock[room.index[message.sender]]), message.room)
+        self.metrics.incr("messages_delivered")
+        if self.tracer is not None:
+            self.tracer.record(event_trace.DELIVER, self.pid, message.sender, message.room_clock)
+        if self.on_deliver is not None:
+            self.on_deliver(message)
+        logger.info("\n[ChatParticipant P%s] -- Delivered Room Message --\n   %s\n   Room Clock: %s",
+                    self.pid, message, self.room_clocks[message.room])
+    
+    def close(self):
+        """Writes out and closes the on-disk chat history, if any."""
+        if self.history is not None:
+            self.history.close()
+    
+    def record_delivery(self, message, stamp, room=""):
+        """Adds a delivered message to the chat history; `stamp` is the sender's own counter."""
+        if self.history is not None:
+            self.history.append(message.sender, stamp, message.content, room)
+        else:
+            self.delivered_messages.append(message)
+
+PRINT_HISTORY = 10
+
+def print_history(entries):
+    if not entries:
+        print("      None")
+    for entry in entries:
+        room = f" #{entry.room}" if entry.room else ""
+        print(f"      [{entry.seq}] P{entry.sender}{room} (stamp {entry.stamp}): '{entry.content}'")
+
+def execute_command(participants, cmd):
+    """Run one simulation command; returns False when the simulation should stop."""
+    if not cmd:
         return True
+    parts = cmd.split()
+    command = parts[0].lower()
+    
+    if command == "quit":
+        print("\nExiting simulation. Goodbye!")
+        return False
+    
+    elif command == "local":
+        if len(parts) != 2:
+            print("Usage: local <pid>")
+            return True
+        pid = int(parts[1])
+        if pid < 0 or pid >= len(participants):
+            print("Invalid participant id.")
+            return True
+        print("-" * 60)
+        participants[pid].local_event()
+        print("-" * 60)
+    
+    elif command == "send":
+        if len(parts) < 4:
+            print("Usage: send <sender> <recipient> <message>")
+            return True
+        sender = int(parts[1])
+        recipient = int(parts[2])
+        if sender < 0 or sender >= len(participants) or recipient < 0 or recipient >= len(participants):
+            print("Invalid sender or recipient id.")
+            return True
+        msg = " ".join(parts[3:])
+        print("-" * 60)
+        participants[sender].send_chat_message(msg, participants[recipient])
+        print("-" * 60)
+    
+    elif command == "room":
+        if len(parts) < 4:
+            print("Usage: room <name> <pid> <pid> [<pid> ...]")
+            return True
+        name = parts[1]
+        members = [int(pid) for pid in parts[2:]]
+        if any(pid < 0 or pid >= len(participants) for pid in members):
+            print("Invalid participant id.")
+            return True
+        room = ChatRoom(name, members)
+        for pid in room.members:
+            participants[pid].join_room(room)
+        print(f"Created room #{name} with participants {room.members}.")
+    
+    elif command == "multicast":
+        if len(parts) < 4:
+            print("Usage: multicast <sender> <room> <message>")
+            return True
+        sender = int(parts[1])
+        name = parts[2]
+        if sender < 0 or sender >= len(participants) or name not in participants[sender].rooms:
+            print("Invalid sender or room.")
+            return True
+        msg = " ".join(parts[3:])
+        print("-" * 60)
+        participants[sender].send_room_message(msg, name, participants)
+        print("-" * 60)
+    
+    elif command == "history":
+        if (len(parts) not in (2, 3, 5) or (len(parts) == 5 and parts[3] != "after")) and (len(parts) < 5 or parts[3] != "since"):
+            print("Usage: history <pid> [<count> [after <seq> | since [#<room>] <sender>=<stamp> ...]]")
+            return True
+        pid = int(parts[1])
+        if pid < 0 or pid >= len(participants):
+            print("Invalid participant id.")
+            return True
+        history = participants[pid].history
+        if history is None:
+            print("No chat history store; start the simulation with --history-dir.")
+            return True
+        count = int(parts[2]) if len(parts) > 2 else PRINT_HISTORY
+        print("-" * 60)
+        print(f"Chat history of P{pid} ({len(history)} messages):")
+        if parts[3:4] == ["since"]:
+            room = parts[4][1:] if parts[4].startswith("#") else ""
+            clock = dict(map(int, pair.split("=")) for pair in parts[5 if room else 4:])
+            print_history(history.since(clock, count, room))
+        elif len(parts) == 5:
+            print_history(history.after(int(parts[4]), count))
+        else:
+            print_history(history.last(count))
+        print("-" * 60)
     
-    def deliver_message(self, message):
-        # Update the local matrix clock: perform element-wise maximum.
-        for i in range(self.total):
-            for j in range(self.total):
-                self.matrix_clock[i][j] = max(self.matrix_clock[i][j], message.matrix_clock[i][j])
-        self.delivered_messages.append(message)
-        print(f"\n[ChatParticipant P{self.pid}] -- Delivered Chat Message --")
-        print(f"   {message}")
-        print(f"   Updated Matrix Clock:\n           {format_matrix(self.matrix_clock)}")
+    elif command == "print":
+        print("-" * 60)
+        for part in participants:
+            print(f"Participant P{part.pid}:")
+            print(f"   Matrix Clock:\n           {format_matrix(part.matrix_clock)}")
+            if part.history is not None:
+                print(f"   Delivered Chat Messages (last {PRINT_HISTORY} of {len(part.history)}):")
+                print_history(part.history.last(PRINT_HISTORY))
+            else:
+                print("   Delivered Chat Messages:")
+                if part.delivered_messages:
+                    for m in part.delivered_messages:
+                        print(f"      {m}")
+                else:
+                    print("      None")
+            if part.message_queue:
+                print("   Pending Message Queue:")
+                for m in part.message_queue:
+                    print(f"      {m}")
+            else:
+                print("   Pending Message Queue: None")
+            for name, queue in part.room_queues.items():
+                print(f"   Room #{name} Clock: {part.room_clocks[name].tolist()}, {len(queue)} pending")
+                for m in queue:
+                    print(f"      {m}")
+            print("-" * 40)
+        print("-" * 60)
+    
+    else:
+        print("Unknown command. Available commands: local, send, room, multicast, history, print, quit.")
+    
+    return True
 
-def simulation():
+def simulation(history_dir=None):
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     print("=" * 60)
     print("Welcome to the Distributed Chat Simulation (Matrix Clock-based Causal Ordering)!")
     print("=" * 60)
     
     total = int(input("Enter number of chat participants: "))
-    participants = [ChatParticipant(pid, total) for pid in range(total)]
+    participants = [ChatParticipant(pid, total, history_dir=history_dir) for pid in range(total)]
     
     print("\nCommands:")
     print("  local <pid>                      - Participant <pid> performs a local event.")
     print("  send <sender> <recipient> <msg>  - Participant <sender> sends a chat message <msg> to Participant <recipient>.")
+    print("  room <name> <pid> <pid> ...      - Create a chat room with the given participants.")
+    print("  multicast <sender> <room> <msg>  - Participant <sender> sends <msg> to everyone in <room>.")
+    print("  history <pid> [<n> [after <seq>]] - Page through a participant's stored chat history.")
+    print("  history <pid> <n> since [#<room>] <sender>=<stamp> ...")
+    print("                                   - The same, starting after every message a clock covers.")
     print("  print                            - Print current matrix clocks and delivered chat messages for all participants.")
     print("  quit                             - Exit simulation.")
     print("=" * 60)
     
-    while True:
-        try:
-            cmd = input("\nEnter command: ").strip()
-            if not cmd:
-                continue
-            parts = cmd.split()
-            command = parts[0].lower()
-            
-            if command == "quit":
-                print("\nExiting simulation. Goodbye!")
+    try:
+        while True:
+            try:
+                cmd = input("\nEnter command: ").strip()
+                if not execute_command(participants, cmd):
+                    break
+            except EOFError:
                 break
-            
-            elif command == "local":
-                if len(parts) != 2:
-                    print("Usage: local <pid>")
-                    continue
-                pid = int(parts[1])
-                if pid < 0 or pid >= total:
-                    print("Invalid participant id.")
-                    continue
-                print("-" * 60)
-                participants[pid].local_event()
-                print("-" * 60)
-            
-            elif command == "send":
-                if len(parts) < 4:
-                    print("Usage: send <sender> <recipient> <message>")
-                    continue
-                sender = int(parts[1])
-                recipient = int(parts[2])
-                if sender < 0 or sender >= total or recipient < 0 or recipient >= total:
-                    print("Invalid sender or recipient id.")
-                    continue
-                msg = " ".join(parts[3:])
-                print("-" * 60)
-                participants[sender].send_chat_message(msg, participants[recipient])
-                print("-" * 60)
-            
-            elif command == "print":
-                print("-" * 60)
-                for part in participants:
-                    print(f"Participant P{part.pid}:")
-                    print(f"   Matrix Clock:\n           {format_matrix(part.matrix_clock)}")
-                    print("   Delivered Chat Messages:")
-                    if part.delivered_messages:
-                        for m in part.delivered_messages:
-                            print(f"      {m}")
-                    else:
-                        print("      None")
-                    if part.message_queue:
-                        print("   Pending Message Queue:")
-                        for m in part.message_queue:
-                            print(f"      {m}")
-                    else:
-                        print("   Pending Message Queue: None")
-                    print("-" * 40)
-                print("-" * 60)
-            
-            else:
-                print("Unknown command. Available commands: local, send, print, quit.")
-        
-        except Exception as e:
-            print("Error:", e)
+            except Exception as e:
+                print("Error:", e)
+    finally:
+        for participant in participants:
+            participant.close()
 
 if __name__ == "__main__":
-    simulation()
+    parser = argparse.ArgumentParser(description="Interactive matrix-clock chat simulation.")
+    parser.add_argument("--history-dir", help="store each participant's delivered messages on disk here")
+    simulation(parser.parse_args().history_dir)
@@ -0,0 +1,223 @@
+"""Append-only binary traces of send, receive, buffer and deliver events.
+
+A trace file is a short file header followed by fixed-layout records:
+
+    file   = magic b"CTRC" | version (u16)
+    record = size (u32) | event (u8) | shape (u8) | process (u32) | peer (u32)
+             | time (f64) | count (u32) | count x clock value (i64)
+
+all little-endian. `size` covers the whole record, so a reader can skip
+records without looking at their clocks. `shape` is SHAPE_VECTOR or
+SHAPE_MATRIX (an n x n clock stored row by row); the matrix-clock processes
+record only the diagonal of their clocks, as a vector, through
+clocks.trace_clock. `peer` is the other
+process involved: the destination of a send and the sender of a received,
+buffered or delivered message. A BSS broadcast or a chat-room multicast is
+recorded once with peer = BROADCAST. Chat-room events carry the room's vector
+clock, whose entries follow the room's member order, so a trace of one room
+whose members are 0 .. n - 1 can be checked by causal_check.py.
+
+Processes trace when their `tracer` attribute is set to a TraceWriter:
+
+    writer = TraceWriter("run.trace")
+    process.tracer = writer
+    ...
+    writer.close()
+
+    with TraceReader("run.trace") as reader:
+        for event in reader.events(event=DELIVER, process=3):
+            print(event.time, event.peer, event.clock)
+
+The writer packs records into an in-memory buffer and writes it out in large
+chunks. The reader memory-maps the file and decodes records one at a time, so
+traces larger than memory can be filtered.
+
+    python3 event_trace.py run.trace --event deliver --process 3
+"""
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+MAGIC = b"CTRC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sH")
+RECORD = struct.Struct("<IBBIIdI")
+
+SEND = 1
+RECEIVE = 2
+BUFFER = 3
+DELIVER = 4
+EVENT_NAMES = {SEND: "send", RECEIVE: "receive", BUFFER: "buffer", DELIVER: "deliver"}
+
+SHAPE_VECTOR = 0
+SHAPE_MATRIX = 1
+
+BROADCAST = 0xFFFFFFFF
+
+TraceEvent = namedtuple("TraceEvent", "time event process peer clock")
+
+
+def record_dtype(count):
+    """NumPy dtype of one record whose clock holds `count` values."""
+    return np.dtype([
+        ("size", "<u4"), ("event", "u1"), ("shape", "u1"), ("process", "<u4"), ("peer", "<u4"),
+        ("time", "<f8"), ("count", "<u4"), ("clock", "<i8", (count,)),
+    ])
+
+
+class TraceWriter:
+    """Buffers trace records and appends them to `path`; safe to share between threads."""
+
+    def __init__(self, path, buffer_size=1 << 20, clock=time.time):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.file = open(path, "ab")
+        self.buffer = bytearray()
+        if self.file.tell() == 0:
+            self.buffer += FILE_HEADER.pack(MAGIC, VERSION)
+
+    def record(self, event, process, peer, clock):
+        """Appends one event; `clock` is a list of ints or a 1-D / 2-D NumPy array."""
+        if isinstance(clock, np.ndarray):
+            shape = SHAPE_MATRIX if clock.ndim == 2 else SHAPE_VECTOR
+            data = clock.astype(np.int64, copy=False).tobytes()
+        else:
+            shape = SHAPE_VECTOR
+            data = array("q", clock).tobytes()
+        header = RECORD.pack(RECORD.size + len(data), event, shape, process, peer, self.clock(), len(data) >> 3)
+        with self.lock:
+            self.buffer += header
+            self.buffer += data
+            if len(self.buffer) >= self.buffer_size:
+                self.file.write(self.buffer)
+                self.buffer.clear()
+
+    def flush(self):
+        with self.lock:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TraceReader:
+    """Memory-maps a trace file and decodes its records lazily.
+
+    Clocks are NumPy views into the mapping, valid until the reader is closed;
+    copy any clock that has to outlive it.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if size:
+            magic, version = FILE_HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} trace file")
+
+    def records(self):
+        """Yields (offset, size, event, shape, process, peer, time, count) for every record."""
+        buf = self.map
+        end = len(buf)
+        offset = FILE_HEADER.size if end else 0
+        unpack_from = RECORD.unpack_from
+        while offset + RECORD.size <= end:
+            size, event, shape, process, peer, stamp, count = unpack_from(buf, offset)
+            if offset + size > end:
+                break  # a record cut short by a crash
+            yield offset, size, event, shape, process, peer, stamp, count
+            offset += size
+
+    def as_array(self):
+        """Returns every record as one zero-copy structured NumPy array, or None.
+
+        This only works when all records have the same clock size, which is
+        the case for a trace of one group; otherwise use `events()`.
+        """
+        buf = self.map
+        if len(buf) < FILE_HEADER.size + RECORD.size:
+            return None
+        size = RECORD.unpack_from(buf, FILE_HEADER.size)[0]
+        body = len(buf) - FILE_HEADER.size
+        if body % size:
+            return None
+        table = np.frombuffer(buf, dtype=record_dtype((size - RECORD.size) >> 3), count=body // size, offset=FILE_HEADER.size)
+        if not (table["size"] == size).all():
+            return None
+        return table
+
+    def events(self, event=None, process=None, peer=None):
+        """Yields the TraceEvents matching every filter that is not None."""
+        for offset, _, kind, shape, proc, other, stamp, count in self.records():
+            if event is not None and kind != event:
+                continue
+            if process is not None and proc != process:
+                continue
+            if peer is not None and other != peer:
+                continue
+            clock = np.frombuffer(self.map, dtype="<i8", count=count, offset=offset + RECORD.size)
+            if shape == SHAPE_MATRIX:
+                n = int(round(count ** 0.5))
+                clock = clock.reshape(n, n)
+            yield TraceEvent(stamp, kind, proc, other, clock)
+
+    def __iter__(self):
+        return self.events()
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            try:
+                self.map.close()
+            except BufferError:
+                pass  # clocks handed out still point into the mapping
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print or count the events in a trace file.")
+    parser.add_argument("path")
+    parser.add_argument("--event", choices=sorted(EVENT_NAMES.values()))
+    parser.add_argument("--process", type=int)
+    parser.add_argument("--peer", type=int)
+    parser.add_argument("--count", action="store_true", help="only print the number of matching events")
+    args = parser.parse_args(argv)
+
+    codes = {name: code for code, name in EVENT_NAMES.items()}
+    with TraceReader(args.path) as reader:
+        matching = reader.events(codes.get(args.event), args.process, args.peer)
+        if args.count:
+            print(sum(1 for _ in matching))
+            return
+        for event in matching:
+            peer = "all" if event.peer == BROADCAST else event.peer
+            clock = event.clock.tolist()
+            print(f"{event.time:.6f} P{event.process} {EVENT_NAMES[event.event]:<7} peer={peer} clock={clock}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Credit-based flow control between BSS / SES senders and receivers.
+
+Each sender may have at most `window` messages outstanding at each
+receiver. A message stays outstanding from the moment it is sent until the
+receiver delivers (or discards) it, so a receiver holds at most `window`
+undelivered messages per sender. Its pending buffers are then bounded by
+window * (n - 1), however bursty or reordered the traffic is.
+
+    receiver: CreditLedger   counts the messages still held per sender and
+                             the credits owed back; the process reports to it
+                             through its `flow` attribute
+    sender:   CreditWindow   the credits left per destination; sending
+                             waits for a credit
+
+Credits only hold back new sends. A buffered message waits for causal
+predecessors, which were sent before it and are already in flight, so
+withholding credits cannot deadlock the group. When no credit comes back
+for `stall_timeout` seconds, a predecessor is probably lost or stuck. The
+stall policy is "wait", which logs the stall and keeps waiting, or "raise",
+which raises CreditStall to the code that sends.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+STALL_POLICIES = ("wait", "raise")
+
+
+class CreditStall(TimeoutError):
+    """No credit came back from `destination` within the stall timeout."""
+
+    def __init__(self, destination, waited):
+        super().__init__(f"no credit from process {destination} for {waited:.1f} s")
+        self.destination = destination
+        self.waited = waited
+
+
+class CreditLedger:
+    """Receiver side: messages held per sender and credits owed back to it.
+
+    `peak_per_sender` is the most messages ever held from any one sender,
+    bounded by the window; `peak_held` is the most held from all senders at
+    once, bounded by window * (n - 1).
+
+    Credits are returned in batches of a quarter window, and at once when
+    nothing from that sender is held any more, so a blocked sender always
+    hears back.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.batch = max(1, window // 4)
+        self.held = defaultdict(int)
+        self.owed = defaultdict(int)
+        self.total_held = 0
+        self.peak_held = 0
+        self.peak_per_sender = 0
+
+    def received(self, sender):
+        self.held[sender] += 1
+        if self.held[sender] > self.peak_per_sender:
+            self.peak_per_sender = self.held[sender]
+        self.total_held += 1
+        if self.total_held > self.peak_held:
+            self.peak_held = self.total_held
+
+    def released(self, sender):
+        """A message from `sender` was delivered or discarded."""
+        if self.held[sender] > 0:  # not so for messages replayed from a journal
+            self.held[sender] -= 1
+            self.total_held -= 1
+        self.owed[sender] += 1
+
+    def take_grants(self):
+        """Returns {sender: credits} due now and forgets them."""
+        grants = {
+            sender: count for sender, count in self.owed.items()
+            if count >= self.batch or not self.held[sender]
+        }
+        for sender in grants:
+            del self.owed[sender]
+        return grants
+
+    def occupancy(self):
+        """Undelivered messages held per sender."""
+        return {sender: count for sender, count in self.held.items() if count}
+
+
+class CreditWindow:
+    """Sender side: credits left per destination, to be awaited before each send."""
+
+    def __init__(self, window, stall_timeout=None, stall_policy="wait", metrics=None):
+        if stall_policy not in STALL_POLICIES:
+            raise ValueError(f"Unknown stall policy: {stall_policy}")
+        self.window = window
+        self.stall_timeout = stall_timeout
+        self.stall_policy = stall_policy
+        self.metrics = metrics
+        self.available = defaultdict(lambda: window)
+        self.changed = asyncio.Condition()
+
+    async def acquire(self, destination):
+        """Takes one credit for `destination`, waiting for one if none is left."""
+        if self.available[destination] > 0:
+            self.available[destination] -= 1
+            return
+        if self.metrics is not None:
+            self.metrics.incr("credit_waits")
+        waited = 0.0
+        async with self.changed:
+            while True:
+                try:
+                    await asyncio.wait_for(
+                        self.changed.wait_for(lambda: self.available[destination] > 0), self.stall_timeout
+                    )
+                    break
+                except asyncio.TimeoutError:
+                    waited += self.stall_timeout
+                    if self.metrics is not None:
+                        self.metrics.incr("credit_stalls")
+                    logger.warning("No credit from process %s for %.1f s; a causal predecessor may be lost",
+                                   destination, waited)
+                    if self.stall_policy == "raise":
+                        raise CreditStall(destination, waited)
+            self.available[destination] -= 1
+
+    async def grant(self, destination, count):
+        async with self.changed:
+            self.available[destination] += count
+            self.changed.notify_all()
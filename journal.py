@@ -0,0 +1,220 @@
+"""Checkpoints and a write-ahead log of clock-changing events, for crash recovery.
+
+A journal is a directory of generation files, journal-<generation>.log.
+Each generation starts with a checkpoint of the process's state, ends the
+checkpoint with a CHECKPOINT record, and then logs every clock-changing
+event before it is applied:
+
+    record = kind (u8) | payload length (u32) | CRC-32 of the payload (u32) | payload
+
+    STATE      clock (and S-buffer) of the process and the stamp of its last
+               send to each peer, see its journal_state()
+    RECEIVE    a received message, re-handled on replay; the checkpoint also
+               lists the buffered messages this way
+    LOCAL      a local clock step: a BSS broadcast, an SES send, a matrix
+               clock local event or send (with its recipient)
+    CHECKPOINT end of the checkpoint; a file without it is ignored
+    MEMBERSHIP a join, leave or compaction, or in a checkpoint the whole
+               membership view (see membership.py)
+
+Every `checkpoint_every` events the journal writes a new generation and
+deletes the old one, so recovery reads one checkpoint and at most
+`checkpoint_every` events however long the node has run:
+
+    journal = Journal("state/P3")
+    journal.recover(process)   # replays the latest generation, then logs new events
+    ...
+    journal.close()
+
+Records are buffered and fsynced in batches: after `sync_every` records, or
+once the oldest unsynced record is `sync_interval` seconds old. A crash can
+lose at most that batch of received messages, the same as losing them in
+transit. LOCAL records are synced before the call returns, because a
+message stamped by them is about to leave the node, and a recovered node
+must never reuse a stamp a peer has already seen; sync_local=False batches
+them too, trading that guarantee for throughput. MEMBERSHIP records are
+always synced, so a recovered node never falls back to an earlier view.
+The per-link state of differential piggybacking is not journaled, so
+journaled processes send full clocks.
+"""
+import os
+import struct
+import threading
+import time
+import zlib
+
+RECORD = struct.Struct("<BII")
+
+STATE = 1
+RECEIVE = 2
+LOCAL = 3
+CHECKPOINT = 4
+MEMBERSHIP = 5
+
+
+def read_records(path):
+    """Yields the (kind, payload) records of one journal file, stopping at a torn or corrupt tail."""
+    with open(path, "rb") as log:
+        data = log.read()
+    view = memoryview(data)
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        kind, length, crc = RECORD.unpack_from(data, offset)
+        start = offset + RECORD.size
+        payload = bytes(view[start:start + length])
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield kind, payload
+        offset = start + length
+
+
+class WriteAheadLog:
+    """An append-only record file with batched fsync; safe to share between threads."""
+
+    def __init__(self, path, sync_every=64, sync_interval=0.05):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.file = open(path, "ab")
+        self.pending = bytearray()
+        self.unsynced = 0
+        self.oldest = None
+
+    def append(self, kind, payload, sync=False):
+        with self.lock:
+            self.pending += RECORD.pack(kind, len(payload), zlib.crc32(payload))
+            self.pending += payload
+            self.unsynced += 1
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            if sync or self.unsynced >= self.sync_every or time.monotonic() - self.oldest >= self.sync_interval:
+                self.sync_locked()
+
+    def sync(self):
+        with self.lock:
+            self.sync_locked()
+
+    def sync_locked(self):
+        if self.pending:
+            self.file.write(self.pending)
+            self.pending.clear()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.oldest = None
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+class Journal:
+    """Checkpoints and logs the clock state of one BSS, SES, matrix-clock or chat process.
+
+    The process provides journal_state(), a list of (kind, payload) records
+    that rebuild its state, and replay(kind, payload), which applies one
+    record. Processes log their events through their `journal` attribute.
+    """
+
+    def __init__(self, directory, checkpoint_every=10000, sync_every=64, sync_interval=0.05, sync_local=True):
+        self.directory = directory
+        self.checkpoint_every = checkpoint_every
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.sync_local = sync_local
+        self.process = None
+        self.log = None
+        self.generation = 0
+        self.events = 0
+        self.checkpoints = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, generation):
+        return os.path.join(self.directory, f"journal-{generation:08d}.log")
+
+    def generations(self):
+        return sorted(
+            int(name[len("journal-"):-len(".log")])
+            for name in os.listdir(self.directory)
+            if name.startswith("journal-") and name.endswith(".log")
+        )
+
+    def recover(self, process):
+        """Restores `process` from the latest complete generation and attaches the journal.
+
+        Returns the number of logged events replayed after the checkpoint.
+        Delivery callbacks, tracing and flow control are off during the
+        replay, since the deliveries it repeats already happened before the
+        crash.
+        """
+        if getattr(process, "differential", False):
+            raise ValueError("differential clock piggybacking is not journaled")
+        replayed = 0
+        for generation in reversed(self.generations()):
+            records = list(read_records(self.path(generation)))
+            if (CHECKPOINT, b"") not in records:
+                continue  # a checkpoint cut short by the crash
+            on_deliver, tracer, flow = process.on_deliver, process.tracer, getattr(process, "flow", None)
+            process.on_deliver = process.tracer = process.flow = None
+            try:
+                for kind, payload in records:
+                    if kind != CHECKPOINT:
+                        process.replay(kind, payload)
+            finally:
+                process.on_deliver, process.tracer, process.flow = on_deliver, tracer, flow
+            replayed = len(records) - records.index((CHECKPOINT, b"")) - 1
+            self.generation = generation
+            break
+        self.process = process
+        process.journal = self
+        # Start a new generation from the recovered state, so the replay is
+        # not repeated after the next crash.
+        self.checkpoint()
+        return replayed
+
+    def record(self, kind, payload=b""):
+        """Logs one event before the process applies it."""
+        if self.events >= self.checkpoint_every:
+            # The previous event has been applied, so the state is complete.
+            self.checkpoint()
+        self.log.append(kind, payload, sync=kind == MEMBERSHIP or (self.sync_local and kind == LOCAL))
+        self.events += 1
+
+    def checkpoint(self):
+        """Writes a new generation starting with the current state and drops the older ones."""
+        # Past any file left by a checkpoint the crash cut short
+        generation = max(self.generations() + [self.generation]) + 1
+        log = WriteAheadLog(self.path(generation), self.sync_every, self.sync_interval)
+        for kind, payload in self.process.journal_state():
+            log.append(kind, payload)
+        log.append(CHECKPOINT, b"", sync=True)
+        if self.log is not None:
+            self.log.close()
+        self.log = log
+        self.generation = generation
+        self.events = 0
+        self.checkpoints += 1
+        for old in self.generations():
+            if old < generation:
+                os.remove(self.path(old))
+        self.sync_directory()
+
+    def sync_directory(self):
+        """Makes the new generation file and the removals durable."""
+        if hasattr(os, "O_DIRECTORY"):
+            descriptor = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+
+    def sync(self):
+        self.log.sync()
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        if self.process is not None:
+            self.process.journal = None
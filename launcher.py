@@ -0,0 +1,424 @@
+"""Headless launcher for multi-node causal-ordering runs.
+
+The cluster is described by a JSON spec file and/or command-line flags:
+
+    {
+        "algorithm": "bss",            # bss | ses | matrix | chat
+        "nodes": 50,
+        "host": "127.0.0.1",
+        "base_port": 6000,             # or "ports": [6000, 6001, ...]
+        "delay": {"model": "uniform", "low": 0, "high": 0.01, "seed": 1},
+        "differential": false,
+        "sparse": false,               # matrix / chat: sparse matrix clocks
+        "workload": {"messages": 10, "interval": 0.0, "seed": 1, "burst": false},
+        "timeout": 30,
+        "startup_timeout": 30,         # seconds for every node to bind its port
+        "metrics_file": "metrics.jsonl",  # optional periodic per-node metrics dump
+        "metrics_interval": 5,
+        "trace_dir": "traces",            # optional: one binary event trace per node
+        "journal_dir": "state",           # optional: recover each node from / journal it to here
+        "window": 32,                     # optional (bss / ses): flow-control credits per link
+        "stall_timeout": 5,
+        "stall_policy": "wait"            # or "raise": fail the node's sends on a stall
+    }
+
+BSS and SES nodes are forked with multiprocessing, each serving its port on
+the asyncio runtime. The launcher waits until every listener is bound,
+starts the workload on all nodes at once, and collects per-node results.
+A node that dies, or fails to start or report in time, stops the run: the
+other nodes are terminated and NodeFailure is raised.
+Matrix-clock and chat runs are in-memory simulations and are driven in this
+process with the same workload.
+
+    python3 launcher.py --algorithm bss --nodes 50 --messages 20 --output results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+import distributed_chat
+import Matrix_clock
+from async_runtime import AsyncNode
+from BSS import Process
+from delay_scheduler import ExponentialDelay, FixedDelay, UniformDelay
+from event_trace import TraceWriter
+from journal import Journal
+from metrics import MetricsDumper
+from SES import SchiperEggliSandoz
+
+DEFAULT_SPEC = {
+    "algorithm": "bss",
+    "nodes": 3,
+    "host": "127.0.0.1",
+    "base_port": 6000,
+    "delay": {"model": "fixed", "seconds": 0},
+    "differential": False,
+    "sparse": False,
+    "workload": {"messages": 10, "interval": 0.0, "seed": 1, "burst": False},
+    "timeout": 30,
+    "startup_timeout": 30,
+    "metrics_file": None,
+    "metrics_interval": 5.0,
+    "trace_dir": None,
+    "journal_dir": None,
+    "window": None,
+    "stall_timeout": 5.0,
+    "stall_policy": "wait",
+    "verbose": False,
+}
+
+
+def load_spec(args):
+    """Merges the defaults, the optional spec file and any command-line overrides."""
+    spec = json.loads(json.dumps(DEFAULT_SPEC))
+    if args.spec:
+        with open(args.spec) as spec_file:
+            loaded = json.load(spec_file)
+        spec["workload"].update(loaded.pop("workload", {}))
+        spec.update(loaded)
+    for key in ("algorithm", "nodes", "host", "base_port", "timeout", "startup_timeout", "metrics_file", "metrics_interval", "trace_dir", "journal_dir", "window", "stall_timeout", "stall_policy"):
+        if getattr(args, key) is not None:
+            spec[key] = getattr(args, key)
+    for key in ("messages", "interval", "seed"):
+        if getattr(args, key) is not None:
+            spec["workload"][key] = getattr(args, key)
+    if args.delay is not None:
+        spec["delay"] = {"model": "fixed", "seconds": args.delay}
+    if args.differential:
+        spec["differential"] = True
+    if args.burst:
+        spec["workload"]["burst"] = True
+    if args.sparse:
+        spec["sparse"] = True
+    if args.verbose:
+        spec["verbose"] = True
+    if "ports" not in spec:
+        spec["ports"] = [spec["base_port"] + pid for pid in range(spec["nodes"])]
+    return spec
+
+
+def build_delay_model(delay, pid):
+    model = delay.get("model", "fixed")
+    seed = delay.get("seed")
+    seed = None if seed is None else seed * 7919 + pid
+    if model == "fixed":
+        return FixedDelay(delay.get("seconds", 0))
+    if model == "uniform":
+        return UniformDelay(delay.get("low", 0), delay.get("high", 0), seed=seed)
+    if model == "exponential":
+        return ExponentialDelay(delay.get("mean", 0), seed=seed)
+    raise ValueError(f"Unknown delay model: {model}")
+
+
+def ses_destinations(spec, sender):
+    """The destinations `sender` sends to; every node can recompute them."""
+    workload = spec["workload"]
+    rng = random.Random(workload["seed"] * 1000003 + sender)
+    peers = [pid for pid in range(spec["nodes"]) if pid != sender]
+    return [rng.choice(peers) for _ in range(workload["messages"])]
+
+
+def expected_deliveries(spec, pid):
+    if spec["algorithm"] == "bss":
+        return (spec["nodes"] - 1) * spec["workload"]["messages"]
+    return sum(
+        ses_destinations(spec, sender).count(pid) for sender in range(spec["nodes"]) if sender != pid
+    )
+
+
+async def run_node(spec, pid, ready, go, done, results):
+    ports = spec["ports"]
+    if spec["algorithm"] == "bss":
+        process = Process(
+            pid, spec["nodes"], ports[pid], ports,
+            delay_model=build_delay_model(spec["delay"], pid), differential=spec["differential"],
+        )
+    else:
+        process = SchiperEggliSandoz(pid, spec["nodes"], ports[pid], ports)
+    node = AsyncNode(process, spec["host"], window=spec["window"],
+                     stall_timeout=spec["stall_timeout"], stall_policy=spec["stall_policy"])
+    delivered = 0
+    expected = expected_deliveries(spec, pid)
+    all_delivered = asyncio.Event()
+
+    def count(*delivery):
+        nonlocal delivered
+        delivered += 1
+        if delivered >= expected:
+            all_delivered.set()
+
+    node.add_delivery_callback(count)
+    dumper = None
+    if spec["metrics_file"]:
+        dumper = MetricsDumper(process.metrics, spec["metrics_file"], spec["metrics_interval"], label=pid).start()
+    if spec["trace_dir"]:
+        process.tracer = TraceWriter(trace_path(spec, pid))
+    if spec["journal_dir"]:
+        Journal(os.path.join(spec["journal_dir"], f"node-{pid}")).recover(process)
+    if expected == 0:
+        all_delivered.set()
+    await node.start()
+
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, ready.wait)
+    await loop.run_in_executor(None, go.wait)
+
+    start = time.perf_counter()
+    workload = spec["workload"]
+    if spec["algorithm"] == "bss":
+        sends = (node.broadcast() for _ in range(workload["messages"]))
+    else:
+        sends = (
+            node.send_message(destination, f"message {i} from {pid}")
+            for i, destination in enumerate(ses_destinations(spec, pid))
+        )
+    bursting = []
+    for send in sends:
+        if workload["burst"]:
+            # Start the send without waiting for it, so messages pile up in flight
+            bursting.append(asyncio.ensure_future(send))
+        else:
+            await send
+        if workload["interval"]:
+            await asyncio.sleep(workload["interval"])
+    await asyncio.gather(*bursting)
+    try:
+        await asyncio.wait_for(all_delivered.wait(), spec["timeout"])
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - start
+
+    clock = process.pclock if spec["algorithm"] == "bss" else process.vector_clock
+    buffered = process.buffer if spec["algorithm"] == "bss" else process.message_buffer
+    results.put({
+        "pid": pid,
+        "delivered": delivered,
+        "expected": expected,
+        "buffered": len(buffered),
+        "peak_held": process.flow.peak_held if process.flow is not None else None,
+        "peak_held_per_sender": process.flow.peak_per_sender if process.flow is not None else None,
+        "clock": list(clock),
+        "elapsed": elapsed,
+        "metrics": process.metrics.snapshot(),
+    })
+    # Keep serving until every node has finished, since peers may still send.
+    await loop.run_in_executor(None, done.wait)
+    await node.close()
+    if dumper is not None:
+        dumper.stop()
+    if process.tracer is not None:
+        process.tracer.close()
+    if process.journal is not None:
+        process.journal.close()
+
+
+def trace_path(spec, pid):
+    os.makedirs(spec["trace_dir"], exist_ok=True)
+    return os.path.join(spec["trace_dir"], f"node-{pid}.trace")
+
+
+def node_main(spec, pid, ready, go, done, results):
+    configure_logging(spec)
+    asyncio.run(run_node(spec, pid, ready, go, done, results))
+
+
+def configure_logging(spec):
+    logging.basicConfig(level=logging.INFO if spec["verbose"] else logging.WARNING, format="%(message)s", stream=sys.stdout)
+
+
+class NodeFailure(RuntimeError):
+    """A node process died, or did not start or report its results in time."""
+
+
+POLL_INTERVAL = 0.1
+
+
+def check_workers(workers, reported=()):
+    """Raises NodeFailure if a node that has not reported its results has exited."""
+    for pid, worker in enumerate(workers):
+        if pid not in reported and worker.exitcode is not None:
+            raise NodeFailure(f"node {pid} exited with code {worker.exitcode}")
+
+
+def launch(spec):
+    """Forks one OS process per node, runs the workload and returns the results."""
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    ready = context.Barrier(spec["nodes"] + 1)
+    go = context.Event()
+    done = context.Event()
+    results = context.Queue()
+
+    started = time.perf_counter()
+    workers = [
+        context.Process(target=node_main, args=(spec, pid, ready, go, done, results), daemon=True)
+        for pid in range(spec["nodes"])
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        # Wait for every node to reach the barrier, watching for nodes that die
+        deadline = time.monotonic() + spec["startup_timeout"]
+        while ready.n_waiting < spec["nodes"]:
+            check_workers(workers)
+            if time.monotonic() > deadline:
+                raise NodeFailure(f"nodes did not start within {spec['startup_timeout']} s")
+            time.sleep(POLL_INTERVAL)
+        ready.wait(timeout=spec["startup_timeout"])
+        cold_start = time.perf_counter() - started
+        go.set()
+
+        # Sending takes up to messages x interval, then each node waits up to
+        # `timeout` for its deliveries before reporting.
+        workload = spec["workload"]
+        deadline = time.monotonic() + workload["messages"] * workload["interval"] + spec["timeout"] + spec["startup_timeout"]
+        collected = {}
+        while len(collected) < len(workers):
+            try:
+                result = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                check_workers(workers, collected)
+                if time.monotonic() > deadline:
+                    missing = sorted(set(range(len(workers))) - set(collected))
+                    raise NodeFailure(f"nodes {missing} did not report their results in time")
+                continue
+            collected[result["pid"]] = result
+    except (NodeFailure, threading.BrokenBarrierError) as e:
+        ready.abort()
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join(timeout=10)
+        if isinstance(e, NodeFailure):
+            raise
+        raise NodeFailure(f"nodes did not start within {spec['startup_timeout']} s") from e
+    done.set()
+    for worker in workers:
+        worker.join(timeout=10)
+    return {"spec": spec, "cold_start": cold_start, "nodes": [collected[pid] for pid in sorted(collected)]}
+
+
+def simulate(spec):
+    """Runs a matrix-clock or chat simulation in this process with the spec's workload."""
+    module = Matrix_clock if spec["algorithm"] == "matrix" else distributed_chat
+    if spec["algorithm"] == "matrix":
+        members = [
+            Matrix_clock.ProcessMC(pid, spec["nodes"], differential=spec["differential"], sparse=spec["sparse"])
+            for pid in range(spec["nodes"])
+        ]
+    else:
+        members = [distributed_chat.ChatParticipant(pid, spec["nodes"], sparse=spec["sparse"]) for pid in range(spec["nodes"])]
+    workload = spec["workload"]
+    rng = random.Random(workload["seed"])
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if not spec["verbose"]:
+            # execute_command still prints its separators around each command
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        if spec["trace_dir"]:
+            for member in members:
+                member.tracer = stack.enter_context(TraceWriter(trace_path(spec, member.pid)))
+        if spec["journal_dir"]:
+            for member in members:
+                journal = Journal(os.path.join(spec["journal_dir"], f"node-{member.pid}"))
+                journal.recover(member)
+                stack.callback(journal.close)
+        for i in range(workload["messages"]):
+            for sender in range(spec["nodes"]):
+                recipient = rng.choice([pid for pid in range(spec["nodes"]) if pid != sender])
+                module.execute_command(members, f"send {sender} {recipient} message {i} from {sender}")
+    elapsed = time.perf_counter() - start
+    return {
+        "spec": spec,
+        "cold_start": 0.0,
+        "nodes": [
+            {
+                "pid": member.pid,
+                "delivered": member.metrics.counter("messages_delivered"),
+                "buffered": len(member.message_queue),
+                "elapsed": elapsed,
+                "metrics": member.metrics.snapshot(),
+            }
+            for member in members
+        ],
+    }
+
+
+def summarize(report):
+    nodes = report["nodes"]
+    delivered = sum(node["delivered"] for node in nodes)
+    buffered = sum(node["buffered"] for node in nodes)
+    elapsed = max(node["elapsed"] for node in nodes)
+    spec = report["spec"]
+    print(f"{spec['algorithm']} with {spec['nodes']} nodes: cold start {report['cold_start']:.2f} s")
+    print(f"  delivered {delivered} messages in {elapsed:.2f} s ({delivered / elapsed if elapsed else 0:.0f}/s), {buffered} still buffered")
+    depths = [node["metrics"]["histograms"].get("buffer_depth", {}).get("max") or 0 for node in nodes]
+    print(f"  peak buffer depth {max(depths)}")
+    flow = [node for node in nodes if node.get("peak_held") is not None]
+    if flow:
+        window = spec["window"]
+        per_sender = max(node["peak_held_per_sender"] for node in flow)
+        total = max(node["peak_held"] for node in flow)
+        print(
+            f"  peak undelivered held from one sender {per_sender} (window {window}), "
+            f"from all senders {total} (bound window x (n - 1) = {window * (spec['nodes'] - 1)})"
+        )
+    missing = [node["pid"] for node in nodes if node.get("expected") is not None and node["delivered"] < node["expected"]]
+    if missing:
+        print(f"  nodes short of their expected deliveries: {missing}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Launch a headless causal-ordering cluster.")
+    parser.add_argument("--spec", help="JSON cluster spec file")
+    parser.add_argument("--algorithm", choices=["bss", "ses", "matrix", "chat"])
+    parser.add_argument("--nodes", type=int)
+    parser.add_argument("--host")
+    parser.add_argument("--base-port", dest="base_port", type=int)
+    parser.add_argument("--messages", type=int, help="messages sent by each node")
+    parser.add_argument("--interval", type=float, help="seconds between a node's messages")
+    parser.add_argument("--burst", action="store_true", help="start every send at once instead of one after another")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--delay", type=float, help="fixed channel delay in seconds")
+    parser.add_argument("--differential", action="store_true")
+    parser.add_argument("--sparse", action="store_true", help="sparse matrix clocks (matrix and chat)")
+    parser.add_argument("--timeout", type=float, help="seconds to wait for deliveries")
+    parser.add_argument("--startup-timeout", dest="startup_timeout", type=float, help="seconds for every node to start")
+    parser.add_argument("--verbose", action="store_true", help="log every send, receive and delivery")
+    parser.add_argument("--metrics-file", dest="metrics_file", help="append per-node metrics snapshots to this JSON-lines file")
+    parser.add_argument("--trace-dir", dest="trace_dir", help="write one binary event trace per node into this directory")
+    parser.add_argument("--window", type=int, help="flow-control credits per sender and receiver (bss / ses)")
+    parser.add_argument("--stall-timeout", dest="stall_timeout", type=float, help="seconds without credits before a stall is reported")
+    parser.add_argument("--stall-policy", dest="stall_policy", choices=["wait", "raise"], help="what a send does on a stall")
+    parser.add_argument("--journal-dir", dest="journal_dir", help="recover each node from, and journal it to, this directory")
+    parser.add_argument("--metrics-interval", dest="metrics_interval", type=float, help="seconds between metrics snapshots")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args)
+    configure_logging(spec)
+    if spec["algorithm"] in ("bss", "ses"):
+        try:
+            report = launch(spec)
+        except NodeFailure as e:
+            parser.exit(1, f"launcher: {e}\n")
+    else:
+        report = simulate(spec)
+    summarize(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
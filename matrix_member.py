@@ -0,0 +1,308 @@
+"""State and behaviour shared by the matrix-clock process and the chat participant.
+
+Matrix_clock.ProcessMC and distributed_chat.ChatParticipant both keep a
+matrix clock over a dynamic membership, buffer point-to-point messages until
+the sender-row condition holds, journal their clock changes and trace their
+events. MatrixMember holds all of that; the two classes add how messages are
+created and stored:
+
+    message_class        the message type rebuilt from journal records
+    unpack(message)      called on every message of the current epoch
+                         before it is handled, e.g. to decode a delta
+    record_delivery(message, stamp)
+                         stores a delivered message; `stamp` is the
+                         sender's own counter
+
+`role`, `noun` and `group` name the member, its messages and the group in
+log lines and errors. The journal payload codecs used by both live here too.
+"""
+import logging
+
+import event_trace
+import journal
+import membership
+import wire
+from clocks import MatrixClock, SparseMatrixClock, clock_from_cells, remap_snapshot, snapshot_cells, trace_clock
+from membership import Membership
+from metrics import Metrics
+from pending_buffer import PendingBuffer
+
+logger = logging.getLogger(__name__)
+
+
+def format_matrix(matrix):
+    """Return a string representation of a matrix clock in a readable format."""
+    rows = []
+    for i, row in enumerate(matrix):
+        row_str = ", ".join(f"P{j}={val}" for j, val in enumerate(row))
+        rows.append(f"Row P{i}: [{row_str}]")
+    return "\n           ".join(rows)
+
+
+class MatrixText:
+    """Formats a matrix clock only when a log record is actually rendered."""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __str__(self):
+        return format_matrix(self.matrix)
+
+
+def encode_journal_message(sender, content, snapshot):
+    """Encodes a message for the journal: sender, text and the non-zero cells of its clock."""
+    out = bytearray()
+    wire.encode_varint(sender, out)
+    text = content.encode("utf-8")
+    wire.encode_varint(len(text), out)
+    out += text
+    indices, values = snapshot_cells(snapshot)
+    wire.encode_array(indices.tolist(), out)
+    wire.encode_array(values.tolist(), out)
+    return bytes(out)
+
+
+def decode_journal_message(payload, total, sparse=False):
+    """Returns (sender, content, matrix clock) for a payload from encode_journal_message."""
+    view = memoryview(payload)
+    sender, offset = wire.decode_varint(view, 0)
+    length, offset = wire.decode_varint(view, offset)
+    content = str(view[offset:offset + length], "utf-8")
+    indices, offset = wire.decode_array(view, offset + length)
+    values, _ = wire.decode_array(view, offset)
+    return sender, content, clock_from_cells(total, indices, values, sparse)
+
+
+def encode_journal_state(last_sent, snapshot):
+    """Encodes a STATE record: the own counter at the last send to each peer, then the clock."""
+    out = bytearray()
+    wire.encode_array(list(last_sent), out)
+    wire.encode_array(list(last_sent.values()), out)
+    return bytes(out) + encode_journal_message(0, "", snapshot)
+
+
+def decode_journal_state(payload, total, sparse=False):
+    """Returns (last_sent, matrix clock) for a payload from encode_journal_state."""
+    view = memoryview(payload)
+    pids, offset = wire.decode_array(view, 0)
+    stamps, offset = wire.decode_array(view, offset)
+    _, _, clock = decode_journal_message(view[offset:], total, sparse)
+    return dict(zip(pids, stamps)), clock
+
+
+def encode_journal_local(recipient):
+    """Encodes a LOCAL record; a send names its recipient, a plain local event is empty."""
+    if recipient is None:
+        return b""
+    out = bytearray()
+    wire.encode_varint(recipient, out)
+    return bytes(out)
+
+
+class MatrixMember:
+    """Mixin: a group member that orders point-to-point messages with a matrix clock."""
+
+    role = "Process"
+    noun = "Message"
+    group = "processes"
+    message_class = None
+    # Differential piggybacking needs a fixed group; only ProcessMC offers it
+    differential = False
+
+    def init_member(self, pid, total, sparse, members):
+        self.pid = pid
+        # Interned process IDs of the group (see membership.py): row and column
+        # i belong to members.members[i]. A joining member starts from a copy
+        # of another member's view.
+        self.members = members if members is not None else Membership(range(total))
+        self.total = len(self.members)
+        self.slot = self.members.slot(pid)
+        self.sparse = sparse
+        # Initialize matrix clock: an n x n matrix with all entries 0. The sparse
+        # one only stores non-zero cells, for large groups with few active pairs.
+        self.matrix_clock = SparseMatrixClock(self.total) if sparse else MatrixClock(self.total)
+        # Queue for messages waiting for delivery (due to causal constraints),
+        # keyed by (sender, value of the sender's own counter they follow)
+        self.message_queue = PendingBuffer()
+        # Optional callable(message) invoked for every delivered message
+        self.on_deliver = None
+        self.metrics = Metrics()
+        # Time each buffered message was parked, keyed by id(message)
+        self.parked_at = {}
+        # Optional event_trace.TraceWriter recording this member's events
+        self.tracer = None
+        # Optional journal.Journal logging clock changes for crash recovery
+        self.journal = None
+        # Own counter at the last message sent to each recipient, for departure()
+        self.last_sent = {}
+        # Messages stamped in an epoch this member has not reached yet
+        self.early = []
+
+    def local_event(self, recipient_pid=None):
+        # Increment the local counter: row self.pid, column self.pid.
+        if self.journal is not None:
+            self.journal.record(journal.LOCAL, encode_journal_local(recipient_pid))
+        self.matrix_clock.tick(self.slot)
+        if recipient_pid is not None:
+            self.last_sent[recipient_pid] = self.matrix_clock.own(self.slot)
+        logger.info("\n[%s P%s] -- Local Event --\n   Updated Matrix Clock:\n           %s",
+                    self.role, self.pid, MatrixText(self.matrix_clock))
+
+    def unpack(self, message):
+        self.metrics.incr("bytes_received", message.matrix_clock.nbytes)
+
+    def receive(self, message):
+        """Handles one point-to-point message: delivers it, buffers it or discards it."""
+        if message.epoch != self.members.epoch:
+            if message.epoch > self.members.epoch:
+                # Stamped after a view change this member has not applied yet
+                self.early.append(message)
+                return
+            self.translate(message)
+        self.unpack(message)
+        if self.journal is not None:
+            self.journal.record(journal.RECEIVE, encode_journal_message(message.sender, message.content, message.matrix_clock))
+        self.metrics.incr("messages_received")
+        if self.tracer is not None:
+            self.tracer.record(event_trace.RECEIVE, self.pid, message.sender, trace_clock(message.matrix_clock))
+        logger.info("\n[%s P%s] -- %s Received --\n   %s", self.role, self.pid, self.noun, message)
+        sender = self.members.slots.get(message.sender)
+        if sender is None:
+            logger.info("Discarded %s from departed %s P%s", self.noun, self.role, message.sender)
+            self.metrics.incr("messages_discarded")
+        elif self.can_deliver(message):
+            self.deliver_message(message)
+        else:
+            self.message_queue.park((message.sender, int(message.matrix_clock[sender, sender]) - 1), message)
+            self.parked_at[id(message)] = self.metrics.now()
+            self.metrics.incr("messages_buffered")
+            self.metrics.observe("buffer_depth", len(self.message_queue))
+            if self.tracer is not None:
+                self.tracer.record(event_trace.BUFFER, self.pid, message.sender, trace_clock(message.matrix_clock))
+        self.try_deliver_messages()
+
+    def translate(self, message):
+        """Brings the clock of a message stamped in an older epoch into the current layout."""
+        message.matrix_clock = remap_snapshot(message.matrix_clock, self.members.sources(message.epoch))
+        message.epoch = self.members.epoch
+
+    def try_deliver_messages(self):
+        # Only messages that follow their sender's current counter can pass
+        # the delivery condition, so only those keys are looked at.
+        delivered_any = bool(self.message_queue)
+        while delivered_any:
+            delivered_any = False
+            for key in self.message_queue.keys():
+                sender, counter = key
+                if counter != self.matrix_clock.own(self.members.slots[sender]):
+                    continue
+                for msg in self.message_queue.peek(key):
+                    if self.can_deliver(msg):
+                        self.message_queue.remove(key, msg)
+                        self.metrics.observe("time_in_buffer", self.metrics.now() - self.parked_at.pop(id(msg)))
+                        self.deliver_message(msg)
+                        delivered_any = True
+                        break
+
+    def can_deliver(self, message):
+        """
+        Delivery condition based on the sender's row in the matrix clock:
+          Let i be the sender.
+          For message to be deliverable at process j (self), the following must hold:
+             - For the sender's own counter:
+                  message.matrix_clock[i][i] == self.matrix_clock[i][i] + 1
+             - For every other process k (k != i):
+                  message.matrix_clock[i][k] <= self.matrix_clock[i][k]
+        This ensures that all causally preceding events from sender i have been delivered.
+        """
+        return self.matrix_clock.can_deliver(message.matrix_clock, self.members.slots[message.sender])
+
+    def deliver_message(self, message):
+        # Upon delivery, update the local matrix clock by taking element-wise maximum.
+        self.matrix_clock.merge(message.matrix_clock)
+        sender = self.members.slots[message.sender]
+        self.record_delivery(message, int(message.matrix_clock[sender, sender]))
+        self.metrics.incr("messages_delivered")
+        if self.tracer is not None:
+            self.tracer.record(event_trace.DELIVER, self.pid, message.sender, trace_clock(message.matrix_clock))
+        if self.on_deliver is not None:
+            self.on_deliver(message)
+        logger.info("\n[%s P%s] -- Delivered %s --\n   %s\n   Updated Matrix Clock:\n           %s",
+                    self.role, self.pid, self.noun, message, MatrixText(self.matrix_clock))
+
+    def join_member(self, pid):
+        """Adds member `pid` to the group; it starts from a zero matrix clock."""
+        if self.differential:
+            raise ValueError("differential clock piggybacking needs a fixed group")
+        if self.journal is not None:
+            self.journal.record(journal.MEMBERSHIP, membership.encode_change(membership.JOIN, [pid]))
+        self.members.join(pid)
+        self.remap(list(range(self.total)) + [None])
+
+    def departure(self):
+        """{peer: own counter at the last message sent to it}, for the peers' leave_member."""
+        return {pid: self.last_sent.get(pid, 0) for pid in self.members.live() if pid != self.pid}
+
+    def leave_member(self, pid, stamp):
+        """Marks `pid` as departed after its last message here, stamped `stamp`."""
+        if self.journal is not None:
+            self.journal.record(journal.MEMBERSHIP, membership.encode_change(membership.LEAVE, [pid], stamp))
+        self.members.leave(pid, stamp)
+
+    def is_stable(self, pid):
+        """Whether `pid` has departed and its last message here has been delivered."""
+        stamp = self.members.departed.get(pid)
+        return stamp is not None and self.matrix_clock.own(self.members.slot(pid)) >= stamp
+
+    def compact_members(self, pids):
+        """Reclaims the rows and columns of departed `pids`, which must be stable at every member."""
+        if self.differential:
+            raise ValueError("differential clock piggybacking needs a fixed group")
+        unstable = [pid for pid in pids if not self.is_stable(pid)]
+        if unstable:
+            raise ValueError(f"{self.group} {unstable} have not departed or still have undelivered messages")
+        if self.journal is not None:
+            self.journal.record(journal.MEMBERSHIP, membership.encode_change(membership.COMPACT, pids))
+        for pid in pids:
+            self.last_sent.pop(pid, None)
+        self.remap(self.members.compact(pids))
+
+    def remap(self, sources):
+        """Renumbers the matrix clock and the queued messages' clocks for the new epoch."""
+        self.total = len(self.members)
+        self.slot = self.members.slot(self.pid)
+        self.matrix_clock.remap(sources)
+        for msg in self.message_queue:
+            if msg.epoch != self.members.epoch:  # a message may be queued at several members
+                self.translate(msg)
+        early, self.early = self.early, []
+        for msg in early:
+            self.receive(msg)
+
+    def adopt_view(self, members):
+        """Takes over a whole membership view, as a journal checkpoint holds it."""
+        self.members = members
+        self.total = len(members)
+        self.slot = members.slot(self.pid)
+
+    def journal_state(self):
+        """Records that rebuild the membership, the matrix clock, the last sends and the queued messages (see journal.py)."""
+        records = [
+            (journal.MEMBERSHIP, self.members.encode_view()),
+            (journal.STATE, encode_journal_state(self.last_sent, self.matrix_clock.snapshot())),
+        ]
+        for msg in self.message_queue:
+            records.append((journal.RECEIVE, encode_journal_message(msg.sender, msg.content, msg.matrix_clock)))
+        return records
+
+    def replay(self, kind, payload):
+        """Applies one journal record during recovery."""
+        if kind == journal.STATE:
+            self.last_sent, self.matrix_clock = decode_journal_state(payload, self.total, self.sparse)
+        elif kind == journal.RECEIVE:
+            sender, content, clock = decode_journal_message(payload, self.total, self.sparse)
+            self.receive(self.message_class(sender, content, clock, epoch=self.members.epoch))
+        elif kind == journal.LOCAL:
+            self.local_event(wire.decode_varint(payload, 0)[0] if payload else None)
+        elif kind == journal.MEMBERSHIP:
+            membership.replay(self, payload)
@@ -0,0 +1,205 @@
+"""Dynamic group membership: process-ID interning, views and epochs.
+
+Process IDs are non-negative ints, as sparse as they like (they travel as
+the u32 sender of wire.py messages). Each process's Membership interns them
+to slots, the dense indices of its clocks:
+
+    join(pid)           appends a slot for a new member and starts an epoch
+    leave(pid, stamp)   marks a member as departed; its slot stays, since
+                        messages it sent may still be on their way
+    compact(pids)       drops the slots of departed members, renumbers the
+                        rest and starts an epoch
+
+A departed member is stable at a process once the process has delivered
+everything the member sent it: the process's clock entry for the member has
+reached `stamp`, the stamp of the member's last message to it (departure()
+on the departing process maps each peer to that stamp). Once the member is
+stable at every live process no message can depend on its entry any more,
+and compaction reclaims it. Clocks, and the clocks attached to messages,
+then only cover members that are still there.
+
+Every process applies the same joins and compactions in the same order, so
+an epoch names the same layout everywhere. Messages carry the epoch they
+were stamped in. A message from an older epoch is translated to the current
+layout (a member that joined since reads 0, a reclaimed one is dropped), and
+a message from a newer epoch waits until the process has applied the view
+change. The layouts of the last `keep_epochs` epochs are kept for this.
+
+    members = Membership(range(4))
+    members.join(17)             # process 17 gets slot 4, epoch 1
+    members.leave(2, stamp)
+    sources = members.compact([2])   # process 17 now has slot 3, epoch 2
+"""
+import wire
+
+# Journal payloads of MEMBERSHIP records (see journal.py)
+VIEW = 0
+JOIN = 1
+LEAVE = 2
+COMPACT = 3
+
+
+class Membership:
+    """Interned process IDs, departed members and the layouts of recent epochs."""
+
+    def __init__(self, members=(), keep_epochs=16):
+        self.members = list(members)  # process ID of every slot
+        self.slots = {pid: slot for slot, pid in enumerate(self.members)}
+        if len(self.slots) != len(self.members):
+            raise ValueError("process IDs must be unique")
+        # Departed process ID -> stamp of its last message to this process
+        self.departed = {}
+        self.epoch = 0
+        self.keep_epochs = keep_epochs
+        self.layouts = {0: tuple(self.members)}
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __contains__(self, pid):
+        return pid in self.slots
+
+    def slot(self, pid):
+        return self.slots[pid]
+
+    def live(self):
+        """Process IDs of the members that have not departed, in slot order."""
+        return [pid for pid in self.members if pid not in self.departed]
+
+    def join(self, pid):
+        """Interns a new member and returns its slot."""
+        if pid in self.slots:
+            raise ValueError(f"process {pid} is already a member")
+        slot = len(self.members)
+        # Copies may share these (see copy), so they are replaced, not changed
+        self.members = self.members + [pid]
+        self.slots = dict(self.slots)
+        self.slots[pid] = slot
+        self.start_epoch()
+        return slot
+
+    def leave(self, pid, stamp):
+        if pid not in self.slots:
+            raise ValueError(f"process {pid} is not a member")
+        self.departed[pid] = stamp
+
+    def compact(self, pids):
+        """Drops the slots of departed `pids`; returns the old slot of every new slot."""
+        reclaimed = set(pids)
+        for pid in reclaimed:
+            if pid not in self.departed:
+                raise ValueError(f"process {pid} has not departed")
+            del self.departed[pid]
+        sources = [slot for slot, pid in enumerate(self.members) if pid not in reclaimed]
+        self.members = [self.members[slot] for slot in sources]
+        self.slots = {pid: slot for slot, pid in enumerate(self.members)}
+        self.start_epoch()
+        return sources
+
+    def start_epoch(self):
+        self.epoch += 1
+        self.layouts[self.epoch] = tuple(self.members)
+        self.layouts.pop(self.epoch - self.keep_epochs, None)
+
+    def sources(self, epoch):
+        """For a clock stamped in `epoch`: the old slot of every current slot, None for newer members."""
+        layout = self.layouts.get(epoch)
+        if layout is None:
+            raise ValueError(f"clock stamped in epoch {epoch}, which is no longer known")
+        old_slots = {pid: slot for slot, pid in enumerate(layout)}
+        return [old_slots.get(pid) for pid in self.members]
+
+    def translate(self, values, epoch):
+        """A vector clock stamped in `epoch`, in the current layout."""
+        if epoch == self.epoch:
+            return values
+        return [0 if slot is None else values[slot] for slot in self.sources(epoch)]
+
+    def copy(self):
+        """An independent copy, e.g. the view handed to a joining member.
+
+        The member list, the slots and the layouts are shared rather than
+        copied, since every change replaces them; a group of n processes
+        built from copies of one view holds it once instead of n times.
+        """
+        copy = Membership(keep_epochs=self.keep_epochs)
+        copy.members = self.members
+        copy.slots = self.slots
+        copy.departed = dict(self.departed)
+        copy.epoch = self.epoch
+        copy.layouts = dict(self.layouts)
+        return copy
+
+    def encode_view(self, ports=None):
+        """A VIEW journal payload holding the whole membership, and `ports` ({pid: port}) if given."""
+        out = bytearray([VIEW])
+        wire.encode_varint(self.epoch, out)
+        wire.encode_array(self.members, out)
+        wire.encode_array(list(self.departed), out)
+        wire.encode_array(list(self.departed.values()), out)
+        epochs = sorted(epoch for epoch in self.layouts if epoch != self.epoch)
+        wire.encode_array(epochs, out)
+        for epoch in epochs:
+            wire.encode_array(list(self.layouts[epoch]), out)
+        if ports is not None:
+            wire.encode_array(list(ports), out)
+            wire.encode_array(list(ports.values()), out)
+        return bytes(out)
+
+
+def encode_change(op, pids, stamp=0):
+    """A JOIN, LEAVE or COMPACT journal payload.
+
+    `stamp` is the departure stamp of a LEAVE, or the port of a member that
+    joins with one (0 for none).
+    """
+    out = bytearray([op])
+    wire.encode_array(list(pids), out)
+    wire.encode_varint(stamp, out)
+    return bytes(out)
+
+
+def decode_view(view, offset, keep_epochs=16):
+    epoch, offset = wire.decode_varint(view, offset)
+    members, offset = wire.decode_array(view, offset)
+    departed, offset = wire.decode_array(view, offset)
+    stamps, offset = wire.decode_array(view, offset)
+    epochs, offset = wire.decode_array(view, offset)
+    result = Membership(members, keep_epochs)
+    result.departed = dict(zip(departed, stamps))
+    result.epoch = epoch
+    result.layouts = {epoch: tuple(members)}
+    for old in epochs:
+        layout, offset = wire.decode_array(view, offset)
+        result.layouts[old] = tuple(layout)
+    return result, offset
+
+
+def replay(process, payload):
+    """Applies a MEMBERSHIP journal record to a BSS, SES, matrix-clock or chat process."""
+    view = memoryview(payload)
+    op = view[0]
+    if op == VIEW:
+        members, offset = decode_view(view, 1)
+        process.adopt_view(members)
+        if offset < len(view):
+            pids, offset = wire.decode_array(view, offset)
+            ports, _ = wire.decode_array(view, offset)
+            process.adopt_ports(dict(zip(pids, ports)))
+        return
+    pids, offset = wire.decode_array(view, 1)
+    stamp, _ = wire.decode_varint(view, offset)
+    if op == JOIN:
+        if stamp:
+            process.join_member(pids[0], stamp)
+        else:
+            process.join_member(pids[0])
+    elif op == LEAVE:
+        process.leave_member(pids[0], stamp)
+    elif op == COMPACT:
+        process.compact_members(pids)
+    else:
+        raise ValueError(f"Unknown membership record {op}")
@@ -0,0 +1,139 @@
+"""Per-process counters and histograms.
+
+Every process object (BSS, SES, matrix clock and chat) owns a `Metrics`
+instance, `process.metrics`, and updates it as it runs:
+
+    messages_sent / messages_received / messages_delivered / messages_buffered
+    bytes_sent / bytes_received
+    buffer_depth     histogram of the buffer size each time a message is parked
+    time_in_buffer   histogram of how long buffered messages waited, in seconds
+                     of `metrics.clock` (the simulator swaps in virtual time)
+    credit_waits / credit_stalls   sends that waited for flow-control credits,
+                     and waits longer than the stall timeout (flow_control.py)
+
+`metrics.snapshot()` returns the current values as a plain dict (the pull
+API), and `MetricsDumper` appends a snapshot to a JSON-lines file every few
+seconds. Histograms use power-of-two buckets, so recording is O(1) and the
+percentiles they report are upper bounds of the bucket the value falls in.
+"""
+import json
+import math
+import threading
+import time
+
+
+class Histogram:
+    """Count, sum, min, max and power-of-two buckets of the observed values."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        # Bucket e holds values in [2**(e-1), 2**e); zero and below go to None.
+        self.buckets = {}
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        bucket = math.frexp(value)[1] if value > 0 else None
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile, or None when empty."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets, key=lambda b: -math.inf if b is None else b):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return 0 if bucket is None else min(2.0 ** bucket, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "buckets": {
+                ("0" if bucket is None else repr(2.0 ** bucket)): count
+                for bucket, count in sorted(self.buckets.items(), key=lambda item: -math.inf if item[0] is None else item[0])
+            },
+        }
+
+
+class Metrics:
+    """Named counters and histograms; safe to update from several threads."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def now(self):
+        return self.clock()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def counter(self, name):
+        return self.counters.get(name, 0)
+
+    def snapshot(self):
+        """Returns {"counters": {...}, "histograms": {name: {...}}}."""
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+            }
+
+
+class MetricsDumper:
+    """Appends `metrics.snapshot()` as one JSON line to `path` every `interval` seconds."""
+
+    def __init__(self, metrics, path, interval=5.0, label=None):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.label = label
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        record = {"time": time.time(), "label": self.label}
+        record.update(self.metrics.snapshot())
+        with open(self.path, "a") as output:
+            output.write(json.dumps(record) + "\n")
+
+    def stop(self):
+        """Stops the thread and writes a final snapshot."""
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.dump()
@@ -0,0 +1,92 @@
+import heapq
+import itertools
+
+
+class PendingBuffer:
+    """Holds undeliverable messages indexed by the condition they are waiting on.
+
+    A message is parked under a key such as (process, clock value) and is only
+    handed back when that exact key is released, so a delivery looks at the
+    messages it may have unblocked instead of rescanning the whole buffer.
+    """
+
+    def __init__(self):
+        self.waiting = {}
+        self.size = 0
+
+    def park(self, key, item):
+        self.waiting.setdefault(key, []).append(item)
+        self.size += 1
+
+    def peek(self, key):
+        """Returns the items parked under `key` without removing them."""
+        return self.waiting.get(key, ())
+
+    def remove(self, key, item):
+        items = self.waiting[key]
+        items.remove(item)
+        if not items:
+            del self.waiting[key]
+        self.size -= 1
+
+    def keys(self):
+        """The keys that have items parked under them, as a list."""
+        return list(self.waiting)
+
+    def release(self, key):
+        """Removes and returns every item parked under `key`."""
+        items = self.waiting.pop(key, [])
+        self.size -= len(items)
+        return items
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for items in self.waiting.values():
+            yield from items
+
+
+class ThresholdBuffer:
+    """Holds messages waiting for a clock entry to reach at least some value.
+
+    Messages are kept in one min-heap per clock index, ordered by the value
+    they need, so a clock advance pops exactly the messages it satisfies, and
+    only the heaps of the entries that advanced are looked at.
+    """
+
+    def __init__(self):
+        self.heaps = {}
+        self.counter = itertools.count()
+        self.size = 0
+
+    def park(self, index, threshold, item):
+        heapq.heappush(self.heaps.setdefault(index, []), (threshold, next(self.counter), item))
+        self.size += 1
+
+    def release(self, clock, indices=None):
+        """Removes and returns, oldest first, every item whose threshold `clock` meets.
+
+        `indices` are the clock entries that advanced since the last release;
+        None checks every entry.
+        """
+        released = []
+        for index in list(self.heaps) if indices is None else indices:
+            heap = self.heaps.get(index)
+            if heap is None:
+                continue
+            while heap and heap[0][0] <= clock[index]:
+                released.append(heapq.heappop(heap)[1:])
+            if not heap:
+                del self.heaps[index]
+        released.sort(key=lambda entry: entry[0])
+        self.size -= len(released)
+        return [item for _, item in released]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for heap in self.heaps.values():
+            for _, _, item in heap:
+                yield item
@@ -0,0 +1,414 @@
+"""Deterministic discrete-event simulation of the causal-ordering algorithms.
+
+Time is virtual: events sit in a priority queue ordered by (time, sequence)
+and the simulator jumps from one to the next, so channel delays cost nothing
+in wall-clock time and runs with the same seed are identical. Message
+delivery goes through the real code paths of each algorithm: BSS and SES
+messages are encoded with wire.py and handed to `handle_frame`, and matrix
+clock / chat messages are handed to `receive_message` /
+`receive_chat_message`. Only the sockets and sleeps are replaced.
+
+Link delays come from the models in delay_scheduler.py, called as
+model(source, target). Wrap one in ReorderingDelay to hold back a fraction
+of messages. Pass fifo=True to keep each link in order, which differential
+clocks need. Pass sparse=True (--sparse) to run matrix clocks and chat
+participants on the sparse clock backend.
+
+    python3 simulator.py --algorithm bss --processes 200 --messages 2000 --seed 7
+"""
+import argparse
+import heapq
+from abc import ABC, abstractmethod
+import itertools
+import logging
+import math
+import random
+import sys
+import time
+
+import wire
+from BSS import Process
+from clocks import SparseSnapshot
+from delay_scheduler import ReorderingDelay, UniformDelay
+from event_trace import TraceWriter
+from distributed_chat import ChatParticipant, ChatRoom
+from Matrix_clock import MessageMC, ProcessMC
+from membership import Membership
+from SES import SchiperEggliSandoz
+
+
+class Simulator:
+    """A virtual clock and a priority queue of pending events."""
+
+    def __init__(self, seed=0, delay_model=None, fifo=False):
+        self.now = 0.0
+        self.queue = []
+        self.counter = itertools.count()
+        self.rng = random.Random(seed)
+        self.delay_model = delay_model or UniformDelay(0.5, 1.5, seed=seed)
+        self.fifo = fifo
+        self.link_due = {}
+        self.events = 0
+
+    def clock(self):
+        """The current virtual time; processes' metrics read time from here."""
+        return self.now
+
+    def schedule(self, delay, callback, *args):
+        heapq.heappush(self.queue, (self.now + delay, next(self.counter), callback, args))
+
+    def transmit(self, source, target, callback, *args):
+        """Schedules `callback(*args)` after the delay of the source -> target link."""
+        due = self.now + self.delay_model(source, target)
+        if self.fifo:
+            due = max(due, self.link_due.get((source, target), due))
+            self.link_due[(source, target)] = due
+        heapq.heappush(self.queue, (due, next(self.counter), callback, args))
+
+    def run(self, until=None, max_events=None):
+        """Processes events in time order; returns the number processed."""
+        processed = 0
+        queue = self.queue
+        while queue:
+            if until is not None and queue[0][0] > until:
+                break
+            if max_events is not None and processed >= max_events:
+                break
+            due, _, callback, args = heapq.heappop(queue)
+            self.now = due
+            callback(*args)
+            processed += 1
+        self.events += processed
+        return processed
+
+
+class SimulatedGroup(ABC):
+    """Common bookkeeping for a group of simulated processes.
+
+    Besides counting messages, a group records the virtual send time of every
+    message, so each delivery yields a send-to-delivery latency, the largest
+    buffer seen at any receiver, and the encoded size of what was sent.
+    Processes start from copies of one shared membership view.
+    """
+
+    def __init__(self, simulator, total):
+        self.simulator = simulator
+        self.total = total
+        self.view = Membership(range(total))
+        self.sent = 0
+        self.delivered = 0
+        self.bytes_sent = 0
+        self.peak_buffer = 0
+        self.sent_at = {}
+        self.latencies = []
+
+    def use_virtual_time(self):
+        for process in self.processes:
+            process.metrics.clock = self.simulator.clock
+
+    def record_send(self, key):
+        self.sent_at[key] = self.simulator.now
+
+    def count_delivery(self, *delivery):
+        self.delivered += 1
+        self.latencies.append(self.simulator.now - self.sent_at[self.delivery_key(*delivery)])
+
+    def arrive(self, target, handler, payload):
+        handler(payload)
+        depth = self.buffer_depth(target)
+        if depth > self.peak_buffer:
+            self.peak_buffer = depth
+
+    def transmit(self, source, target, handler, payload, size):
+        self.simulator.transmit(source, target, self.arrive, target, handler, payload)
+        self.sent += 1
+        self.bytes_sent += size
+
+    @abstractmethod
+    def multicast(self, pid, destinations):
+        """Sends one message from `pid` to each of `destinations`."""
+
+    @abstractmethod
+    def delivery_key(self, *delivery):
+        """The key a delivery callback's arguments share with record_send."""
+
+    @abstractmethod
+    def buffer_depth(self, pid):
+        """Messages held undelivered at process `pid`."""
+
+    def pending(self):
+        return sum(self.buffer_depth(pid) for pid in range(self.total))
+
+
+class BSSGroup(SimulatedGroup):
+    """BSS processes exchanging broadcasts through the simulator."""
+
+    def __init__(self, simulator, total, differential=False):
+        super().__init__(simulator, total)
+        self.processes = [
+            Process(pid, total, None, None, differential=differential, on_deliver=self.count_delivery, members=self.view.copy())
+            for pid in range(total)
+        ]
+        self.use_virtual_time()
+
+    def broadcast(self, pid):
+        clock, outgoing = self.processes[pid].prepare_broadcast()
+        self.record_send((pid, clock[pid]))
+        for target, msg in outgoing:
+            self.transmit(pid, target, self.processes[target].handle_frame, msg, len(msg))
+
+    def multicast(self, pid, destinations):
+        # BSS only broadcasts, so every send reaches the whole group.
+        self.broadcast(pid)
+
+    def delivery_key(self, sender, clock):
+        return sender, clock[sender]
+
+    def buffer_depth(self, pid):
+        return len(self.processes[pid].buffer)
+
+
+class SESGroup(SimulatedGroup):
+    """SES processes exchanging point-to-point messages through the simulator."""
+
+    def __init__(self, simulator, total):
+        super().__init__(simulator, total)
+        self.processes = [
+            SchiperEggliSandoz(pid, total, None, None, on_deliver=self.count_delivery, members=self.view.copy())
+            for pid in range(total)
+        ]
+        self.use_virtual_time()
+
+    def send(self, pid, destination, text=""):
+        message_data, frame = self.processes[pid].prepare_message(destination, text)
+        self.record_send(self.delivery_key(message_data))
+        self.transmit(pid, destination, self.processes[destination].handle_frame, frame, len(frame))
+
+    def multicast(self, pid, destinations):
+        for destination in destinations:
+            self.send(pid, destination)
+
+    def delivery_key(self, message_data):
+        return message_data["sender"], message_data["clock"][message_data["sender"]]
+
+    def buffer_depth(self, pid):
+        return len(self.processes[pid].message_buffer)
+
+
+class MatrixGroup(SimulatedGroup):
+    """ProcessMC (or ChatParticipant) instances exchanging messages through the simulator.
+
+    A multicast is one send event: the same message goes to every destination.
+    """
+
+    def __init__(self, simulator, total, chat=False, differential=False, sparse=False):
+        super().__init__(simulator, total)
+        self.chat = chat
+        self.differential = differential
+        if chat:
+            self.processes = [ChatParticipant(pid, total, sparse=sparse, members=self.view.copy()) for pid in range(total)]
+        else:
+            self.processes = [
+                ProcessMC(pid, total, differential=differential, sparse=sparse, members=self.view.copy())
+                for pid in range(total)
+            ]
+        for process in self.processes:
+            process.on_deliver = self.count_delivery
+        self.use_virtual_time()
+
+    def send(self, pid, destination, text=""):
+        self.multicast(pid, [destination], text)
+
+    def multicast(self, pid, destinations, text=""):
+        sender = self.processes[pid]
+        for i, destination in enumerate(destinations):
+            recipient = self.processes[destination]
+            if self.chat:
+                if i == 0:
+                    msg = sender.create_chat_message(text, destination)
+                handler = recipient.receive_chat_message
+            else:
+                if i == 0:
+                    msg = sender.create_message(text, destination)
+                elif self.differential:
+                    # Same send event, but each destination gets its own delta.
+                    delta = sender.delta_encoder.encode(destination, sender.matrix_clock.matrix)
+                    msg = MessageMC(pid, text, None, delta=delta)
+                handler = recipient.receive_message
+            self.record_send(id(msg))
+            self.transmit(pid, destination, handler, msg, self.encoded_size(msg))
+
+    def encoded_size(self, msg):
+        """Size of the message's clock in the wire.py array encoding."""
+        out = bytearray(wire.HEADER.size)
+        if getattr(msg, "delta", None) is not None:
+            indices, values = msg.delta
+            wire.encode_array(indices.tolist(), out)
+            wire.encode_array(values.tolist(), out)
+        elif isinstance(msg.matrix_clock, SparseSnapshot):
+            indices, values = msg.matrix_clock.cells()
+            wire.encode_array(indices.tolist(), out)
+            wire.encode_array(values.tolist(), out)
+        else:
+            wire.encode_array(msg.matrix_clock.ravel().tolist(), out)
+        return len(out)
+
+    def delivery_key(self, message):
+        return id(message)
+
+    def buffer_depth(self, pid):
+        return len(self.processes[pid].message_queue)
+
+
+class RoomGroup(SimulatedGroup):
+    """ChatParticipants in one chat room; every send event is a multicast to the whole room."""
+
+    def __init__(self, simulator, total):
+        super().__init__(simulator, total)
+        # Room multicasts never touch the matrix clock, so keep it sparse (empty).
+        self.processes = [ChatParticipant(pid, total, sparse=True, members=self.view.copy()) for pid in range(total)]
+        self.room = ChatRoom("room", range(total))
+        for process in self.processes:
+            process.join_room(self.room)
+            process.on_deliver = self.count_delivery
+        self.use_virtual_time()
+
+    def multicast(self, pid, destinations, text=""):
+        # Like BSS, a room multicast always reaches every other member.
+        msg = self.processes[pid].create_room_message(text, self.room.name)
+        self.record_send(id(msg))
+        size = wire.HEADER.size + msg.room_clock.nbytes
+        for target in self.room.members:
+            if target != pid:
+                self.transmit(pid, target, self.processes[target].receive_room_message, msg, size)
+
+    def delivery_key(self, message):
+        return id(message)
+
+    def buffer_depth(self, pid):
+        return len(self.processes[pid].room_queues[self.room.name])
+
+
+def build_group(simulator, algorithm, total, differential=False, sparse=False):
+    if algorithm == "bss":
+        return BSSGroup(simulator, total, differential=differential)
+    if algorithm == "ses":
+        return SESGroup(simulator, total)
+    if algorithm == "matrix":
+        return MatrixGroup(simulator, total, differential=differential, sparse=sparse)
+    if algorithm == "chat":
+        return MatrixGroup(simulator, total, chat=True, sparse=sparse)
+    if algorithm == "room":
+        return RoomGroup(simulator, total)
+    raise ValueError(f"Unknown algorithm: {algorithm}")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of `values` (0 <= q <= 100), or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def generate_workload(processes, sends, fanout=1, rate=10.0, seed=0):
+    """Returns `sends` send events as (time, sender, destinations), with
+    exponential inter-arrival times and `fanout` distinct random destinations."""
+    rng = random.Random(seed)
+    fanout = min(fanout, processes - 1)
+    workload = []
+    at = 0.0
+    for _ in range(sends):
+        at += rng.expovariate(rate)
+        sender = rng.randrange(processes)
+        destinations = [(sender + 1 + d) % processes for d in rng.sample(range(processes - 1), fanout)]
+        workload.append((at, sender, destinations))
+    return workload
+
+
+def schedule_workload(simulator, group, workload):
+    for at, sender, destinations in workload:
+        simulator.schedule(at - simulator.now, group.multicast, sender, destinations)
+
+
+def simulate(algorithm, processes, sends, seed=0, rate=10.0, fanout=1, delay_model=None,
+             fifo=False, differential=False, workload=None, trace=None, sparse=False):
+    """Runs one seeded simulation and returns a summary dict; `trace` is an optional trace file path."""
+    simulator = Simulator(seed=seed, delay_model=delay_model, fifo=fifo or differential)
+    if workload is None:
+        workload = generate_workload(processes, sends, fanout, rate, seed)
+    group = build_group(simulator, algorithm, processes, differential=differential, sparse=sparse)
+    schedule_workload(simulator, group, workload)
+    tracer = None
+    if trace is not None:
+        tracer = TraceWriter(trace, clock=simulator.clock)
+        for process in group.processes:
+            process.tracer = tracer
+    start = time.perf_counter()
+    simulator.run()
+    elapsed = time.perf_counter() - start
+    if tracer is not None:
+        tracer.close()
+    return {
+        "algorithm": algorithm,
+        "processes": processes,
+        "seed": seed,
+        "sent": group.sent,
+        "delivered": group.delivered,
+        "pending": group.pending(),
+        "peak_buffer": group.peak_buffer,
+        "bytes_sent": group.bytes_sent,
+        "latencies": group.latencies,
+        "virtual_time": simulator.now,
+        "events": simulator.events,
+        "wall_time": elapsed,
+        "metrics": [process.metrics.snapshot() for process in group.processes],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a seeded discrete-event causal-ordering simulation.")
+    parser.add_argument("--algorithm", choices=["bss", "ses", "matrix", "chat", "room"], default="bss")
+    parser.add_argument("--processes", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=1000, help="number of send (or broadcast) events")
+    parser.add_argument("--fanout", type=int, default=1, help="destinations per send event (BSS always broadcasts)")
+    parser.add_argument("--rate", type=float, default=10.0, help="send events per unit of virtual time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-delay", type=float, default=0.5)
+    parser.add_argument("--max-delay", type=float, default=1.5)
+    parser.add_argument("--reorder", type=float, default=0.0, help="fraction of messages held back")
+    parser.add_argument("--reorder-extra", type=float, default=5.0, help="maximum extra delay of a held-back message")
+    parser.add_argument("--fifo", action="store_true")
+    parser.add_argument("--differential", action="store_true")
+    parser.add_argument("--sparse", action="store_true", help="use the sparse matrix clock (matrix and chat)")
+    parser.add_argument("--verbose", action="store_true", help="log every send, receive and delivery")
+    parser.add_argument("--trace", help="record every event to this binary trace file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s", stream=sys.stdout)
+
+    delay_model = UniformDelay(args.min_delay, args.max_delay, seed=args.seed)
+    if args.reorder:
+        delay_model = ReorderingDelay(delay_model, args.reorder, args.reorder_extra, seed=args.seed + 1)
+    result = simulate(
+        args.algorithm, args.processes, args.messages, seed=args.seed, rate=args.rate, fanout=args.fanout,
+        delay_model=delay_model, fifo=args.fifo, differential=args.differential,
+        trace=args.trace, sparse=args.sparse,
+    )
+    print(
+        f"{result['algorithm']}: {result['processes']} processes, {result['sent']} messages sent, "
+        f"{result['delivered']} delivered, {result['pending']} still pending"
+    )
+    print(
+        f"  {result['events']} events over {result['virtual_time']:.1f} units of virtual time "
+        f"in {result['wall_time']:.2f} s ({result['events'] / result['wall_time']:.0f} events/s)"
+    )
+    if result["latencies"]:
+        print(
+            f"  delivery latency p50 {percentile(result['latencies'], 50):.2f}, "
+            f"p99 {percentile(result['latencies'], 99):.2f}; peak buffer {result['peak_buffer']}"
+        )
+    return result
+
+
+if __name__ == "__main__":
+    main()
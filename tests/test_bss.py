@@ -0,0 +1,41 @@
+import wire
+from BSS import Process
+
+
+def make_process(pid, n):
+    return Process(pid, n, 0, [0] * n)
+
+
+def receive(process, sender, clock, epoch=0):
+    process.handle_frame(wire.encode_bss(sender, clock, epoch))
+
+
+def test_compaction_delivers_what_only_waited_on_the_departed_member():
+    process = make_process(0, 3)
+    process.leave_member(2, 1)
+    receive(process, 2, [0, 0, 1])
+    # Process 1 has seen a second broadcast of process 2 that never reaches process 0
+    receive(process, 1, [0, 1, 2])
+    receive(process, 1, [0, 1, 2])
+    assert len(process.buffer) == 2
+
+    process.compact_members([2])
+    assert process.pclock == [0, 1]
+    assert len(process.buffer) == 0
+    assert process.metrics.counter("messages_delivered") == 2
+    assert process.metrics.counter("messages_discarded") == 1
+
+
+def test_compaction_renumbers_parked_messages():
+    process = make_process(0, 4)
+    process.leave_member(1, 0)
+    receive(process, 3, [0, 0, 1, 1])
+    assert len(process.buffer) == 1
+
+    process.compact_members([1])
+    assert len(process.buffer) == 1
+    # Stamped before the compaction, so translated on arrival
+    receive(process, 2, [0, 0, 1, 0])
+    assert process.pclock == [0, 1, 1]
+    assert len(process.buffer) == 0
+    assert process.metrics.counter("messages_delivered") == 2
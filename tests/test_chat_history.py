@@ -0,0 +1,47 @@
+import os
+
+from chat_history import STAMP, ChatHistory
+
+
+def fill(history, messages):
+    for i in range(messages):
+        history.append(i % 5, i // 5 + 1, f"message {i}", room=f"room{i % 3}")
+
+
+def test_stamp_files_open_at_most_the_limit(tmp_path):
+    history = ChatHistory(str(tmp_path), max_open_stamps=4)
+    fill(history, 300)
+    assert len(history.stamp_files) == 4
+    assert history.position(1, 10, room="room0") >= 0
+    assert history.since({0: 1}, 5, room="room0")[0].seq == 1
+    history.close()
+
+
+def test_open_cuts_a_torn_tail(tmp_path):
+    history = ChatHistory(str(tmp_path), segment_bytes=1 << 20)
+    fill(history, 40)
+    history.close()
+    segment = os.path.join(str(tmp_path), "segment-000000000000")
+    # A crash mid-append: half a record in the log, an index entry for it and a torn stamp entry
+    with open(segment + ".log", "ab") as log:
+        log.write(b"\x28" + bytes(10))
+    with open(segment + ".idx", "ab") as index:
+        index.write(bytes(8))
+    with open(history.stamp_path(0, "room0"), "ab") as stamps:
+        stamps.write(STAMP.pack(99, 40)[:5])
+    # ... and the last complete record's stamp entry never reached the disk
+    last_stamps = history.stamp_path(4, "room0")
+    with open(last_stamps, "r+b") as stamps:
+        stamps.truncate(os.path.getsize(last_stamps) - STAMP.size)
+
+    history = ChatHistory(str(tmp_path), segment_bytes=1 << 20)
+    assert len(history) == 40
+    assert [entry.content for entry in history.last(2)] == ["message 38", "message 39"]
+    assert os.path.getsize(history.stamp_path(0, "room0")) % STAMP.size == 0
+    assert history.position(4, 8, room="room0") == 39
+    assert history.append(4, 8, "message 39", room="room0") == 39
+    assert history.append(0, 9, "message 40", room="room1") == 40
+    history.close()
+    history = ChatHistory(str(tmp_path))
+    assert [entry.seq for entry in history.last(41)] == list(range(41))
+    history.close()
@@ -0,0 +1,22 @@
+import threading
+
+from delay_scheduler import DelayScheduler
+
+
+def test_blocked_link_does_not_hold_back_other_links():
+    scheduler = DelayScheduler(fifo=True)
+    release = threading.Event()
+    delivered = threading.Event()
+    order = []
+    try:
+        # The first callback on "dead" blocks like a send waiting out a connect timeout
+        scheduler.schedule(0, release.wait, 10, link="dead")
+        scheduler.schedule(0, order.append, "dead", link="dead")
+        scheduler.schedule(0.01, order.append, "live", link="live")
+        scheduler.schedule(0.02, delivered.set, link="live")
+        assert delivered.wait(2)
+        assert order == ["live"]
+        assert scheduler.pending() == 1
+    finally:
+        release.set()
+        scheduler.stop()
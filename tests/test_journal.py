@@ -0,0 +1,76 @@
+import os
+
+import journal
+import wire
+from BSS import Process
+
+
+def make_process():
+    return Process(0, 3, 0, [0, 0, 0])
+
+
+def receive(process, sender, clock):
+    process.handle_frame(wire.encode_bss(sender, clock))
+
+
+def run(directory, checkpoint_every):
+    process = make_process()
+    log = journal.Journal(directory, checkpoint_every=checkpoint_every)
+    log.recover(process)
+    receive(process, 1, [0, 1, 0])
+    process.prepare_broadcast()
+    receive(process, 2, [0, 1, 2])  # parked until process 2's first broadcast
+    receive(process, 1, [0, 2, 0])
+    receive(process, 1, [0, 3, 0])
+    log.sync()
+    return process, log
+
+
+def recovered(directory):
+    process = make_process()
+    log = journal.Journal(directory)
+    log.recover(process)
+    log.close()
+    return process
+
+
+def test_recovery_replays_checkpoint_and_log(tmp_path):
+    process, log = run(str(tmp_path), checkpoint_every=3)
+    assert log.checkpoints > 1
+    assert len(os.listdir(str(tmp_path))) == 1
+    copy = recovered(str(tmp_path))
+    assert copy.pclock == process.pclock == [1, 3, 0]
+    assert len(copy.buffer) == 1
+    receive(copy, 2, [0, 0, 1])
+    assert copy.pclock == [1, 3, 2]
+    log.close()
+
+
+def test_recovery_stops_at_a_torn_or_corrupt_record(tmp_path):
+    directory = str(tmp_path)
+    _, log = run(directory, checkpoint_every=100)
+    log.close()
+    path = log.path(log.generation)
+    with open(path, "rb") as handle:
+        data = handle.read()
+    last = wire.encode_bss(1, [0, 3, 0])
+    assert data.endswith(last)
+
+    # The last record half written: its message is lost, everything before it is kept
+    with open(path, "wb") as handle:
+        handle.write(data[:-len(last) // 2])
+    assert recovered(directory).pclock == [1, 2, 0]
+
+    # A flipped payload byte fails the CRC the same way
+    for generation in journal.Journal(directory).generations():
+        os.remove(log.path(generation))
+    _, log = run(directory, checkpoint_every=100)
+    log.close()
+    path = log.path(log.generation)
+    with open(path, "rb") as handle:
+        data = bytearray(handle.read())
+    data[-1] ^= 0xFF
+    with open(path, "wb") as handle:
+        handle.write(data)
+    assert list(journal.read_records(path))[-1][1] == wire.encode_bss(1, [0, 2, 0])
+    assert recovered(directory).pclock == [1, 2, 0]
@@ -0,0 +1,63 @@
+import socket
+import threading
+import time
+
+import wire
+from BSS import Process
+from conftest import free_port
+from transport import ConnectionPool, FrameListener
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_listener_survives_a_frame_it_cannot_handle():
+    received = []
+
+    def on_frame(frame):
+        if frame == b"bad":
+            raise ValueError("unexpected frame")
+        received.append(frame)
+
+    port = free_port()
+    listener = FrameListener(port, on_frame)
+    thread = threading.Thread(target=listener.serve_forever, daemon=True)
+    thread.start()
+    pool = ConnectionPool()
+    try:
+        pool.send(port, b"bad")
+        pool.send(port, b"good")
+        assert wait_for(lambda: received == [b"good"])
+        assert thread.is_alive()
+    finally:
+        pool.close()
+        listener.stop()
+        thread.join(timeout=5)
+
+
+def test_bss_node_keeps_receiving_after_a_credit_frame():
+    port = free_port()
+    process = Process(0, 2, port, [port, free_port()])
+    process.start_server()
+    pool = ConnectionPool()
+    try:
+        assert wait_for(lambda: listening(port))
+        pool.send(port, wire.encode_credit(0, 1))
+        pool.send(port, wire.encode_bss(1, [0, 1]))
+        assert wait_for(lambda: process.pclock == [0, 1])
+    finally:
+        pool.close()
+
+
+def listening(port):
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=1).close()
+    except OSError:
+        return False
+    return True
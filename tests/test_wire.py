@@ -0,0 +1,50 @@
+import pytest
+
+import wire
+
+
+@pytest.mark.parametrize("clock, epoch", [
+    ([1, 2, 3], 0),
+    ([0] * 5, 7),
+    (list(range(1000)), 300),
+    ([2 ** 40, 1, 0], 1),
+])
+def test_bss_round_trip(clock, epoch):
+    frame = wire.encode_bss(5, clock, epoch)
+    assert wire.decode_bss(frame) == (5, clock, epoch)
+    assert wire.decode_frame(frame) == (wire.MSG_BSS, (5, clock, epoch))
+
+
+def test_bss_delta_round_trip():
+    frame = wire.encode_bss_delta(2, 1000, [3, 70, 999], [1, 300, 2 ** 33])
+    assert wire.decode_bss_delta(frame) == (2, 1000, [3, 70, 999], [1, 300, 2 ** 33])
+    assert wire.decode_bss_delta(wire.encode_bss_delta(0, 4, [], [])) == (0, 4, [], [])
+
+
+def test_credit_round_trip():
+    assert wire.decode_credit(wire.encode_credit(9, 1 << 20)) == (9, 1 << 20)
+    assert wire.decode_frame(wire.encode_credit(1, 8)) == (wire.MSG_CREDIT, (1, 8))
+
+
+@pytest.mark.parametrize("size, entries, epoch, text", [
+    (3, 0, 0, "hi"),
+    (3, 3, 1, ""),
+    (50, 450, 0, "héllo ✓"),
+    (1000, 1000, 500, "x" * 3000),
+])
+def test_ses_round_trip(size, entries, epoch, text):
+    s_buffer = (
+        [i % size for i in range(entries)],
+        [(i * 7) % size for i in range(entries)],
+        [i * 1000 for i in range(entries)],
+    )
+    message = {"sender": 4, "epoch": epoch, "clock": list(range(size)), "s_buffer": s_buffer, "message": text}
+    assert wire.decode_ses(wire.encode_ses(message)) == message
+
+
+def test_decoders_reject_other_types():
+    frame = wire.encode_credit(1, 1)
+    with pytest.raises(ValueError):
+        wire.decode_bss(frame)
+    with pytest.raises(ValueError):
+        wire.decode_frame(b"\xff" + frame[1:])
@@ -0,0 +1,151 @@
+import logging
+import selectors
+import socket
+import struct
+import threading
+
+# Every message on a connection is prefixed with its length so that many
+# messages can share one long-lived TCP stream.
+FRAME_HEADER = struct.Struct("!I")
+
+logger = logging.getLogger(__name__)
+
+
+def send_frame(sock, payload):
+    """Writes one length-prefixed frame to a connected socket."""
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+class ConnectionPool:
+    """Keeps one persistent connection per peer and reuses it for every message."""
+
+    def __init__(self, host="127.0.0.1", retries=1, timeout=5.0):
+        self.host = host
+        self.retries = retries
+        self.timeout = timeout
+        self.connections = {}
+        self.locks = {}
+        self.pool_lock = threading.Lock()
+
+    def _lock_for(self, port):
+        with self.pool_lock:
+            if port not in self.locks:
+                self.locks[port] = threading.Lock()
+            return self.locks[port]
+
+    def _connect(self, port):
+        sock = socket.create_connection((self.host, port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections[port] = sock
+        return sock
+
+    def _drop(self, port):
+        sock = self.connections.pop(port, None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def send(self, port, payload, fresh=None):
+        """Sends one frame to the peer on `port`, reconnecting if the stream broke.
+
+        Frames written to a stream that broke may never have arrived. If
+        `fresh` is given, the frame sent on a newly opened connection is
+        fresh() instead of `payload`, e.g. a full clock in place of a delta.
+        """
+        with self._lock_for(port):
+            attempt = 0
+            while True:
+                try:
+                    sock = self.connections.get(port)
+                    if sock is None:
+                        sock = self._connect(port)
+                        if fresh is not None:
+                            payload = fresh()
+                    send_frame(sock, payload)
+                    return
+                except OSError:
+                    self._drop(port)
+                    if attempt >= self.retries:
+                        raise
+                    attempt += 1
+
+    def close(self):
+        """Closes every pooled connection."""
+        with self.pool_lock:
+            ports = list(self.connections)
+        for port in ports:
+            with self._lock_for(port):
+                self._drop(port)
+
+
+class FrameListener:
+    """Accepts peer connections and reads many frames from each of them.
+
+    A single selector thread serves every connection, so `on_frame` is always
+    called from one thread, in the order frames arrive on each connection.
+    A frame that `on_frame` fails on is logged and dropped, so one malformed
+    or unexpected frame cannot stop the listener.
+    """
+
+    def __init__(self, port, on_frame, host="127.0.0.1", backlog=100):
+        self.on_frame = on_frame
+        self.selector = selectors.DefaultSelector()
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((host, port))
+        self.server_socket.listen(backlog)
+        self.server_socket.setblocking(False)
+        self.selector.register(self.server_socket, selectors.EVENT_READ, None)
+        self.running = False
+
+    def _accept(self):
+        client_socket, addr = self.server_socket.accept()
+        client_socket.setblocking(False)
+        self.selector.register(client_socket, selectors.EVENT_READ, bytearray())
+
+    def _read(self, client_socket, pending):
+        try:
+            data = client_socket.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.selector.unregister(client_socket)
+            client_socket.close()
+            return
+        pending += data
+        offset = 0
+        header_size = FRAME_HEADER.size
+        while len(pending) - offset >= header_size:
+            (length,) = FRAME_HEADER.unpack_from(pending, offset)
+            end = offset + header_size + length
+            if len(pending) < end:
+                break
+            self._deliver(bytes(pending[offset + header_size:end]))
+            offset = end
+        del pending[:offset]
+
+    def _deliver(self, frame):
+        try:
+            self.on_frame(frame)
+        except Exception:
+            logger.warning("Dropped a frame that could not be handled", exc_info=True)
+
+    def serve_forever(self):
+        """Runs the receive loop until `stop` is called."""
+        self.running = True
+        while self.running:
+            for key, _ in self.selector.select(timeout=0.5):
+                if key.data is None:
+                    self._accept()
+                else:
+                    self._read(key.fileobj, key.data)
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+        self.selector.close()
+
+    def stop(self):
+        self.running = False